@@ -949,6 +949,7 @@ class Database(Element):
 		gid : "global identifier to configure" = None,
 		isolation : "ISOLATION LEVEL to use with the transaction" = None,
 		mode : "Mode of the transaction, READ ONLY or READ WRITE" = None,
+		deferred : "Send the start with the first statement of the block" = None,
 	) -> Transaction:
 		"""
 		Create a `Transaction` object using the given keyword arguments as its
@@ -981,6 +982,133 @@ class Database(Element):
 		(1,)
 		"""
 
+	@abstractmethod
+	def prepare_many(self, sqls : [str]) -> [PreparedStatement]:
+		"""
+		Create a `PreparedStatement` instance for each of the given SQL
+		strings. All of the statements are prepared in a single round trip.
+
+		>>> ps1, ps2 = db.prepare_many(("SELECT 1", "SELECT 2"))
+		"""
+
+	@abstractmethod
+	def bulk_update(self,
+		table : "SQL name of the table to update",
+		columns : "names of the columns given by each row",
+		rows : "iterable of row tuples",
+		key : "name or names of the columns identifying a row",
+		chunksize : "number of rows in each COPY data message" = 1024,
+	) -> int:
+		"""
+		Update the rows of `table` whose `key` columns match those of the given
+		`rows`, setting the remaining `columns`. The rows are loaded into a
+		temporary table that is joined with `table` in a single UPDATE.
+		Returns the number of updated rows.
+
+		`table` is used as SQL, so it may be schema qualified and must be
+		quoted where needed, while the `columns` are quoted by the method.
+
+		>>> db.bulk_update('emp', ('emp_id', 'salary'), rows, key = 'emp_id')
+		"""
+
+	@abstractmethod
+	def bulk_upsert(self,
+		table : "SQL name of the table to update",
+		columns : "names of the columns given by each row",
+		rows : "iterable of row tuples",
+		key : "name or names of the columns identifying a row",
+		chunksize : "number of rows in each COPY data message" = 1024,
+	) -> (int, int):
+		"""
+		Like `bulk_update`, but the `rows` whose key is not in `table` are
+		inserted. Returns the pair (updated, inserted).
+
+		On PostgreSQL 9.5 and later, the rows are merged by a single
+		``INSERT ... ON CONFLICT``, which requires a unique index or constraint
+		on the `key` columns.
+
+		>>> db.bulk_upsert('emp', ('emp_id', 'salary'), rows, key = 'emp_id')
+		(1000, 24)
+		"""
+
+	@abstractmethod
+	def copy_from_file(self,
+		source : "path of the file, or a binary file object",
+		table : "SQL name of the table to copy into",
+		columns : "names of the columns given by each line" = None,
+		options : "SQL of the options of the COPY, e.g. 'CSV HEADER'" = None,
+		chunksize : "approximate number of bytes in each COPY data message" = 0x400000,
+	) -> int:
+		"""
+		Load the contents of the `source` file into `table` with a
+		``COPY ... FROM STDIN``. The file is memory mapped and sent in
+		line-aligned slices of about `chunksize` bytes. Returns the number of
+		rows copied.
+
+		`table` is used as SQL, so it may be schema qualified and must be
+		quoted where needed, while the `columns` are quoted by the method.
+
+		>>> db.copy_from_file('/tmp/emp.csv', 'emp', options = 'CSV HEADER')
+		"""
+
+	@abstractmethod
+	def bytea_into(self,
+		buffer : "writable buffer to read the value into",
+		sql : "statement producing a single bytea column",
+		*parameters,
+		chunksize : "number of bytes in each row of the value" = 0x100000
+	) -> int:
+		"""
+		Read the bytea value of the first row produced by `sql` into `buffer`
+		in chunks of `chunksize` bytes. Returns the size of the value, or
+		`None` if it is NULL or no row is produced. `sql` is run once.
+
+		>>> buf = bytearray(size)
+		>>> db.bytea_into(buf, "SELECT data FROM image WHERE id = $1", 10)
+		"""
+
+	@abstractmethod
+	def with_keyset(self,
+		values : "sequence of keys",
+		typname : "SQL name of the type of the keys" = 'int8',
+		parameter : "number of the statement parameter to bind the keys to" = 1,
+		threshold : "number of keys above which a temporary table is used" = None,
+	):
+		"""
+		Create a context manager exposing the `values` to statements as a
+		relation with a single column named ``key``. The ``relation`` attribute
+		is the SQL of the relation, and ``parameters`` is the tuple of
+		parameters it needs bound at the position given by `parameter`.
+
+		>>> with db.with_keyset(ids) as ks:
+		...  ps = db.prepare(
+		...   "SELECT * FROM t JOIN " + ks.relation + " AS ks ON (t.id = ks.key)"
+		...  )
+		...  rows = ps(*ks.parameters)
+		"""
+
+	@abstractmethod
+	def query(self, sql : str, *parameters, types = None) -> ["Row"]:
+		"""
+		Execute the SQL with the given parameters and return the rows, or the
+		(command, count) pair when the statement does not return rows.
+		Unlike `prepare`, this takes a single round trip; the parameter types
+		are inferred from the parameters when `types` is `None`.
+
+		>>> db.query("SELECT $1 + 1", 1)
+		[(2,)]
+		"""
+
+	@abstractmethod
+	def query_first(self, sql : str, *parameters, types = None):
+		"""
+		Execute the SQL with the given parameters and return the first result
+		as `PreparedStatement.first` would.
+
+		>>> db.query_first("SELECT $1 + 1", 1)
+		2
+		"""
+
 	@abstractmethod
 	def statement_from_id(self,
 		statement_id : "The statement's identification string.",
@@ -19,6 +19,7 @@ from ..driver import default as pg_driver
 from .. import exceptions as pg_exc
 from .. import sys as pg_sys
 from .. import lib as pg_lib
+from ..protocol import replay as pg_replay
 
 pq_trace = optparse.make_option(
 	'--pq-trace',
@@ -26,8 +27,15 @@ pq_trace = optparse.make_option(
 	help = 'trace PQ protocol transmissions',
 	default = None,
 )
+pq_capture = optparse.make_option(
+	'--pq-capture',
+	dest = 'pq_capture',
+	help = 'record PQ protocol transmissions for replay(postgresql.protocol.replay)',
+	default = None,
+)
 default_options = [
 	pq_trace,
+	pq_capture,
 	clientparameters.option_lib,
 	clientparameters.option_libpath,
 ] + pycmd.default_optparse_options
@@ -105,10 +113,17 @@ def command(argv = sys.argv):
 		trace_file = None
 		if co.pq_trace is not None:
 			trace_file = open(co.pq_trace, 'a')
+		capture_file = None
+		if co.pq_capture is not None:
+			capture_file = open(co.pq_capture, 'ab')
 		builtins_d.update(builtin_overload)
 		try:
 			if trace_file is not None:
 				connection.tracer = trace_file.write
+			if capture_file is not None:
+				pg_replay.record(
+					connection.pq, capture_file, connection.settings.cache
+				)
 			with connection:
 				rv = pythonexec(
 					context = pycmd.postmortem(os.environ.get('PYTHON_POSTMORTEM'))
@@ -121,6 +136,8 @@ def command(argv = sys.argv):
 					del builtins_d[x]
 			if trace_file is not None:
 				trace_file.close()
+			if capture_file is not None:
+				capture_file.close()
 	except:
 		pg_sys.libpath.remove(os.path.curdir)
 		raise
@@ -0,0 +1,261 @@
+##
+# copyright 2009, James William Pye
+# http://python.projects.postgresql.org
+##
+"""
+Coalesce single row writes submitted by many threads.
+
+A `Coalescer` owns a prepared statement, and therefore the connection the
+statement was prepared on. Rows submitted to the coalescer are queued and
+written in batches by a background thread using ``load_rows()``. Each
+submission returns a `concurrent.futures.Future` that is resolved when the
+row's batch is committed; before Python 3.2, it is a future of this module
+providing the same methods::
+
+	>>> from postgresql.coalesce import Coalescer
+	>>> c = Coalescer(db.prepare("INSERT INTO log VALUES ($1, $2)"))
+	>>> f = c.submit((1, 'message'))
+	>>> f.result()
+	>>> c.close()
+
+The statement may also be a ``COPY ... FROM STDIN``; the submitted rows are
+then lines of COPY data.
+"""
+import time
+from threading import Thread, Condition
+try:
+	from concurrent.futures import Future, wait
+except ImportError:
+	# Python 3.1 and earlier; a Future providing the methods used here.
+	class CancelledError(Exception):
+		pass
+
+	class Future(object):
+		"""
+		The subset of `concurrent.futures.Future` used by the coalescer.
+		"""
+		def __init__(self):
+			self._condition = Condition()
+			self._state = 'PENDING'
+			self._result = None
+			self._exception = None
+
+		def cancel(self):
+			with self._condition:
+				if self._state == 'PENDING':
+					self._state = 'CANCELLED'
+					self._condition.notify_all()
+				return self._state == 'CANCELLED'
+
+		def cancelled(self):
+			return self._state == 'CANCELLED'
+
+		def running(self):
+			return self._state == 'RUNNING'
+
+		def done(self):
+			return self._state in ('CANCELLED', 'FINISHED')
+
+		def set_running_or_notify_cancel(self):
+			with self._condition:
+				if self._state == 'CANCELLED':
+					return False
+				self._state = 'RUNNING'
+				return True
+
+		def _finish(self, result, exception):
+			with self._condition:
+				self._result = result
+				self._exception = exception
+				self._state = 'FINISHED'
+				self._condition.notify_all()
+
+		def set_result(self, result):
+			self._finish(result, None)
+
+		def set_exception(self, exception):
+			self._finish(None, exception)
+
+		def _wait(self, timeout):
+			with self._condition:
+				if timeout is None:
+					while not self.done():
+						self._condition.wait()
+				elif not self.done():
+					self._condition.wait(timeout)
+				if self._state == 'CANCELLED':
+					raise CancelledError()
+				if self._state != 'FINISHED':
+					raise RuntimeError("future was not resolved within the timeout")
+
+		def exception(self, timeout = None):
+			self._wait(timeout)
+			return self._exception
+
+		def result(self, timeout = None):
+			self._wait(timeout)
+			if self._exception is not None:
+				raise self._exception
+			return self._result
+
+	def wait(fs):
+		for f in fs:
+			with f._condition:
+				while not f.done():
+					f._condition.wait()
+
+__all__ = [
+	'Coalescer',
+]
+
+class Coalescer(object):
+	"""
+	Write the rows given to `submit` using `statement` in batches of up to
+	`batch_size` rows. A batch is written when it is full, or `delay` seconds
+	after the oldest row in it was submitted.
+
+	Each batch is loaded in a single transaction. If the batch fails, its rows
+	are written one at a time so that the failure is given to the futures of
+	the rows that caused it; the other rows are committed.
+	"""
+	batch_size = 256
+	delay = 0.005
+
+	def __init__(self, statement, batch_size = None, delay = None):
+		self.statement = statement
+		self.database = statement.database
+		if batch_size is not None:
+			if batch_size < 1:
+				raise ValueError("invalid batch_size, %r" %(batch_size,))
+			self.batch_size = batch_size
+		if delay is not None:
+			if delay < 0:
+				raise ValueError("invalid delay, %r" %(delay,))
+			self.delay = delay
+		# (submission time, row, future) of the rows waiting to be written
+		self._pending = []
+		# the futures of the batch being written
+		self._writing = ()
+		self._urgent = False
+		self.closed = False
+		self._condition = Condition()
+		self._thread = Thread(target = self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, typ, val, tb):
+		self.close()
+
+	def __len__(self):
+		'the number of rows waiting to be written'
+		return len(self._pending)
+
+	def submit(self, row):
+		"""
+		Queue the `row` to be written. Returns a `concurrent.futures.Future`
+		resolved with `None` once the row has been committed.
+		"""
+		f = Future()
+		with self._condition:
+			if self.closed:
+				raise RuntimeError("cannot submit rows to a closed coalescer")
+			self._pending.append((time.time(), row, f))
+			if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+				self._condition.notify()
+		return f
+
+	def flush(self):
+		"""
+		Write the pending rows without waiting for the delay, and wait for the
+		rows submitted before the call to be written.
+		"""
+		with self._condition:
+			futures = [x[2] for x in self._pending]
+			futures.extend(self._writing)
+			self._urgent = True
+			self._condition.notify()
+		wait(futures)
+
+	def close(self):
+		'Write the pending rows and stop the background thread.'
+		with self._condition:
+			self.closed = True
+			self._condition.notify()
+		self._thread.join()
+
+	def _next_batch(self):
+		'wait for the next batch; `None` when closed'
+		c = self._condition
+		with c:
+			while True:
+				if not self._pending:
+					self._urgent = False
+					if self.closed:
+						return None
+					c.wait()
+					continue
+				if len(self._pending) >= self.batch_size \
+				or self._urgent or self.closed:
+					break
+				remaining = self._pending[0][0] + self.delay - time.time()
+				if remaining <= 0:
+					break
+				c.wait(remaining)
+			batch = self._pending[:self.batch_size]
+			del self._pending[:self.batch_size]
+			self._writing = [x[2] for x in batch]
+		# Cancelled futures are dropped from the batch.
+		return [
+			(row, f) for t, row, f in batch
+			if f.set_running_or_notify_cancel()
+		]
+
+	def _run(self):
+		while True:
+			batch = self._next_batch()
+			if batch is None:
+				break
+			if batch:
+				self._write(batch)
+			self._writing = ()
+
+	def _write(self, batch):
+		try:
+			with self.database.xact(deferred = True):
+				self.statement.load_rows([x[0] for x in batch])
+		except Exception as err:
+			if self.database.closed:
+				self._fail(batch, err)
+				return
+			# Isolate the failing rows.
+			for row, f in batch:
+				try:
+					self.statement.load_rows((row,))
+				except Exception as err:
+					f.set_exception(err)
+					if self.database.closed:
+						self._fail(batch, err)
+						return
+				else:
+					f.set_result(None)
+		except BaseException as err:
+			self._fail(batch, err)
+			raise
+		else:
+			for row, f in batch:
+				f.set_result(None)
+
+	def _fail(self, batch, err):
+		'fail the unresolved futures of the batch and the pending rows'
+		with self._condition:
+			self.closed = True
+			pending = self._pending
+			self._pending = []
+		for f in [x[1] for x in batch] + [x[2] for x in pending]:
+			if not f.done():
+				if not f.running():
+					f.set_running_or_notify_cancel()
+				f.set_exception(err)
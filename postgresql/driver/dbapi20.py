@@ -11,6 +11,8 @@ apilevel = '2.0'
 
 from operator import itemgetter
 from functools import partial
+from itertools import chain
+from collections import deque
 import datetime
 import time
 import re
@@ -19,7 +21,8 @@ from .. import clientparameters as pg_param
 from .. import driver as pg_driver
 from .. import types as pg_type
 from .. import string as pg_str
-from .pq3 import Connection
+from ..python.itertools import chunk
+from .pq3 import Connection, Cursor as pq3_Cursor
 
 ##
 # Basically, is it a mapping, or is it a sequence?
@@ -40,6 +43,82 @@ def convert_keywords(keys, mapping):
 		mapping[k] for k in keys
 	]
 
+def convert_query(string):
+	"""
+	Convert the pyformat or format parameters in the DB-API query `string`
+	to PostgreSQL's numbered parameters. Returns the converted SQL, the
+	function transforming the given parameters, and the parameter count.
+	"""
+	parts = list(pg_str.split(string))
+	style = None
+	count = 0
+	keys = []
+	kmap = {}
+	transformer = tuple
+	rparts = []
+	for part in parts:
+		if type(part) is type(()):
+			# skip quoted portions
+			rparts.append(part)
+		else:
+			r = percent_parameters(part)
+			pcount = 0
+			for x in r:
+				if x == 's':
+					pcount += 1
+				else:
+					x = x[1:-2]
+					if x not in keys:
+						kmap[x] = '$' + str(len(keys) + 1)
+						keys.append(x)
+			if r:
+				if pcount:
+					# format
+					params = tuple([
+						'$' + str(i+1) for i in range(count, count + pcount)
+					])
+					count += pcount
+					rparts.append(part % params)
+				else:
+					# pyformat
+					rparts.append(part % kmap)
+			else:
+				# no parameters identified in string
+				rparts.append(part)
+
+	if keys:
+		if count:
+			raise TypeError(
+				"keyword parameters and positional parameters used in query"
+			)
+		transformer = partial(convert_keywords, keys)
+		count = len(keys)
+
+	return (pg_str.unsplit(rparts) if rparts else string, transformer, count)
+
+##
+# INSERT statements whose VALUES are the parameters in order can
+# be rewritten by executemany.
+simple_insert_re = re.compile(
+	r'^\s*INSERT\s+INTO\s+((?:"[^"]+"|\w+)(?:\.(?:"[^"]+"|\w+))?)\s*' \
+	r'(\([^()]*\))?\s*VALUES\s*\(([$\d\s,]+)\)\s*;?\s*$',
+	re.IGNORECASE
+)
+def simple_insert(sql):
+	"""
+	Given the converted `sql` of an INSERT statement, return the
+	(table, columns, count) triple if the statement inserts a single row of
+	the statement's parameters. Otherwise, `None`.
+	"""
+	m = simple_insert_re.match(sql)
+	if m is None:
+		return None
+	table, columns, params = m.groups()
+	params = [x.strip() for x in params.split(',')]
+	if params != ['$' + str(i) for i in range(1, len(params) + 1)]:
+		return None
+	return (table, columns or '', len(params))
+
 from postgresql.exceptions import \
 	Error, DataError, InternalError, \
 	ICVError as IntegrityError, \
@@ -89,53 +168,110 @@ class Portal(object):
 	"""
 	def __init__(self, chunks):
 		self.chunks = chunks
-		self.buf = []
-		self.pos = 0
+		self.buf = deque()
 
 	def __next__(self):
-		try:
-			r = self.buf[self.pos]
-			self.pos += 1
-			return r
-		except IndexError:
-			# Any alledged infinite recursion will stop on the StopIteration
-			# thrown by this next(). Recursion is unlikely to occur more than
-			# once; specifically, empty chunks would need to be returned
-			# by this invocation of next().
-			self.buf = next(self.chunks)
-			self.pos = 0
-			return self.__next__()
+		buf = self.buf
+		# Empty chunks are skipped; next() raises StopIteration at the end.
+		while not buf:
+			buf.extend(next(self.chunks))
+		return buf.popleft()
 
 	def readall(self):
-		self.buf = self.buf[self.pos:]
-		self.pos = 0
+		r = list(self.buf)
+		self.buf.clear()
 		for x in self.chunks:
-			self.buf.extend(x)
-		r = self.buf
-		self.buf = []
+			r.extend(x)
 		return r
 
-	def read(self, amount):
+	def _more(self, amount):
 		try:
-			while (len(self.buf) - self.pos) < amount:
+			while len(self.buf) < amount:
 				self.buf.extend(next(self.chunks))
-			end = self.pos + amount
 		except StopIteration:
 			# end of cursor
-			end = len(self.buf)
+			pass
 
-		r = self.buf[self.pos:end]
-		del self.buf[:end]
-		self.pos = 0
+	def read(self, amount):
+		buf = self.buf
+		if len(buf) < amount:
+			self._more(amount)
+		popleft = buf.popleft
+		return [popleft() for x in range(min(amount, len(buf)))]
+
+	def close(self):
+		pass
+
+class CursorPortal(Portal):
+	"""
+	Manages read() interfaces to a server side cursor.
+
+	Each read that cannot be satisfied by the buffer is a single FETCH of
+	the remaining rows. Iteration fetches `itersize` rows at a time.
+	"""
+	def __init__(self, cursor, itersize):
+		self.cursor = cursor
+		self.itersize = itersize
+		self.buf = deque()
+
+	def __next__(self):
+		buf = self.buf
+		if not buf:
+			buf.extend(self.cursor.read(self.itersize))
+			if not buf:
+				raise StopIteration
+		return buf.popleft()
+
+	def readall(self):
+		r = list(self.buf)
+		self.buf.clear()
+		r.extend(self.cursor.read())
 		return r
 
+	def _more(self, amount):
+		self.buf.extend(self.cursor.read(amount - len(self.buf)))
+
+	def scroll(self, value, mode):
+		if mode == 'relative':
+			# The server is ahead of the reader by the buffered rows.
+			self.cursor.seek(value - len(self.buf), 'RELATIVE')
+		else:
+			self.cursor.seek(value, 'ABSOLUTE')
+		self.buf.clear()
+
+	def close(self):
+		self.buf.clear()
+		self.cursor.close()
+
+class ServerCursor(pq3_Cursor):
+	"""
+	The server side cursor of a named DB-API cursor.
+
+	It is declared NO SCROLL and WITHOUT HOLD unless `scrollable` or
+	`withhold` is given. A `scrollable` of `None` leaves the choice to the
+	server.
+	"""
+	_declare_insensitive = False
+
+	def __init__(self, statement, parameters, database, cursor_id,
+		scrollable = False, withhold = False
+	):
+		self._declare_scroll = scrollable
+		self._declare_hold = bool(withhold)
+		super().__init__(statement, parameters, database, cursor_id)
+
 class Cursor(object):
 	rowcount = -1
 	arraysize = 1
+	# The number of rows fetched at a time when iterating over a named cursor.
+	itersize = 2000
 	description = None
 
-	def __init__(self, C):
+	def __init__(self, C, name = None, scrollable = False, withhold = False):
 		self.database = self.connection = C
+		self.name = name
+		self.scrollable = scrollable
+		self.withhold = withhold
 		self.description = ()
 		self.__portals = []
 
@@ -158,9 +294,10 @@ class Cursor(object):
 					source = 'CLIENT', creator = self.database
 				)
 			try:
-				del self.__portals[0]
+				p = self.__portals.pop(0)
 			except IndexError:
 				raise InterfaceError("no portal on stack")
+			p.close()
 		return locals()
 	_portal = property(**_portal())
 
@@ -211,67 +348,28 @@ class Cursor(object):
 		return len(self.__portals) or None
 
 	def _convert_query(self, string):
-		parts = list(pg_str.split(string))
-		style = None
-		count = 0
-		keys = []
-		kmap = {}
-		transformer = tuple
-		rparts = []
-		for part in parts:
-			if type(part) is type(()):
-				# skip quoted portions
-				rparts.append(part)
-			else:
-				r = percent_parameters(part)
-				pcount = 0
-				for x in r:
-					if x == 's':
-						pcount += 1
-					else:
-						x = x[1:-2]
-						if x not in keys:
-							kmap[x] = '$' + str(len(keys) + 1)
-							keys.append(x)
-				if r:
-					if pcount:
-						# format
-						params = tuple([
-							'$' + str(i+1) for i in range(count, count + pcount)
-						])
-						count += pcount
-						rparts.append(part % params)
-					else:
-						# pyformat
-						rparts.append(part % kmap)
-				else:
-					# no parameters identified in string
-					rparts.append(part)
-
-		if keys:
-			if count:
-				raise TypeError(
-					"keyword parameters and positional parameters used in query"
-				)
-			transformer = partial(convert_keywords, keys)
-			count = len(keys)
-
-		return (pg_str.unsplit(rparts) if rparts else string, transformer, count)
+		return convert_query(string)
 
 	def execute(self, statement, parameters = ()):
 		if self.__portals is None:
 			raise Error("cursor is closed",
 				source = 'CLIENT', creator = self.database)
 
-		sql, pxf, nparams = self._convert_query(statement)
+		ps, pxf, nparams = self.database._prepare_query(statement)
 		if nparams != -1 and len(parameters) != nparams:
 			raise TypeError(
 				"statement require %d parameters, given %d" %(
 					nparams, len(parameters)
 				)
 			)
-		ps = self.database.prepare(sql)
-		c = ps.chunks(*pxf(parameters))
+		if self.name is not None:
+			return self._declare(ps, pxf(parameters))
+		try:
+			c = ps.chunks(*pxf(parameters))
+		except:
+			# The statement may have been invalidated; prepare it again.
+			self.database._forget_query(statement)
+			raise
 		if ps._output is not None and len(ps._output) > 0:
 			# name, relationId, columnNumber, typeId, typlen, typmod, format
 			self.rowcount = -1
@@ -291,25 +389,153 @@ class Cursor(object):
 				del self._portal
 		return self
 
+	def _declare(self, ps, parameters):
+		"""
+		Declare the named cursor for the statement, `ps`.
+		"""
+		if ps._output is None:
+			raise ProgrammingError(
+				"named cursors require a statement that returns rows",
+				source = 'CLIENT', creator = self.database
+			)
+		# A prior declaration of the name must be closed first.
+		while self.__portals:
+			del self._portal
+		c = ServerCursor(ps, parameters, self.database, self.name,
+			scrollable = self.scrollable, withhold = self.withhold
+		)
+		self.rowcount = -1
+		self.description = tuple([
+			(self.database.typio.decode(x[0]), dbapi_type(x[3]),
+			None, None, None, None, None)
+			for x in ps._output
+		])
+		self.__portals.insert(0, CursorPortal(c, self.itersize))
+		return self
+
+	def scroll(self, value, mode = 'relative'):
+		"""
+		Move the position of a named cursor by `value` rows, or to the row
+		`value` when `mode` is 'absolute'. Moving backwards requires a
+		cursor created with `scrollable` set.
+		"""
+		if mode not in ('relative', 'absolute'):
+			raise ValueError(
+				"invalid scroll mode, %r; " \
+				"expecting 'relative' or 'absolute'" %(mode,)
+			)
+		p = self._portal
+		if not isinstance(p, CursorPortal):
+			raise NotSupportedError("only named cursors can be scrolled",
+				source = 'CLIENT', creator = self.database
+			)
+		p.scroll(value, mode)
+
 	def executemany(self, statement, parameters):
 		if self.__portals is None:
 			raise Error("cursor is closed",
 				source = 'CLIENT', creator = self.database)
 
-		sql, pxf, nparams = self._convert_query(statement)
-		ps = self.database.prepare(sql)
-		if ps._input is not None:
-			ps.load_rows(map(pxf, parameters))
-		else:
-			ps.load_rows(parameters)
-		self.rowcount = -1
+		rewrite = self.database.executemany_rewrite
+		if rewrite not in (None, 'values', 'copy'):
+			raise ValueError(
+				"invalid executemany_rewrite, %r; " \
+				"expecting None, 'values', or 'copy'" %(rewrite,)
+			)
+
+		ps, pxf, nparams = self.database._prepare_query(statement)
+		try:
+			if ps._input:
+				rows = map(pxf, parameters)
+				insert = None
+				if rewrite is not None:
+					insert = simple_insert(ps.string)
+				if insert is None:
+					count = ps.load_rows(rows)
+				elif rewrite == 'copy' and insert[1] and ps._binary_copyable():
+					count = self._copy_rows(ps, insert, rows)
+				else:
+					count = self._insert_values(ps, insert, rows)
+			else:
+				count = ps.load_rows(parameters)
+		except:
+			self.database._forget_query(statement)
+			raise
+		self.rowcount = -1 if count is None else count
 		return self
 
+	def _copy_rows(self, ps, insert, rows):
+		"""
+		Load the `rows` of the INSERT statement, `ps`, using a binary COPY.
+		"""
+		table, columns, n = insert
+		copy = self.database._prepare_query(
+			'COPY ' + table + ' ' + columns + ' FROM STDIN WITH BINARY'
+		)[0]
+		return copy.load_chunks(
+			ps._binary_copy_data(rows, self.database.executemany_batch_size)
+		)
+
+	def _insert_values(self, ps, insert, rows):
+		"""
+		Load the `rows` of the INSERT statement, `ps`, using INSERTs of
+		multiple VALUES rows.
+		"""
+		table, columns, n = insert
+		# Bind messages can carry no more than 32767 parameters.
+		size = max(1, min(self.database.executemany_batch_size, 32767 // n))
+		def batch_statement(rows):
+			sql = 'INSERT INTO ' + table + ' ' + columns + ' VALUES ' + ','.join([
+				'(' + ','.join([
+					'$' + str(i) for i in range(r * n + 1, r * n + n + 1)
+				]) + ')'
+				for r in range(rows)
+			])
+			bps = self.database._prepare_query(sql)[0]
+			if bps._input != ps._input * rows:
+				# The types of the VALUES were resolved differently.
+				return None
+			return bps
+		def flatten(batch):
+			for r in batch:
+				if len(r) != n:
+					raise TypeError(
+						"statement require %d parameters, given %d" %(n, len(r))
+					)
+			return tuple(chain.from_iterable(batch))
+
+		batches = iter(chunk(rows, size))
+		first = next(batches, [])
+		rest = []
+		count = 0
+		if len(first) == size:
+			bps = batch_statement(size)
+			if bps is None:
+				return ps.load_rows(chain(first, chain.from_iterable(batches)))
+			def full_batches():
+				for b in chain((first,), batches):
+					if len(b) == size:
+						yield flatten(b)
+					else:
+						rest.extend(b)
+			count += bps.load_rows(full_batches())
+		else:
+			rest = first
+		if rest:
+			bps = batch_statement(len(rest))
+			if bps is None:
+				count += ps.load_rows(rest)
+			else:
+				count += bps.load_rows((flatten(rest),))
+		return count
+
 	def close(self):
 		if self.__portals is None:
 			raise Error("cursor is closed",
 				source = 'CLIENT', creator = self.database)
 		self.description = None
+		for p in self.__portals:
+			p.close()
 		self.__portals = None
 
 class Connection(Connection):
@@ -326,6 +552,74 @@ class Connection(Connection):
 	DatabaseError = DatabaseError
 	NotSupportedError = NotSupportedError
 
+	# The number of recently executed queries whose conversions and
+	# prepared statements are kept by the connection.
+	query_cache_size = 256
+	_query_cache = None
+	# The cached queries in the order of their uses, and the number of uses
+	# of each in the deque; a query is least recently used when the last of
+	# its uses is taken from the left.
+	_query_order = None
+	_query_uses = None
+
+	# executemany() may rewrite INSERTs of a single VALUES row of parameters
+	# to INSERTs of many rows, 'values', or to a binary COPY, 'copy'.
+	executemany_rewrite = None
+	# The number of rows in each rewritten INSERT or COPY data message.
+	executemany_batch_size = 256
+
+	def _prepare_query(self, string):
+		"""
+		Get the (statement, transformer, count) triple for the DB-API query
+		`string`. Recently used queries skip the conversion and the Parse.
+		"""
+		qc = self._query_cache
+		try:
+			q = qc.pop(string)
+		except KeyError:
+			sql, pxf, nparams = convert_query(string)
+			q = (self.prepare(sql), pxf, nparams)
+			while qc and len(qc) >= self.query_cache_size:
+				self._evict_query()
+		if self.query_cache_size > 0:
+			qc[string] = q
+			uses = self._query_uses
+			self._query_order.append(string)
+			uses[string] = uses.get(string, 0) + 1
+			if len(self._query_order) > 4 * self.query_cache_size:
+				self._compact_queries()
+		return q
+
+	def _evict_query(self):
+		'Forget the least recently used query.'
+		order = self._query_order
+		uses = self._query_uses
+		while order:
+			string = order.popleft()
+			n = uses[string] - 1
+			if n:
+				uses[string] = n
+			else:
+				del uses[string]
+				if self._query_cache.pop(string, None) is not None:
+					break
+
+	def _compact_queries(self):
+		'Keep only the last use of each cached query.'
+		qc = self._query_cache
+		seen = set()
+		order = []
+		for string in reversed(self._query_order):
+			if string in qc and string not in seen:
+				seen.add(string)
+				order.append(string)
+		order.reverse()
+		self._query_order = deque(order)
+		self._query_uses = dict.fromkeys(order, 1)
+
+	def _forget_query(self, string):
+		self._query_cache.pop(string, None)
+
 	def autocommit_set(self, val):
 		if val:
 			# already in autocommit mode.
@@ -354,6 +648,9 @@ class Connection(Connection):
 
 	def connect(self, *args, **kw):
 		super().connect(*args, **kw)
+		self._query_cache = {}
+		self._query_order = deque()
+		self._query_uses = {}
 		self._xact = self.xact()
 		self._xact.start()
 
@@ -365,9 +662,24 @@ class Connection(Connection):
 				creator = self
 			)
 		super().close()
-
-	def cursor(self):
-		return Cursor(self)
+		self._query_cache = None
+		self._query_order = None
+		self._query_uses = None
+
+	def cursor(self, name = None, scrollable = False, withhold = False):
+		"""
+		Create a DB-API cursor. If a `name` is given, the cursor's statements
+		are declared as server side cursors of that name, and fetches read
+		from the server as needed.
+
+		Named cursors are declared NO SCROLL and WITHOUT HOLD, so they are
+		closed by the end of the transaction. Set `scrollable` to allow
+		backward scrolling, and `withhold` to use the cursor after commit()
+		or in autocommit mode.
+		"""
+		return Cursor(self,
+			name = name, scrollable = scrollable, withhold = withhold
+		)
 
 	def commit(self):
 		if self._xact is None:
@@ -6,6 +6,9 @@
 PG-API interface for PostgreSQL using PQ version 3.0.
 """
 import os
+import re
+import mmap
+import array
 import weakref
 import socket
 from traceback import format_exception
@@ -31,10 +34,98 @@ from ..protocol import xact3 as xact
 from ..protocol import element3 as element
 from ..protocol import client3 as client
 from ..protocol import typio as pg_typio
+from ..protocol.element3 import pack_tuple_data
+from ..protocol.typstruct import ushort_pack
 
 from .. import types as pg_types
 
 is_showoption = lambda x: getattr(x, 'type', None) is element.ShowOption.type
+# Execute the unnamed portal to completion.
+execute_all = element.Execute(b'', 0xFFFFFFFF)
+
+# PGCOPY signature, flags, and header extension length.
+copy_header = b'PGCOPY\n\xff\r\n\x00' + b'\x00\x00\x00\x00' + b'\x00\x00\x00\x00'
+copy_trailer = b'\xff\xff'
+
+def complete_count(x):
+	'the sum of the counts of the Complete messages received by `x`'
+	return sum([
+		m.extract_count() or 0 for m in x.messages_received()
+		if getattr(m, 'type', None) is element.Complete.type
+	])
+
+def file_chunks(f, chunksize):
+	"""
+	Produce the data of the binary file object `f`, from its current position,
+	in chunks of a single slice of about `chunksize` bytes ending at a line
+	boundary. Files that can be memory mapped are given as memoryviews of the
+	map, and other files are read in blocks.
+	"""
+	try:
+		m = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+	except (AttributeError, EnvironmentError, ValueError):
+		# Pipes, in-memory files, and empty files can't be mapped.
+		m = None
+	if m is None:
+		read = f.read
+		data = read(chunksize)
+		while data:
+			yield (data,)
+			data = read(chunksize)
+		return
+	# The views are released once sent, so the map can be closed.
+	release = getattr(memoryview, 'release', None)
+	view = memoryview(m)
+	try:
+		pos = f.tell()
+		size = len(m)
+		while pos < size:
+			end = pos + chunksize
+			if end < size:
+				# Lines longer than chunksize are split; COPY doesn't mind.
+				nl = m.rfind(b'\n', pos, end)
+				if nl != -1:
+					end = nl + 1
+			else:
+				end = size
+			data = view[pos:end]
+			try:
+				yield (data,)
+			finally:
+				if release is not None:
+					release(data)
+			pos = end
+		f.seek(pos)
+	finally:
+		if release is not None:
+			release(view)
+		m.close()
+
+# Statements that may change settings, and those that end transactions;
+# ending a transaction may revert the changes made within it.
+statement_start = r'(?:^|;)(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/)*'
+setting_statement = re.compile(
+	statement_start + r'(?:SET|RESET|DISCARD)\b|\bset_config\s*\(',
+	re.I | re.S
+).search
+xact_end_statement = re.compile(
+	statement_start + r'(?:COMMIT|ROLLBACK|ABORT|END|PREPARE\s+TRANSACTION)\b',
+	re.I | re.S
+).search
+ChangesSettings = 1
+EndsTransaction = 2
+
+def settings_effect(sql):
+	"""
+	The possible effect of running `sql` on the values of settings;
+	a combination of `ChangesSettings` and `EndsTransaction`.
+	"""
+	r = 0
+	if setting_statement(sql) is not None:
+		r |= ChangesSettings
+	if xact_end_statement(sql) is not None:
+		r |= EndsTransaction
+	return r
 
 IDNS = 'py:%s'
 def ID(s, title = None):
@@ -53,6 +144,8 @@ def declare_statement_string(
 		s += ' INSENSITIVE'
 	if scroll is True:
 		s += ' SCROLL'
+	elif scroll is False:
+		s += ' NO SCROLL'
 	s += ' CURSOR'
 	if hold is True:
 		s += ' WITH HOLD'
@@ -93,13 +186,21 @@ class Output(object):
 	_output_io = None
 	_output_formats = None
 	_output_attmap = None
+	_row_constructor = None
+	_process_output = None
 
 	closed = False
 	cursor_id = None
 	statement = None
 	parameters = None
 
+	# Options of the DECLARE issued by _pq_xp_declare.
+	_declare_insensitive = True
+	_declare_scroll = True
+	_declare_hold = True
+
 	_complete_message = None
+	_settings_effect = 0
 
 	@abstractmethod
 	def _init(self):
@@ -110,10 +211,12 @@ class Output(object):
 	def __init__(self, cursor_id):
 		self.cursor_id = cursor_id
 		if self.statement is not None:
+			self._settings_effect = self.statement._settings_effect
 			self._output = self.statement._output
 			self._output_io = self.statement._output_io
 			self._output_formats = self.statement._output_formats or ()
 			self._output_attmap = self.statement._output_attmap
+			self._row_constructor = self.statement._row_constructor
 
 		if self.cursor_id == ID(self):
 			addgarbage = self.database.pq.garbage_cursors.append
@@ -156,14 +259,10 @@ class Output(object):
 
 	def _pq_xp_fetchall(self):
 		return (
-			element.Bind(
-				b'',
-				self.statement._pq_statement_id,
-				self.statement._input_formats,
-				self.statement._pq_parameters(self.parameters),
-				self._output_formats,
+			self.statement._bind_template(
+				self.statement._pq_parameters(self.parameters)
 			),
-			element.Execute(b'', 0xFFFFFFFF),
+			execute_all,
 		)
 
 	def _pq_xp_declare(self):
@@ -171,7 +270,10 @@ class Output(object):
 			element.Parse(b'', self.database.typio.encode(
 					declare_statement_string(
 						str(self._quoted_cursor_id),
-						str(self.statement.string)
+						str(self.statement.string),
+						insensitive = self._declare_insensitive,
+						scroll = self._declare_scroll,
+						hold = self._declare_hold,
 					)
 				), ()
 			),
@@ -227,21 +329,31 @@ class Output(object):
 		"""
 		Process the Tuple messages in `x`.
 		"""
+		rows = self._output_processors()[1](
+			x, self._raise_column_tuple_error
+		)
+		if self._row_constructor is not None:
+			return list(map(self._row_constructor, rows))
 		return [
-			pg_types.Row.from_sequence(self._output_attmap, y)
-			for y in pg_typio.process_chunk(
-				self._output_io, x, self._raise_column_tuple_error
-			)
+			pg_types.Row.from_sequence(self._output_attmap, y) for y in rows
 		]
 
 	def _process_tuple_chunk(self, x):
 		"""
 		Process the Tuple messages in `x`.
 		"""
-		return pg_typio.process_chunk(
-			self._output_io, x, self._raise_column_tuple_error
+		return self._output_processors()[1](
+			x, self._raise_column_tuple_error
 		)
 
+	def _output_processors(self):
+		'the processors of the columns, looked up on first use'
+		p = self._process_output
+		if p is None:
+			p = self._process_output = \
+				self.database.typio.processors(self._output_io)
+		return p
+
 	def _raise_column_tuple_error(self, procs, tup, itemnum):
 		'for column processing'
 		# The element traceback will include the full list of parameters.
@@ -462,6 +574,13 @@ class MultiXactOutsideBlock(MultiXactStream):
 # Base Cursor class and cursor creation entry points.
 class Cursor(Output, pg_api.Cursor):
 	_process_tuple = Output._process_tuple_chunk_Row
+	# Reads fetch at least `readahead` rows, doubling with each consecutive
+	# fetch in the same direction up to `readahead_limit`. The rows are kept
+	# in a window so that reads and relative seeks near the position are
+	# served without a round trip. Off by default as the position of the
+	# cursor on the server then differs from the position of the object.
+	readahead = 0
+	readahead_limit = 1024
 	def _e_metas(self):
 		yield ('direction', 'FORWARD' if self.direction else 'BACKWORD')
 		yield ('type', 'Cursor')
@@ -505,7 +624,10 @@ class Cursor(Output, pg_api.Cursor):
 			x = self._ins(self._pq_xp_declare() + (element.SynchronizeMessage,))
 			self.database._pq_push(x, self)
 			self.database._pq_complete()
+			# Declared cursors start before the first row.
+			self._reset_window(first = 0)
 		else:
+			self._reset_window()
 			x = self._ins(self._pq_xp_describe() + (element.SynchronizeMessage,))
 			self.database._pq_push(x, self)
 			self.database._pq_complete()
@@ -527,19 +649,155 @@ class Cursor(Output, pg_api.Cursor):
 					self._output_io = tuple([
 						x or self.database.typio.decode for x in self._output_io
 					])
+					self._process_output = None
+
+	def _reset_window(self, first = None):
+		"""
+		Forget the rows of the window. Positions are relative to the frame
+		established here, with the cursor at zero.
+		"""
+		# Rows at positions _wbase + 1 through _wbase + len(_window).
+		self._window = []
+		self._wbase = 0
+		# The position of the cursor and its position on the server.
+		self._pos = 0
+		self._srvpos = 0
+		# The positions before the first row and after the last row, if known.
+		self._first = first
+		self._last = None
+		self._refill = (None, 0)
+
+	def _block(self, direction):
+		'the number of rows to read ahead in `direction`'
+		last, size = self._refill
+		if last is direction:
+			size = min(size * 2, self.readahead_limit)
+		else:
+			size = self.readahead
+		self._refill = (direction, size)
+		return size
+
+	def _extend(self, direction, quantity):
+		"""
+		Fetch `quantity` rows adjacent to the window in `direction`.
+		"""
+		w = self._window
+		edge = self._wbase + (len(w) if direction else 1)
+		delta = edge - self._srvpos
+		if delta > 0:
+			move = self._pq_xp_move(str(delta).encode('ascii'), b'FORWARD')
+		elif delta < 0:
+			move = self._pq_xp_move(str(-delta).encode('ascii'), b'BACKWARD')
+		else:
+			move = ()
+		try:
+			rows = self._fetch(direction, quantity, move)
+		except:
+			self._reset_window()
+			raise
+		self._srvpos = edge
+		n = len(rows)
+		if n == 0 and not w:
+			# Whether the server was on a row is unknown,
+			# so the end becomes the new frame.
+			self._reset_window(first = 0 if not direction else None)
+			if direction:
+				self._last = 0
+		elif direction:
+			if quantity is None or n < quantity:
+				self._last = edge + n + 1
+				self._srvpos = self._last
+			else:
+				self._srvpos = edge + n
+			w.extend(rows)
+		else:
+			if quantity is None or n < quantity:
+				self._first = edge - n - 1
+				self._srvpos = self._first
+			else:
+				self._srvpos = edge - n
+			rows.reverse()
+			w[0:0] = rows
+			self._wbase -= n
+
+	def _trim(self):
+		'Limit the size of the window by dropping the rows farthest away.'
+		w = self._window
+		excess = len(w) - (2 * self.readahead_limit)
+		if excess > 0:
+			behind = self._pos - self._wbase
+			if behind > len(w) - behind:
+				del w[:excess]
+				self._wbase += excess
+			else:
+				del w[-excess:]
 
 	def __next__(self):
-		return self._fetch(self.direction, 1)
+		r = self.read(1)
+		if not r:
+			raise StopIteration
+		return r[0]
 
 	def read(self, quantity = None, direction = None):
 		if quantity == 0:
 			return []
 		dir = self._which_way(direction)
-		return self._fetch(dir, quantity)
+		if not self.readahead:
+			# Keep the server at the position; rows are read once.
+			self._window = []
+		L = self._pos
+		if dir:
+			if not (self._wbase <= L <= self._wbase + len(self._window)):
+				self._window = []
+				self._wbase = L
+			avail = self._wbase + len(self._window) - L
+			if (quantity is None or avail < quantity) and (
+				self._last is None or
+				self._wbase + len(self._window) + 1 < self._last
+			):
+				self._extend(True, None if quantity is None else max(
+					quantity - avail, self._block(True)
+				))
+			L = self._pos
+			start = L - self._wbase
+			if quantity is None:
+				rows = self._window[start:]
+			else:
+				rows = self._window[start:start + quantity]
+			if (quantity is None or len(rows) < quantity) \
+			and self._last is not None:
+				self._pos = self._last
+			else:
+				self._pos = L + len(rows)
+		else:
+			if not (self._wbase < L <= self._wbase + len(self._window) + 1):
+				self._window = []
+				self._wbase = L - 1
+			avail = L - 1 - self._wbase
+			if (quantity is None or avail < quantity) and (
+				self._first is None or self._wbase > self._first
+			):
+				self._extend(False, None if quantity is None else max(
+					quantity - avail, self._block(False)
+				))
+			L = self._pos
+			end = max(L - 1 - self._wbase, 0)
+			if quantity is None:
+				rows = self._window[:end]
+			else:
+				rows = self._window[max(end - quantity, 0):end]
+			rows.reverse()
+			if (quantity is None or len(rows) < quantity) \
+			and self._first is not None:
+				self._pos = self._first
+			else:
+				self._pos = L - len(rows)
+		self._trim()
+		return rows
 
-	def _fetch(self, direction, quantity):
+	def _fetch(self, direction, quantity, move = ()):
 		x = self._ins(
-			self._pq_xp_fetch(direction, quantity) + \
+			move + self._pq_xp_fetch(direction, quantity) + \
 			(element.SynchronizeMessage,)
 		)
 		self.database._pq_push(x, self)
@@ -565,6 +823,20 @@ class Cursor(Output, pg_api.Cursor):
 				rwhence = 'ABSOLUTE'
 
 		if rwhence == 'RELATIVE':
+			target = self._pos + offset
+			if self._last is not None and target > self._last:
+				target = self._last
+			elif self._first is not None and target < self._first:
+				target = self._first
+			if target == self._srvpos or self.readahead and (
+				self._wbase < target <= self._wbase + len(self._window)
+				or target in (self._first, self._last)
+			):
+				# The position is known, so no MOVE is necessary.
+				self._pos = target
+				self._refill = (None, 0)
+				return
+			offset = target - self._srvpos
 			if offset < 0:
 				cmd = self._pq_xp_move(
 					str(-offset).encode('ascii'), b'BACKWARD'
@@ -585,6 +857,13 @@ class Cursor(Output, pg_api.Cursor):
 		x = self._ins(cmd + (element.SynchronizeMessage,),)
 		self.database._pq_push(x, self)
 		self.database._pq_complete()
+		# The new position is not known relative to the window.
+		self._reset_window()
+		if offset == 0:
+			if rwhence == 'ABSOLUTE':
+				self._first = 0
+			elif rwhence == 'FROM_END':
+				self._last = 0
 
 class PreparedStatement(pg_api.PreparedStatement):
 	string = None
@@ -595,6 +874,11 @@ class PreparedStatement(pg_api.PreparedStatement):
 	_output_io = None
 	_output_formats = None
 	_output_attmap = None
+	_row_constructor = None
+	_bind_template = None
+	_pack_parameters = None
+	_process_input = None
+	_process_output = None
 
 	def _e_metas(self):
 		yield (None, '[' + self.state + ']')
@@ -657,15 +941,19 @@ class PreparedStatement(pg_api.PreparedStatement):
 			yield ('sql_column_types', ct)
 
 	def clone(self):
-		ps = type(self)(self.database, None, self.string)
+		ps = type(self)(
+			self.database, None, self.string, row_factory = self.row_factory
+		)
 		ps._init()
 		ps._fini()
 		return ps
 
-	def __init__(self, database, statement_id, string):
+	def __init__(self, database, statement_id, string, row_factory = None):
 		self.database = database
 		self.statement_id = statement_id or ID(self)
 		self.string = string
+		self._settings_effect = 0 if string is None else settings_effect(str(string))
+		self.row_factory = row_factory
 		self._xact = None
 		self._pq_statement_id = None
 		self.closed = None
@@ -687,9 +975,8 @@ class PreparedStatement(pg_api.PreparedStatement):
 		)
 
 	def _pq_parameters(self, parameters):
-		return pg_typio.process_tuple(
-			self._input_io, parameters,
-			self._raise_parameter_tuple_error
+		return self._pack_parameters(
+			parameters, self._raise_parameter_tuple_error
 		)
 
 	def _raise_parameter_tuple_error(self, procs, tup, itemnum):
@@ -818,6 +1105,13 @@ class PreparedStatement(pg_api.PreparedStatement):
 		the return as there may be things that can be done while waiting
 		for the return. Use the _fini() to complete.
 		"""
+		cmd = self._init_messages()
+		cmd.append(element.SynchronizeMessage)
+		self._xact = xact.Instruction(cmd, asynchook = self.database._receive_async)
+		self.database._pq_push(self._xact, self)
+
+	def _init_messages(self):
+		'The messages that parse and describe the statement; without a Sync.'
 		self._pq_statement_id = self.database.typio._encode(
 			self.statement_id
 		)[0]
@@ -829,14 +1123,8 @@ class PreparedStatement(pg_api.PreparedStatement):
 			]
 		else:
 			cmd = []
-		cmd.extend(
-			(
-				element.DescribeStatement(self._pq_statement_id),
-				element.SynchronizeMessage,
-			)
-		)
-		self._xact = xact.Instruction(cmd, asynchook = self.database._receive_async)
-		self.database._pq_push(self._xact, self)
+		cmd.append(element.DescribeStatement(self._pq_statement_id))
+		return cmd
 
 	def _fini(self):
 		"""
@@ -853,13 +1141,21 @@ class PreparedStatement(pg_api.PreparedStatement):
 				raise
 
 		(*head, argtypes, tupdesc, last) = self._xact.messages_received()
+		self._describe(argtypes, tupdesc)
 
+	def _describe(self, argtypes, tupdesc):
+		"""
+		Configure the statement's I/O using the AttributeTypes and the
+		TupleDescriptor(or NoData) messages received from the server.
+		"""
 		if tupdesc is None or tupdesc is element.NoDataMessage:
 			# Not typed output.
 			self._output = None
 			self._output_attmap = None
 			self._output_io = None
 			self._output_formats = None
+			self._row_constructor = None
+			self._process_output = None
 		else:
 			self._output = tupdesc
 			self._output_attmap = dict(
@@ -877,6 +1173,14 @@ class PreparedStatement(pg_api.PreparedStatement):
 			self._output_io = tuple([
 				x or self.database.typio.decode for x in self._output_io
 			])
+			self._process_output = \
+				self.database.typio.processors(self._output_io)
+			# The row constructor is made once per statement.
+			row_factory = self.row_factory or self.database.row_factory
+			if row_factory is not None:
+				self._row_constructor = row_factory(
+					tuple(self.database.typio.decodes(tupdesc.keys()))
+				)
 
 		self._input = argtypes
 		packs = []
@@ -891,6 +1195,12 @@ class PreparedStatement(pg_api.PreparedStatement):
 			)
 		self._input_io = tuple(packs)
 		self._input_formats = formats
+		# Constant parts of the messages used to run the statement.
+		self._process_input = self.database.typio.processors(self._input_io)
+		self._pack_parameters = self._process_input[0]
+		self._bind_template = element.BindTemplate(
+			b'', self._pq_statement_id, formats, self._output_formats or ()
+		)
 		self.closed = False
 		self._xact = None
 
@@ -932,7 +1242,14 @@ class PreparedStatement(pg_api.PreparedStatement):
 		return chain.from_iterable(self.chunks(*parameters, **kw))
 	__iter__ = rows
 
-	def chunks(self, *parameters):
+	def chunks(self, *parameters, memo = None, row_factory = None):
+		"""
+		`memo` selects the columns whose unpacked objects are memoized so that
+		repeated values share one object: ``True`` for the columns transferred
+		as text, or a sequence of column names or indexes.
+
+		`row_factory` overrides the statement's row factory.
+		"""
 		if self.closed is None:
 			self._fini()
 		if self._input is not None:
@@ -942,14 +1259,35 @@ class PreparedStatement(pg_api.PreparedStatement):
 				))
 		if self._output is None:
 			return SingleXactCopy(self, parameters)
-		if self.database.pq.state == b'I':
+		if self.database.pq.state == b'I' and not self.database._xact_queue:
 			if self.string is not None:
-				return MultiXactOutsideBlock(self, parameters, None)
+				c = MultiXactOutsideBlock(self, parameters, None)
 			else:
 				# statement source unknown, so it can't be DECLARE'd.
-				return SingleXactFetch(self, parameters)
+				c = SingleXactFetch(self, parameters)
 		else:
-			return MultiXactInsideBlock(self, parameters, None)
+			c = MultiXactInsideBlock(self, parameters, None)
+		if memo:
+			c._output_io = self._memoized_output_io(memo)
+		if row_factory is not None:
+			c._row_constructor = row_factory(tuple(self.column_names))
+		return c
+
+	def _memoized_output_io(self, memo):
+		if memo is True:
+			decode = self.database.typio.decode
+			columns = [
+				i for i, x in enumerate(self._output_io) if x == decode
+			]
+		else:
+			columns = [
+				x if x.__class__ is int else self._output_attmap[x]
+				for x in memo
+			]
+		io = list(self._output_io)
+		for i in columns:
+			io[i] = pg_typio.memoize(io[i])
+		return tuple(io)
 
 	def first(self, *parameters):
 		if self.closed is None:
@@ -963,23 +1301,16 @@ class PreparedStatement(pg_api.PreparedStatement):
 		db = self.database
 
 		if self._input_io:
-			params = pg_typio.process_tuple(
-				self._input_io, parameters,
-				self._raise_parameter_tuple_error
+			params = self._pack_parameters(
+				parameters, self._raise_parameter_tuple_error
 			)
 		else:
 			params = ()
 
 		# Run the statement
 		x = xact.Instruction((
-				element.Bind(
-					b'',
-					self._pq_statement_id,
-					self._input_formats,
-					params,
-					self._output_formats,
-				),
-				element.Execute(b'', 0xFFFFFFFF),
+				self._bind_template(params),
+				execute_all,
 				element.SynchronizeMessage
 			),
 			asynchook = db._receive_async
@@ -997,13 +1328,12 @@ class PreparedStatement(pg_api.PreparedStatement):
 				return None
 
 			if len(self._output_io) > 1:
-				return pg_types.Row.from_sequence(
-					self._output_attmap,
-					pg_typio.process_tuple(
-						self._output_io, xt,
-						self._raise_column_tuple_error
-					),
+				r = self._process_output[0](
+					xt, self._raise_column_tuple_error
 				)
+				if self._row_constructor is not None:
+					return self._row_constructor(r)
+				return pg_types.Row.from_sequence(self._output_attmap, r)
 			else:
 				if xt[0] is None:
 					return None
@@ -1055,43 +1385,52 @@ class PreparedStatement(pg_api.PreparedStatement):
 			self.database._raise_pq_error(x, controller = self)
 			raise RuntimeError("failed to raise client error")
 
-		for chunk in chunks:
-			x.messages = list(chunk)
-			while x.messages is not x.CopyFailSequence:
-				self.database._pq_step()
+		try:
+			for chunk in chunks:
+				x.messages = list(chunk)
+				while x.messages is not x.CopyFailSequence:
+					self.database._pq_step()
+		except:
+			##
+			# The chunks failed to produce the data, so fail the COPY
+			# by completing the CopyFailSequence and raise the error.
+			self.database.pq.complete()
+			self.database.pq.synchronize()
+			raise
 		x.messages = x.CopyDoneSequence
 		self.database._pq_complete()
 		self.database.pq.synchronize()
+		return complete_count(x)
 
 	def _load_tuple_chunks(self, chunks):
 		pte = self._raise_parameter_tuple_error
 		last = (element.SynchronizeMessage,)
+		bind = self._bind_template
+		execute = element.Execute(b'', 1)
+		process_chunk = self._process_input[1]
+		count = 0
+		x = None
 		try:
 			for chunk in chunks:
+				# Pack the parameters of the entire chunk at once.
 				bindings = [
-					(
-						element.Bind(
-							b'',
-							self._pq_statement_id,
-							self._input_formats,
-							pg_typio.process_tuple(
-								self._input_io, tuple(t), pte
-							),
-							(),
-						),
-						element.Execute(b'', 1),
-					)
-					for t in chunk
+					(bind(t), execute)
+					for t in process_chunk([tuple(t) for t in chunk], pte)
 				]
 				bindings.append(last)
-				self.database._pq_push(
-					xact.Instruction(
-						chain.from_iterable(bindings),
-						asynchook = self.database._receive_async
-					),
-					self
+				nx = xact.Instruction(
+					chain.from_iterable(bindings),
+					asynchook = self.database._receive_async
 				)
+				# Pushing completes the prior instruction.
+				self.database._pq_push(nx, self)
+				if x is not None:
+					count += complete_count(x)
+				x = nx
 			self.database._pq_complete()
+			if x is not None:
+				count += complete_count(x)
+			return count
 		except:
 			##
 			# In cases where row packing errors or occur,
@@ -1124,6 +1463,8 @@ class PreparedStatement(pg_api.PreparedStatement):
 
 		In cases of ``COPY ... FROM STDIN``, iterable must be an iterable of
 		sequences of `bytes`.
+
+		Returns the sum of the row counts reported by the server.
 		"""
 		if self.closed is None:
 			self._fini()
@@ -1135,6 +1476,34 @@ class PreparedStatement(pg_api.PreparedStatement):
 	def load_rows(self, rows, chunksize = 256):
 		return self.load_chunks(chunk(rows, chunksize))
 
+	def _binary_copyable(self):
+		'whether the parameters of the statement can be sent in a binary COPY'
+		if self.closed is None:
+			self._fini()
+		typio = self.database.typio
+		return not [
+			x for x, io in zip(self._input, self._input_io)
+			if io == typio.encode and x not in pg_typio.text_binary_types
+		]
+
+	def _binary_copy_data(self, rows, chunksize = 256):
+		"""
+		Serialize the parameter `rows` of the statement into the chunks of a
+		binary ``COPY ... FROM STDIN`` of the statement's parameter types.
+		"""
+		if self.closed is None:
+			self._fini()
+		process_chunk = self._process_input[1]
+		pte = self._raise_parameter_tuple_error
+		field_count = ushort_pack(len(self._input))
+		yield (copy_header,)
+		for c in chunk(rows, chunksize):
+			yield (b''.join([
+				field_count + pack_tuple_data(t)
+				for t in process_chunk([tuple(t) for t in c], pte)
+			]),)
+		yield (copy_trailer,)
+
 class StoredProcedure(pg_api.StoredProcedure):
 	_e_factors = ('database', 'procedure_id')
 	procedure_id = None
@@ -1244,30 +1613,88 @@ class SettingsCM(object):
 		self.database.settings.update(self.stored_settings)
 
 class Settings(pg_api.Settings):
+	"""
+	A client side mirror of the connection's settings.
+
+	The values reported by the server with ParameterStatus messages are
+	always current. The other settings are loaded with a single query
+	on the first access of one of them, and are forgotten when a statement
+	run by the driver may change them. Like the server's, the names of the
+	settings are case insensitive.
+	"""
 	_e_factors = ('database',)
 
 	def __init__(self, database):
 		self.database = database
 		self.cache = {}
+		# Names of the settings reported by the server.
+		self._reported = set()
+		# The spelling of each setting's name in the cache by its lower case.
+		self._names = {}
+		# Whether the cache holds all of the settings.
+		self._complete = False
+		# Whether a setting may have been changed since the last time
+		# a transaction ended.
+		self._changed = False
 
 	def _e_metas(self):
 		yield (None, str(len(self.cache)))
 
 	def _clear_cache(self):
-		self.cache.clear()
+		'Forget the values of the settings that the server does not report.'
+		self.cache = {
+			k : v for k, v in self.cache.items() if k in self._reported
+		}
+		self._complete = False
+
+	def _statement(self, effect):
+		"""
+		Note that a statement with the given `settings_effect` is being run.
+		"""
+		if effect & ChangesSettings:
+			self._changed = True
+			self._clear_cache()
+		elif effect & EndsTransaction and self._changed:
+			self._changed = False
+			self._clear_cache()
+
+	def _name(self, k):
+		'The spelling of the setting name `k` used by the cache.'
+		return self._names.get(k.lower(), k)
+
+	def _prefetch(self):
+		'Load all of the settings in a single query.'
+		cache = dict(self.database.sys.setting_items())
+		names = dict([(k.lower(), k) for k in cache])
+		# Reported values are kept as the server reported them, but under
+		# the spelling of pg_settings.
+		reported = set()
+		for k in self._reported:
+			name = names.setdefault(k.lower(), k)
+			reported.add(name)
+			if k in self.cache:
+				cache[name] = self.cache[k]
+		self.cache = cache
+		self._names = names
+		self._reported = reported
+		self._complete = True
+
+	def _lookup(self, k):
+		k = self._name(k)
+		v = self.cache.get(k)
+		if v is None and not self._complete:
+			self._prefetch()
+			v = self.cache.get(k)
+		return v
 
 	def __getitem__(self, i):
-		v = self.cache.get(i)
+		v = self._lookup(i)
 		if v is None:
-			r = self.database.sys.setting_get(i)
-
-			if r:
-				v = r[0][0]
-			else:
-				raise KeyError(i)
+			raise KeyError(i)
 		return v
 
 	def __setitem__(self, i, v):
+		i = self._name(i)
 		cv = self.cache.get(i)
 		if cv == v:
 			return
@@ -1278,10 +1705,12 @@ class Settings(pg_api.Settings):
 		self.database.execute(
 			'RESET "' + k.replace('"', '""') + '"'
 		)
-		self.cache.pop(k, None)
+		self.cache.pop(self._name(k), None)
 
 	def __len__(self):
-		return self.database.sys.setting_len()
+		if not self._complete:
+			self._prefetch()
+		return len(self.cache)
 
 	def __call__(self, **settings):
 		return SettingsCM(self.database, settings)
@@ -1303,56 +1732,42 @@ class Settings(pg_api.Settings):
 	path = property(**path())
 
 	def get(self, k, alt = None):
-		if k in self.cache:
-			return self.cache[k]
-
-		db = self.database
-		r = self.database.sys.setting_get(k)
-		if r:
-			v = r[0][0]
-			self.cache[k] = v
-		else:
-			v = alt
+		v = self._lookup(k)
+		if v is None:
+			return alt
 		return v
 
 	def getset(self, keys):
 		setmap = {}
-		rkeys = []
 		for k in keys:
-			v = self.cache.get(k)
+			v = self._lookup(k)
 			if v is not None:
 				setmap[k] = v
-			else:
-				rkeys.append(k)
-
-		if rkeys:
-			r = self.database.sys.setting_mget(rkeys)
-			self.cache.update(r)
-			setmap.update(r)
-			rem = set(rkeys) - set([x['name'] for x in r])
-			if rem:
-				raise KeyError(rem)
+		rem = set(keys) - set(setmap)
+		if rem:
+			raise KeyError(rem)
 		return setmap
 
 	def keys(self):
-		return map(
-			get0, self.database.sys.setting_keys()
-		)
+		if not self._complete:
+			self._prefetch()
+		return iter(list(self.cache.keys()))
 	__iter__ = keys
 
 	def values(self):
-		return map(
-			get0, self.database.sys.setting_values()
-		)
+		if not self._complete:
+			self._prefetch()
+		return iter(list(self.cache.values()))
 
 	def items(self):
-		return self.database.sys.setting_items()
+		if not self._complete:
+			self._prefetch()
+		return list(self.cache.items())
 
 	def update(self, d):
 		kvl = [list(x) for x in dict(d).items()]
-		self.cache.update(
-			self.database.sys.setting_update(kvl)
-		)
+		for k, v in self.database.sys.setting_update(kvl):
+			self.cache[self._name(k)] = v
 
 	def _notify(self, msg):
 		subs = getattr(self, '_subscriptions', {})
@@ -1364,7 +1779,9 @@ class Settings(pg_api.Settings):
 		if None in subs:
 			for x in subs[None]:
 				x(self.database, key, val)
-		self.cache[key] = val
+		name = self._names.setdefault(key.lower(), key)
+		self._reported.add(name)
+		self.cache[name] = val
 
 	def subscribe(self, key, callback):
 		"""
@@ -1403,17 +1820,23 @@ class Transaction(pg_api.Transaction):
 	mode = None
 	isolation = None
 	gid = None
+	# Send the BEGIN or SAVEPOINT with the first statement of the block.
+	deferred = False
 
 	_e_factors = ('database', 'gid', 'isolation', 'mode')
 
 	def _e_metas(self):
 		yield (None, self.state)
 
-	def __init__(self, database, gid = None, isolation = None, mode = None):
+	def __init__(self,
+		database, gid = None, isolation = None, mode = None, deferred = None
+	):
 		self.database = database
 		self.gid = gid
 		self.isolation = isolation
 		self.mode = mode
+		if deferred is not None:
+			self.deferred = deferred
 		self.state = 'initialized'
 		self.type = None
 
@@ -1501,7 +1924,8 @@ class Transaction(pg_api.Transaction):
 			)
 			self.database._raise_a_pq_error(em, self)
 
-		if self.database.pq.state == b'I':
+		queue = self.database._xact_queue
+		if self.database.pq.state == b'I' and not queue:
 			self.type = 'block'
 			q = self._start_xact_string(
 				isolation = self.isolation,
@@ -1517,10 +1941,27 @@ class Transaction(pg_api.Transaction):
 				)
 				self.database._raise_a_pq_error(em, self)
 			q = self._savepoint_xact_string(hex(id(self)))
-		self.database.execute(q)
+		if self.deferred and self.gid is None:
+			# Sent by the connection with the next statement.
+			queue.append((self, q))
+		else:
+			self.database.execute(q)
 		self.state = 'open'
 	begin = start
 
+	def _unqueue(self):
+		"""
+		Remove the deferred start of the transaction, and those of the
+		transactions started after it, from the connection's queue.
+		Returns whether the start was still queued.
+		"""
+		queue = self.database._xact_queue
+		for i in range(len(queue)):
+			if queue[i][0] is self:
+				del queue[i:]
+				return True
+		return False
+
 	@staticmethod
 	def _prepare_string(id):
 		"2pc prepared transaction 'gid'"
@@ -1529,7 +1970,7 @@ class Transaction(pg_api.Transaction):
 	@staticmethod
 	def _release_string(id):
 		'release "";'
-		return 'RELEASE "xact(' + id.replace('"', '""') + ')";'
+		return 'RELEASE "' + id.replace('"', '""') + '";'
 
 	def prepare(self):
 		if self.state == 'prepared':
@@ -1591,7 +2032,8 @@ class Transaction(pg_api.Transaction):
 				)
 				self.database._raise_a_pq_error(em, self)
 			q = self._release_string(hex(id(self)))
-		self.database.execute(q)
+		if not self._unqueue():
+			self.database.execute(q)
 		self.state = 'committed'
 
 	@staticmethod
@@ -1618,33 +2060,169 @@ class Transaction(pg_api.Transaction):
 			q = self._rollback_to_string(hex(id(self)))
 		else:
 			raise RuntimeError("unknown transaction type " + repr(self.type))
-		self.database.execute(q)
+		if self.state == 'prepared' or not self._unqueue():
+			self.database.execute(q)
 		self.state = 'aborted'
 	abort = rollback
 
+class KeySet(object):
+	"""
+	A set of keys exposed to statements as a relation with a single column,
+	``key``. Created by `Connection.with_keyset`.
+
+	Small sets are bound as an array parameter that is unnested by the
+	`relation`. Large sets are copied into an indexed temporary table that
+	is dropped when the context is exited.
+	"""
+	table = None
+
+	def __init__(self, database, values, typname, parameter, threshold):
+		self.database = database
+		self.values = values
+		self.typname = typname
+		self.parameter = parameter
+		self.threshold = threshold
+
+	def __enter__(self):
+		values = self.values
+		if not hasattr(values, '__len__'):
+			values = list(values)
+		typecode = pg_typio.fixed_array_elements.get(
+			pg_types.name_to_oid.get(self.typname)
+		)
+		if typecode is not None and type(values) is not array.array:
+			try:
+				# Fixed-width elements are packed in bulk.
+				values = array.array(typecode, values)
+			except (TypeError, OverflowError):
+				pass
+
+		if len(values) <= self.threshold:
+			self.relation = '(SELECT pg_catalog.unnest($%d::%s[]) AS key)' %(
+				self.parameter, self.typname
+			)
+			self.parameters = (values,)
+		else:
+			self.table = pg_str.quote_ident(IDNS %('keyset:' + hex(id(self)),))
+			self._load(values)
+			self.relation = self.table
+			self.parameters = ()
+		return self
+
+	def __exit__(self, typ, val, tb):
+		db = self.database
+		if self.table is not None and not db.closed and db.pq.state != b'E':
+			db.execute('DROP TABLE ' + self.table)
+		self.table = None
+
+	def _load(self, values, chunksize = 0x4000):
+		db = self.database
+		db.execute(
+			'CREATE TEMP TABLE ' + self.table + ' (key ' + self.typname + ')'
+		)
+		insert = db.prepare('INSERT INTO ' + self.table + ' VALUES ($1)')
+		typecode = pg_typio.fixed_array_elements.get(insert._input[0])
+		copy = 'COPY ' + self.table + ' FROM STDIN WITH BINARY'
+		if typecode is not None and type(values) is array.array:
+			if values.typecode != typecode:
+				values = array.array(typecode, values)
+			field_count = ushort_pack(1)
+			db.prepare(copy).load_chunks(chain(
+				((copy_header,),),
+				[
+					(bytes(pg_typio.fixed_elements_pack(
+						field_count, values[i:i+chunksize]
+					)),)
+					for i in range(0, len(values), chunksize)
+				],
+				((copy_trailer,),),
+			))
+		elif insert._binary_copyable():
+			db.prepare(copy).load_chunks(
+				insert._binary_copy_data([(x,) for x in values])
+			)
+		else:
+			insert.load_rows([(x,) for x in values])
+		db.execute(
+			'CREATE INDEX ' + pg_str.quote_ident(
+				IDNS %('keyset_index:' + hex(id(self)),)
+			) + ' ON ' + self.table + ' (key);' \
+			'ANALYZE ' + self.table
+		)
+
 class Connection(pg_api.Connection):
 	connector = None
 
-	type = None
 	version_info = None
-	version = None
 
 	security = None
 	backend_id = None
-	client_address = None
-	client_port = None
+
+	# Loaded on first access; see `version` and `_activity`.
+	_version = None
+	_activity_row = None
 
 	# Replaced with instances on connection instantiation.
 	settings = Settings
 
+	# The number of keys above which `with_keyset` uses a temporary table.
+	keyset_threshold = 10000
+
+	# The number of statements whose result formats `query` remembers.
+	query_formats_size = 256
+
+	@property
+	def version(self):
+		"""
+		The *full* version string; queried on first access.
+		"""
+		if self._version is None and not self.closed:
+			self._version = self.prepare("SELECT pg_catalog.version()").first()
+		return self._version
+
+	@property
+	def type(self):
+		'First word from the version string.'
+		v = self.version
+		if v is not None:
+			return v.split()[0]
+
+	@property
+	def _activity(self):
+		"""
+		The backend's ``pg_stat_activity`` row; queried on first access.
+		"""
+		if self._activity_row is None and not self.closed:
+			self._activity_row = self.sys.activity_for(self.backend_id) or {}
+		return self._activity_row or {}
+
+	@property
+	def client_address(self):
+		# pythons without ipaddr will likely give strings.
+		ca = self._activity.get('client_addr')
+		if ca is not None:
+			return ca.split('/')[0]
+
+	@property
+	def client_port(self):
+		return self._activity.get('client_port')
+
+	@property
+	def backend_start(self):
+		return self._activity.get('backend_start')
+
 	def _e_metas(self):
 		yield (None, '[' + self.state + ']')
-		if self.client_address is not None:
-			yield ('client_address', self.client_address)
-		if self.client_port is not None:
-			yield ('client_port', self.client_port)
-		if self.version is not None:
-			yield ('version', self.version)
+		# Only report what has already been loaded;
+		# the connection may not be usable.
+		r = self._activity_row or {}
+		ca = r.get('client_addr')
+		if ca is not None:
+			yield ('client_address', ca.split('/')[0])
+		if r.get('client_port') is not None:
+			yield ('client_port', r.get('client_port'))
+		if self._version is not None:
+			yield ('version', self._version)
 		att = getattr(self, 'failures', None)
 		if att:
 			count = 0
@@ -1686,22 +2264,444 @@ class Connection(pg_api.Connection):
 			),
 			asynchook = self._receive_async
 		)
+		effect = settings_effect(query)
+		if effect:
+			self.settings._statement(effect)
 		self._pq_push(q, self)
 		self._pq_complete()
 
-	def xact(self, gid = None, isolation = None, mode = None):
-		x = Transaction(self, gid = gid, isolation = isolation, mode = mode)
+	def xact(self, gid = None, isolation = None, mode = None, deferred = None):
+		x = Transaction(self,
+			gid = gid, isolation = isolation, mode = mode, deferred = deferred
+		)
 		return x
 
 	def prepare(self,
 		sql_statement_string : str,
 		statement_id = None,
+		row_factory : "callable given the column names returning a row constructor" = None,
 	) -> PreparedStatement:
-		ps = PreparedStatement(self, statement_id, sql_statement_string)
+		ps = PreparedStatement(
+			self, statement_id, sql_statement_string, row_factory = row_factory
+		)
 		ps._init()
 		ps._fini()
 		return ps
 
+	def prepare_many(self,
+		sql_statement_strings : [str],
+		row_factory : "callable given the column names returning a row constructor" = None,
+	) -> [PreparedStatement]:
+		pss = [
+			PreparedStatement(self, None, x, row_factory = row_factory)
+			for x in sql_statement_strings
+		]
+		if not pss:
+			return pss
+		cmd = []
+		for ps in pss:
+			cmd.extend(ps._init_messages())
+		cmd.append(element.SynchronizeMessage)
+		x = xact.Instruction(cmd, asynchook = self._receive_async)
+		self._pq_push(x, self)
+		try:
+			self._pq_complete()
+		except pg_exc.Error as err:
+			# Each statement receives four messages: CloseComplete,
+			# ParseComplete, AttributeTypes, and TupleDescriptor or NoData.
+			failed = len(list(x.messages_received())) // 4
+			if failed < len(pss):
+				err.creator = pss[failed]
+			# Close the statements parsed before the failure; the ones
+			# following it were skipped by the server.
+			for ps in pss[:failed + 1]:
+				ps.closed = False
+				ps.close()
+			for ps in pss[failed + 1:]:
+				ps.closed = True
+			raise
+		msgs = list(x.messages_received())
+		for i in range(len(pss)):
+			pss[i]._describe(msgs[i * 4 + 2], msgs[i * 4 + 3])
+		return pss
+
+	def _query(self, sql, parameters, types, limit):
+		"""
+		Parse, bind, describe, and execute the statement using the unnamed
+		statement and portal in a single round trip. The result formats are
+		remembered so that the columns without binary I/O are requested as text
+		the next time the statement is run.
+
+		Returns the portal's TupleDescriptor, the column I/O, the Tuple
+		messages, and the Complete message.
+		"""
+		typio = self.typio
+		if types is None:
+			types = [pg_typio.infer_type(x) for x in parameters]
+		elif len(types) != len(parameters):
+			raise TypeError("%d parameter types given for %d parameters" %(
+				len(types), len(parameters)
+			))
+		formats = []
+		params = []
+		for i in range(len(parameters)):
+			ob = parameters[i]
+			pack = typio.resolve(types[i])[0] if types[i] else None
+			if ob is None:
+				params.append(None)
+				formats.append(element.StringFormat)
+			elif pack is None:
+				params.append(typio.encode(ob if ob.__class__ is str else str(ob)))
+				formats.append(element.StringFormat)
+			else:
+				try:
+					params.append(pack(ob))
+				except Exception:
+					em = element.ClientError(
+						message = "failed to pack parameter %s::%s for transfer" %(
+							('$' + str(i + 1)), typio.sql_type_from_oid(types[i]),
+						),
+						code = '--PIO',
+						detail = repr(ob)[:80],
+						hint = "Give the parameter as a string or give the types explicitly.",
+						position = str(i),
+					)
+					self._raise_a_pq_error(em, controller = self)
+				formats.append(element.BinaryFormat)
+
+		key = (sql, tuple(types))
+		output_formats = self._query_formats.get(key)
+		if output_formats is None:
+			# Not yet described, so request binary for all the columns.
+			output_formats = (element.BinaryFormat,)
+		x = xact.Instruction((
+				element.Parse(b'', typio.encode(sql), types),
+				element.Bind(b'', b'', formats, params, output_formats),
+				element.DescribePortal(b''),
+				element.Execute(b'', limit),
+				element.SynchronizeMessage,
+			),
+			asynchook = self._receive_async
+		)
+		effect = settings_effect(sql)
+		if effect:
+			self.settings._statement(effect)
+		try:
+			self._pq_push(x, self)
+			self._pq_complete()
+		except:
+			# The result columns may have changed; describe it again next time.
+			self._query_formats.pop(key, None)
+			raise
+
+		desc = None
+		rows = []
+		complete = None
+		for m in x.messages_received():
+			typ = getattr(m, 'type', None)
+			if typ is element.Tuple.type:
+				rows.append(m)
+			elif typ is element.TupleDescriptor.type:
+				desc = m
+			elif typ is element.Complete.type:
+				complete = m
+		if desc is None:
+			io = None
+			formats = ()
+		else:
+			io, formats = self._query_io(desc, output_formats)
+		# Remember the formats for the columns; the ones without binary I/O are
+		# requested as text on the next run.
+		if key not in self._query_formats \
+		and len(self._query_formats) >= self.query_formats_size:
+			self._query_formats.clear()
+		self._query_formats[key] = formats
+		return (desc, io, rows, complete)
+
+	def _query_io(self, desc, output_formats):
+		"""
+		Resolve the column I/O of the portal given the result formats it was
+		bound with. Returns the I/O and the formats to request on the next run.
+		"""
+		typio = self.typio
+		io = typio.resolve_descriptor(desc, 1)
+		formats = []
+		for i in range(len(io)):
+			if io[i] is not None:
+				formats.append(element.BinaryFormat)
+				continue
+			if desc[i][3] in pg_typio.text_binary_types:
+				formats.append(element.BinaryFormat)
+				io[i] = typio.decode
+				continue
+			formats.append(element.StringFormat)
+			if len(output_formats) == 1:
+				fmt = output_formats[0]
+			else:
+				fmt = output_formats[i]
+			if fmt == element.StringFormat:
+				io[i] = typio.decode
+			else:
+				# The column was not known to need text when it was bound.
+				w = pg_exc.TypeConversionWarning(
+					"column %r, %s, cannot be unpacked from binary data" %(
+						i, typio.sql_type_from_oid(desc[i][3]) or '<unknown>',
+					),
+					details = {
+						'hint' : "The column is requested as text the next time " \
+							"the statement is run; use prepare() or cast the " \
+							"column to 'text' to get text on the first run."
+					},
+					source = 'DRIVER',
+					creator = self,
+				)
+				w.raise_message()
+				io[i] = bytes
+		return (tuple(io), tuple(formats))
+
+	def _query_rows(self, desc, io, rows):
+		typio = self.typio
+		names = tuple(typio.decodes(desc.keys()))
+		def fail(procs, tup, itemnum):
+			em = element.ClientError(
+				code = "--CIO",
+				message = "failed to unpack column %r, %s::%s, from wire data" %(
+					itemnum, names[itemnum],
+					typio.sql_type_from_oid(desc[itemnum][3]) or '<unknown>',
+				),
+				detail = repr(tup[itemnum])[:80],
+				hint = "Try casting the column to 'text'.",
+				position = str(itemnum),
+			)
+			self._raise_a_pq_error(em, controller = self)
+		rows = typio.processors(io)[1](rows, fail)
+		if self.row_factory is not None:
+			return list(map(self.row_factory(names), rows))
+		attmap = dict(zip(names, range(len(names))))
+		return [pg_types.Row.from_sequence(attmap, x) for x in rows]
+
+	def query(self,
+		sql_statement_string : str,
+		*parameters,
+		types : "sequence of parameter type Oids; if None, inferred" = None
+	):
+		desc, io, rows, complete = self._query(
+			sql_statement_string, parameters, types, 0xFFFFFFFF
+		)
+		if desc is None:
+			if complete is None:
+				return []
+			return (
+				complete.extract_command().decode('ascii'),
+				complete.extract_count()
+			)
+		return self._query_rows(desc, io, rows)
+
+	def query_first(self,
+		sql_statement_string : str,
+		*parameters,
+		types : "sequence of parameter type Oids; if None, inferred" = None
+	):
+		desc, io, rows, complete = self._query(
+			sql_statement_string, parameters, types, 1
+		)
+		if desc is None:
+			if complete is None:
+				return None
+			return complete.extract_count() or complete.extract_command()
+		if not rows:
+			return None
+		if len(io) == 1:
+			if rows[0][0] is None:
+				return None
+			return self._query_rows(desc, io, rows[:1])[0][0]
+		return self._query_rows(desc, io, rows[:1])[0]
+
+	def _stage(self, table, columns, rows, chunksize):
+		"""
+		Create a temporary table with the `columns` of `table` and load the
+		`rows` into it. Returns the name of the staging table.
+		"""
+		stage = pg_str.quote_ident(IDNS %('stage:' + hex(id(rows)),))
+		cols = ', '.join(columns)
+		self.execute(
+			'CREATE TEMP TABLE ' + stage + ' AS SELECT ' + cols + \
+			' FROM ' + table + ' LIMIT 0'
+		)
+		insert = self.prepare(
+			'INSERT INTO ' + stage + ' VALUES (' + ', '.join([
+				'$' + str(i) for i in range(1, len(columns) + 1)
+			]) + ')'
+		)
+		if insert._binary_copyable():
+			copy = self.prepare('COPY ' + stage + ' FROM STDIN WITH BINARY')
+			copy.load_chunks(insert._binary_copy_data(rows, chunksize))
+			copy.close()
+		else:
+			insert.load_rows(rows, chunksize = chunksize)
+		insert.close()
+		self.execute('ANALYZE ' + stage)
+		return stage
+
+	def _bulk(self, table, columns, rows, key, chunksize, insert):
+		if isinstance(key, str):
+			key = (key,)
+		columns = [pg_str.quote_ident(x) for x in columns]
+		key = [pg_str.quote_ident(x) for x in key]
+		if not key or [x for x in key if x not in columns]:
+			raise ValueError("key columns must be a non-empty subset of the columns")
+		values = [x for x in columns if x not in key]
+		match = ' AND '.join([
+			't.' + x + ' = s.' + x for x in key
+		])
+		with self.xact():
+			stage = self._stage(table, columns, rows, chunksize)
+			if insert and self.version_info >= (9, 5):
+				# A single INSERT ... ON CONFLICT does not race with
+				# concurrent writers; xmax is zero for the inserted rows.
+				if values:
+					action = 'UPDATE SET ' + ', '.join([
+						x + ' = EXCLUDED.' + x for x in values
+					])
+				else:
+					action = 'NOTHING'
+				total, inserted = self.query_first(
+					'WITH u AS (INSERT INTO ' + table + \
+					' (' + ', '.join(columns) + ') ' \
+					'SELECT ' + ', '.join(['s.' + x for x in columns]) + \
+					' FROM ' + stage + ' AS s ON CONFLICT (' + \
+					', '.join(key) + ') DO ' + action + \
+					' RETURNING (xmax = 0) AS inserted) ' \
+					'SELECT count(*), count(NULLIF(inserted, false)) FROM u'
+				)
+				updated = total - inserted
+			else:
+				updated = 0
+				if values:
+					updated = self.query(
+						'UPDATE ' + table + ' AS t SET ' + ', '.join([
+							x + ' = s.' + x for x in values
+						]) + ' FROM ' + stage + ' AS s WHERE ' + match
+					)[1]
+				inserted = 0
+				if insert:
+					inserted = self.query(
+						'INSERT INTO ' + table + ' (' + ', '.join(columns) + ') ' \
+						'SELECT ' + ', '.join(['s.' + x for x in columns]) + \
+						' FROM ' + stage + ' AS s WHERE NOT EXISTS (' \
+						'SELECT 1 FROM ' + table + ' AS t WHERE ' + match + ')'
+					)[1]
+			self.execute('DROP TABLE ' + stage)
+		return (updated, inserted)
+
+	def bulk_update(self, table, columns, rows, key, chunksize = 1024):
+		return self._bulk(table, columns, rows, key, chunksize, False)[0]
+
+	def bulk_upsert(self, table, columns, rows, key, chunksize = 1024):
+		return self._bulk(table, columns, rows, key, chunksize, True)
+
+	def copy_from_file(self, source, table, columns = None,
+		options = None, chunksize = 0x400000
+	):
+		if chunksize < 1:
+			raise ValueError("invalid chunksize, %r" %(chunksize,))
+		sql = 'COPY ' + table
+		if columns is not None:
+			sql += ' (' + ', '.join([
+				pg_str.quote_ident(x) for x in columns
+			]) + ')'
+		sql += ' FROM STDIN'
+		if options:
+			sql += ' WITH ' + options
+		copy = self.prepare(sql)
+		f = None
+		try:
+			if not hasattr(source, 'read'):
+				f = source = open(source, 'rb')
+			chunks = file_chunks(source, chunksize)
+			try:
+				return copy.load_chunks(chunks)
+			finally:
+				chunks.close()
+		finally:
+			copy.close()
+			if f is not None:
+				f.close()
+
+	def bytea_into(self, buffer, sql, *parameters, chunksize = 0x100000):
+		if chunksize < 1:
+			raise ValueError("invalid chunksize, %r" %(chunksize,))
+		view = memoryview(buffer)
+		if view.itemsize != 1 or view.ndim != 1:
+			if not hasattr(view, 'cast'):
+				# Python 3.2 and earlier
+				raise TypeError("buffer must be a one dimensional buffer of bytes")
+			view = view.cast('B')
+		##
+		# The value is selected, and detoasted, once by the limited subquery,
+		# and its chunks are the rows of a portal. GREATEST gives empty and
+		# NULL values a single row.
+		n = len(parameters) + 1
+		ps = self.prepare(
+			'SELECT c.size, c.i, pg_catalog.substring(c.value FROM c.i FOR $%d) ' \
+			'FROM (' \
+				'SELECT b.size, b.value, pg_catalog.generate_series(' \
+					'1, GREATEST(b.size, 1), $%d' \
+				') FROM (' \
+					'SELECT pg_catalog.octet_length(value), value || \'\'::bytea ' \
+					'FROM (%s) AS bytea_into(value) LIMIT 1' \
+				') AS b(size, value)' \
+			') AS c(size, value, i)' %(n, n, sql)
+		)
+		process_tuple = ps._process_output[0]
+		fail = ps._raise_column_tuple_error
+		portal = self.typio.encode(ID(ps))
+		fetch = (
+			element.Execute(portal, max(1, 0x400000 // chunksize)),
+			element.SynchronizeMessage,
+		)
+		messages = (
+			element.Bind(
+				portal, ps._pq_statement_id, ps._input_formats,
+				ps._pq_parameters(parameters + (chunksize,)),
+				ps._output_formats,
+			),
+		) + fetch
+		size = None
+		# The portal is kept across the fetches by the transaction block.
+		with self.xact():
+			try:
+				while messages:
+					x = xact.Instruction(messages, asynchook = self._receive_async)
+					self._pq_push(x, self)
+					self._pq_complete()
+					messages = ()
+					for m in x.messages_received():
+						typ = m.type
+						if typ is element.Tuple.type:
+							size, i, data = process_tuple(m, fail)
+							if size is None:
+								break
+							if size > len(view):
+								raise ValueError(
+									"buffer of %d bytes cannot hold the %d bytes " \
+									"of the value" %(len(view), size)
+								)
+							# Copied from the received message into the buffer.
+							view[i - 1:i - 1 + len(data)] = data
+						elif typ is element.Suspension.type:
+							messages = fetch
+			finally:
+				self.pq.garbage_cursors.append(portal)
+		return size
+
+	def with_keyset(self, values, typname = 'int8',
+		parameter = 1, threshold = None
+	):
+		return KeySet(self, values, typname, parameter,
+			self.keyset_threshold if threshold is None else threshold
+		)
+
 	def statement_from_id(self, statement_id : str) -> PreparedStatement:
 		ps = PreparedStatement(self, statement_id, None)
 		ps._init()
@@ -1892,6 +2892,9 @@ class Connection(pg_api.Connection):
 		# Use the version_info and integer_datetimes setting to identify
 		# the necessary binary type i/o functions to use.
 		self.backend_id = self.pq.backend_id
+		self._version = None
+		self._activity_row = None
+		self._query_formats = {}
 
 		sv = self.settings.cache.get("server_version", "0.0")
 		self.version_info = pg_version.normalize(pg_version.split(sv))
@@ -1900,24 +2903,16 @@ class Connection(pg_api.Connection):
 			self.settings.cache.get("integer_datetimes", "off").lower() in (
 				't', 'true', 'on', 'yes',
 			),
+			timestamp_output = self.connector.timestamp_output or 'datetime',
 		)
+		self.typio.select_numeric_io(self.connector.numeric_output or 'decimal')
+		self.typio.select_array_io(self.connector.array_output or 'elements')
 		# manual binding
 		self.sys = pg_lib.Binding(self, pg_lib.sys)
 
-		# Get the *full* version string.
-		self.version = self.prepare("SELECT pg_catalog.version()").first()
-		# First word from the version string.
-		self.type = self.version.split()[0]
-
-		r = self.sys.activity_for(self.backend_id)
-		if r is not None:
-			# conditional initialization of client_address.
-			# pythons without ipaddr will likely give strings.
-			ca = r.get('client_addr')
-			if ca is not None:
-				self.client_address = ca.split('/')[0]
-			self.client_port = r.get('client_port')
-			self.backend_start = r.get('backend_start')
+		# version, type, and the pg_stat_activity fields(client_address,
+		# client_port, backend_start) are loaded on first access in order
+		# to keep the bootstrap free of extra round trips.
 		##
 		# Set standard_conforming_strings
 		scstr = self.settings.get('standard_conforming_strings')
@@ -1930,14 +2925,32 @@ class Connection(pg_api.Connection):
 			self.settings['standard_conforming_strings'] = 'on'
 		super().connect()
 
-	def _pq_push(self, xact, controller = None):
+	def _pq_push(self, ins, controller = None):
 		x = self.pq.xact
 		if x is not None:
 			self.pq.complete()
 			self._raise_pq_error(x)
 		if controller is not None:
 			self._controller = controller
-		self.pq.push(xact)
+			effect = getattr(controller, '_settings_effect', 0)
+			if effect:
+				self.settings._statement(effect)
+		if self._xact_queue:
+			# Send the deferred transaction starts along with the instruction.
+			q = ''.join([x[1] for x in self._xact_queue])
+			del self._xact_queue[:]
+			start = xact.Instruction((
+					element.Query(self.typio._encode(q)[0]),
+				),
+				asynchook = self._receive_async
+			)
+			self.pq.pipeline(start, ins)
+			if start.fatal is not None:
+				if self.pq.xact is ins:
+					self.pq.complete()
+				self._raise_pq_error(start)
+		else:
+			self.pq.push(ins)
 
 	def _pq_complete(self):
 		x = self.pq.xact
@@ -2073,9 +3086,12 @@ class Connection(pg_api.Connection):
 		Create a connection based on the given connector.
 		"""
 		self.connector = connector
+		self.row_factory = connector.row_factory
 		self.typio = TypeIO(self)
 		self.typio.set_encoding('ascii')
 		self.settings = Settings(self)
+		# (Transaction, query) pairs of deferred transaction starts.
+		self._xact_queue = []
 # class Connection
 
 class Connector(pg_api.Connector):
@@ -2129,11 +3145,28 @@ class Connector(pg_api.Connector):
 		sslkeyfile : "filepath" = None,
 		sslrootcrtfile : "filepath" = None,
 		sslrootcrlfile : "filepath" = None,
+		numeric_output : ('decimal', 'float', 'int') = None,
+		timestamp_output : ('datetime', 'microseconds') = None,
+		array_output : ('elements', 'array', 'numpy') = None,
+		row_factory : "callable given the column names returning a row constructor" = None,
 		driver = None,
 		**kw
 	):
 		super().__init__(**kw)
 		self.driver = driver
+		if numeric_output is not None \
+		and numeric_output not in pg_typio.numeric_io:
+			raise ValueError("invalid numeric_output: " + repr(numeric_output))
+		self.numeric_output = numeric_output
+		if timestamp_output is not None \
+		and timestamp_output not in ('datetime', 'microseconds'):
+			raise ValueError("invalid timestamp_output: " + repr(timestamp_output))
+		self.timestamp_output = timestamp_output
+		if array_output is not None \
+		and array_output not in ('elements', 'array', 'numpy'):
+			raise ValueError("invalid array_output: " + repr(array_output))
+		self.array_output = array_output
+		self.row_factory = row_factory
 
 		self.server_encoding = server_encoding
 		self.connect_timeout = connect_timeout
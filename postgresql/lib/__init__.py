@@ -15,7 +15,10 @@ interfaces to a PostgreSQL-based application.
 """
 import io
 import os.path
+import errno
 import operator
+import marshal
+import hashlib
 get0 = operator.itemgetter(0)
 from types import ModuleType
 from abc import abstractmethod, abstractproperty
@@ -42,6 +45,7 @@ __all__ = [
 	'Binding',
 	'BoundSymbol',
 	'find_libsql',
+	'load_file',
 	'load',
 ]
 
@@ -200,6 +204,7 @@ class ILF(SymbolCollection):
 		self._name = None
 		s = self.symbolsd = {}
 		self.preload = set()
+		symbols = self._source_symbols = list(symbols)
 		for name, (typ, exe, doc, query) in symbols:
 			if typ and typ not in self.symtypes:
 				raise ValueError("symbol %r has an invalid type: %r" %(name, typ))
@@ -263,6 +268,12 @@ class ILF(SymbolCollection):
 			syms.append((name, (styp, exe, doc, query)))
 		return typ(syms, preface = preface)
 
+	def _set_file(self, filepath):
+		self._address = os.path.abspath(filepath)
+		bn = os.path.basename(filepath)
+		if bn.startswith('lib') and bn.endswith('.sql'):
+			self._name = bn[3:-4] or None
+
 	@classmethod
 	def open(typ, filepath, *args, **kw):
 		"""
@@ -270,23 +281,97 @@ class ILF(SymbolCollection):
 		"""
 		with io.open(filepath, *args, **kw) as fp:
 			r = typ.from_lines(fp)
-			r._address = os.path.abspath(filepath)
-			bn = os.path.basename(filepath)
-			if bn.startswith('lib') and bn.endswith('.sql'):
-				r._name = bn[3:-4] or None
+			r._set_file(filepath)
+		return r
+
+	# Identifies the format of compiled libraries.
+	compiled_magic = 'ILF/1'
+
+	@staticmethod
+	def compiled_path(filepath):
+		"""
+		The path of the compiled form of the library at `filepath`.
+		"""
+		filepath = os.path.abspath(filepath)
+		bn = os.path.basename(filepath) + '.ilfc'
+		if pg_sys.libcache is None:
+			return os.path.join(os.path.dirname(filepath), '__pycache__', bn)
+		return os.path.join(pg_sys.libcache,
+			hashlib.sha1(filepath.encode('utf-8')).hexdigest()[:16] + '-' + bn
+		)
+
+	@classmethod
+	def open_compiled(typ, filepath, encoding = None):
+		"""
+		Create a named ILF library from a file path using its compiled form,
+		`compiled_path`, when it is up to date. Otherwise, parse the file and
+		write the compiled form for the next load.
+
+		The compiled form is current when the file's mtime and size match, or
+		when the SHA-1 of the file's contents does.
+		"""
+		st = os.stat(filepath)
+		cpath = typ.compiled_path(filepath)
+		try:
+			with io.open(cpath, 'rb') as fp:
+				header, digest, preface, syms = marshal.loads(fp.read())
+			if header[:2] != (typ.compiled_magic, encoding):
+				digest = None
+		except Exception:
+			# missing, unreadable, or corrupt; it will be rewritten.
+			digest = None
+		else:
+			if digest is not None and header[2:] == (st.st_mtime, st.st_size):
+				r = typ(syms, preface = preface)
+				r._set_file(filepath)
+				return r
+
+		with io.open(filepath, 'rb') as fp:
+			data = fp.read()
+		sha = hashlib.sha1(data).hexdigest()
+		if sha != digest:
+			text = io.TextIOWrapper(io.BytesIO(data), encoding = encoding)
+			r = typ.from_lines(text)
+			preface = r.preface
+			syms = r._source_symbols
+		else:
+			r = typ(syms, preface = preface)
+		r._set_file(filepath)
+
+		header = (typ.compiled_magic, encoding, st.st_mtime, st.st_size)
+		try:
+			try:
+				os.makedirs(os.path.dirname(cpath))
+			except OSError as err:
+				if err.errno != errno.EEXIST:
+					raise
+			tmp = cpath + '.' + str(os.getpid())
+			with io.open(tmp, 'wb') as fp:
+				fp.write(marshal.dumps((header, sha, preface, syms)))
+			try:
+				os.rename(tmp, cpath)
+			except OSError:
+				# Windows does not rename over an existing file.
+				os.unlink(cpath)
+				os.rename(tmp, cpath)
+		except OSError:
+			# Like Python's bytecode, the compiled form is optional.
+			pass
 		return r
 
 class BoundSymbol(object):
 	"""
 	A symbol bound to a database(connection).
+
+	`statement` is the symbol's already prepared statement, if any.
 	"""
-	def __init__(self, symbol, database):
+	def __init__(self, symbol, database, statement = None):
 		if symbol.type == 'proc':
 			proc = database.proc(symbol)
 			self.method = proc.__call__
 			self.object = proc
 		else:
-			ps = database.prepare(symbol)
+			ps = statement or database.prepare(symbol)
 			m = symbol.method
 			if m is None:
 				self.method = ps.__call__
@@ -302,6 +387,42 @@ class BoundSymbol(object):
 	def _first_column(self, *args, **kw):
 		return map(get0, self.object.rows(*args,**kw))
 
+def _resolve_symbol(library, database, name):
+	"""
+	Get the Symbol named `name` from the `library`; subjective symbols are
+	given the `database`.
+	"""
+	sym = library.get_symbol(name)
+	if sym is None:
+		raise AttributeError(
+			"symbol %r does not exist in library %r" %(
+				name, library.address
+			)
+		)
+	if not isinstance(sym, Symbol):
+		# subjective symbol...
+		sym = sym(database)
+		if not isinstance(sym, Symbol):
+			raise TypeError(
+				"callable symbol, %r, did not produce Symbol instance" %(
+					name,
+				)
+			)
+	return sym
+
+def _bind_symbol(symbol, database, statement = None):
+	"""
+	Bind the `symbol` to the `database`. 'const' symbols are executed, and
+	their results are returned in place of a `BoundSymbol`.
+	"""
+	if symbol.type == 'const':
+		r = BoundSymbol(symbol, database, statement)()
+		if symbol.method in ('chunks', 'rows', 'column'):
+			# resolve the iterator
+			r = list(r)
+		return r
+	return BoundSymbol(symbol, database, statement)
+
 class Binding(object):
 	"""
 	Interface to a library bound to a database(connection).
@@ -312,9 +433,9 @@ class Binding(object):
 			'__symbol_library__' : library,
 			'__symbol_cache__' : {},
 		})
-		for x in library.preload:
+		if library.preload:
 			# cache all preloaded symbols.
-			getattr(self, x)
+			self.__preload__(library.preload)
 
 	def __repr__(self):
 		return '<Binding: lib%s on %r>' %(
@@ -325,6 +446,32 @@ class Binding(object):
 	def __dir__(self):
 		return dir(super()) + list(self.__symbol_library__.symbols())
 
+	def __preload__(self, names = None):
+		"""
+		Bind and cache the symbols named in `names`; all of the library's
+		symbols when `names` is `None`.
+
+		The statements of the symbols are prepared together with
+		``prepare_many`` so that warming a library takes one round trip.
+		"""
+		d = self.__dict__
+		s = d['__symbol_cache__']
+		db = d['__database__']
+		lib = d['__symbol_library__']
+		if names is None:
+			names = lib.symbols()
+
+		syms = []
+		for name in names:
+			if name not in s:
+				syms.append((name, _resolve_symbol(lib, db, name)))
+		stmts = [x for x in syms if x[1].type != 'proc']
+		pss = dict(zip(
+			map(get0, stmts), db.prepare_many([x[1] for x in stmts])
+		))
+		for name, sym in syms:
+			s[name] = _bind_symbol(sym, db, pss.get(name))
+
 	def __getattr__(self, name):
 		"""
 		Return a BoundSymbol against the Binding's database with the symbol named
@@ -338,30 +485,7 @@ class Binding(object):
 		bs = s.get(name)
 		if bs is None:
 			# No symbol cached with that name.
-			sym = lib.get_symbol(name)
-			if sym is None:
-				raise AttributeError(
-					"symbol %r does not exist in library %r" %(
-						name, lib.address
-					)
-				)
-			if not isinstance(sym, Symbol):
-				# subjective symbol...
-				sym = sym(db)
-				if not isinstance(sym, Symbol):
-					raise TypeError(
-						"callable symbol, %r, did not produce Symbol instance" %(
-							name,
-						)
-					)
-			if sym.type == 'const':
-				r = BoundSymbol(sym, db)()
-				if sym.method in ('chunks', 'rows', 'column'):
-					# resolve the iterator
-					r = list(r)
-				bs = s[name] = r
-			else:
-				bs = s[name] = BoundSymbol(sym, db)
+			bs = s[name] = _bind_symbol(_resolve_symbol(lib, db, name), db)
 		return bs
 
 class Category(pg_api.Category):
@@ -373,6 +497,13 @@ class Category(pg_api.Category):
 		yield ('aliases', {k.name: v for k, v in self.aliases.items()})
 
 	def __init__(self, *libs, **named_libs):
+		# Library references are loaded with `load`, so Categories
+		# referring to the same file share the Library object.
+		libs = [x if isinstance(x, Library) else load(x) for x in libs]
+		named_libs = {
+			k : (v if isinstance(v, Library) else load(v))
+			for k, v in named_libs.items()
+		}
 		sl = set(libs)
 		nl = set(named_libs.values())
 		self._direct = sl
@@ -406,6 +537,24 @@ def find_libsql(libname, paths, prefix = 'lib', suffix = '.sql'):
 		if os.path.exists(p):
 			yield p
 
+# Libraries loaded from files; path -> (mtime, size, Library)
+loaded = {}
+
+def load_file(filepath):
+	"""
+	Get the Library for the ILF at `filepath`. The Library is shared with
+	earlier loads of the file unless the file has since been modified.
+	"""
+	filepath = os.path.abspath(filepath)
+	st = os.stat(filepath)
+	key = (st.st_mtime, st.st_size)
+	cached = loaded.get(filepath)
+	if cached is not None and cached[:2] == key:
+		return cached[2]
+	lib = ILF.open_compiled(filepath)
+	loaded[filepath] = key + (lib,)
+	return lib
+
 def load(libref):
 	"""
 	Given a reference to a symbol library, instantiate the Library instance.
@@ -414,6 +563,8 @@ def load(libref):
 
 	 * `str` objects as absolute paths or relative to sys.libpath.
 	 * Module objects.
+
+	ILF files are loaded with `load_file`.
 	"""
 	if isinstance(libref, ModuleType):
 		if hasattr(libref, '__lib'):
@@ -425,14 +576,16 @@ def load(libref):
 		try:
 			if os.path.sep in libref:
 				# sep in libref? it's treated as a path.
-				lib = ILF.open(libref)
+				lib = load_file(libref)
 			else:
 				# first one wins.
 				for x in find_libsql(libref, pg_sys.libpath):
 					break
 				else:
-					raise LoadError("library %r not in postgresql.sys.libpath")
-				lib = ILF.open(x)
+					raise pg_exc.LoadError(
+						"library %r not in postgresql.sys.libpath" %(libref,)
+					)
+				lib = load_file(x)
 		except pg_exc.LoadError:
 			raise
 		except Exception:
@@ -14,7 +14,9 @@ SELECT
  bt.typrelid,
  ae.oid AS ae_typid,
  ae.typreceive::oid != 0 AS ae_hasbin_input,
- ae.typsend::oid != 0 AS ae_hasbin_output
+ ae.typsend::oid != 0 AS ae_hasbin_output,
+ bt.typreceive::oid != 0 AS hasbin_input,
+ bt.typsend::oid != 0 AS hasbin_output
 FROM pg_catalog.pg_type bt
  LEFT JOIN pg_type ae
   ON (
@@ -15,10 +15,15 @@ from .typstruct import long_pack
 def cat_messages(messages):
 	blen = bytes.__len__
 	lpack = long_pack
+	join_buffers = element.join_buffers
 	return b''.join([
-		x.bytes() if x.__class__ is not bytes else (
+		(
 			b'd' + lpack(blen(x) + 4) + x
-		) for x in messages
+		) if x.__class__ is bytes else (
+			# copy data mapped from a file; a view of bytes
+			b''.join((b'd', lpack(len(x) + 4), x if join_buffers else bytes(x)))
+		) if x.__class__ is memoryview else x.bytes()
+		for x in messages
 	])
 try:
 	from .optimized import cat_messages
@@ -172,6 +177,8 @@ class Connection(object):
 		if negxact.state is xact.Complete and negxact.fatal is None:
 			self.key = negxact.killinfo.key
 			self.backend_id = negxact.killinfo.pid
+			# Negotiation keeps the Ready message, not its transaction state.
+			self.state = negxact.last_ready.xact_state
 		elif not hasattr(self.xact, 'error_message'):
 			# if it's not complete, something strange happened.
 			# make sure to clean up...
@@ -253,6 +260,12 @@ class Connection(object):
 				)
 				return False
 
+			if len(self.read_data) == RECV_BYTES \
+			and RECV_BYTES < self.max_recvsize:
+				# Still waiting for a message after filling the read;
+				# read more at a time for large messages.
+				RECV_BYTES <<= 1
+
 			# Got data. Put it in the buffer and clear read_data.
 			self.read_data = BUFFER_WRITE_MSG(self.read_data)
 		return True
@@ -276,12 +289,12 @@ class Connection(object):
 		is fatal or not.
 		"""
 		SEND_DATA = self.socket.send
+		# Slicing the view on partial sends doesn't copy the rest of the data.
+		data = memoryview(self.message_data)
 		try:
-			while self.message_data:
+			while data:
 				# Send data while there is data to send.
-				self.message_data = self.message_data[
-					SEND_DATA(self.message_data):
-				]
+				data = data[SEND_DATA(data):]
 		except self.socket_factory.fatal_exception as e:
 			msg = self.socket_factory.fatal_exception_message(e)
 			if msg is not None:
@@ -299,6 +312,10 @@ class Connection(object):
 			else:
 				# It wasn't fatal, so just raise
 				raise
+		finally:
+			# Keep what wasn't sent for the next attempt.
+			if len(data) != len(self.message_data):
+				self.message_data = bytes(data)
 		return True
 
 	def standard_write_messages(self, messages):
@@ -383,6 +400,29 @@ class Connection(object):
 				# start it up
 				self.step()
 
+	def pipeline(self, x, y):
+		"""
+		Complete the transaction `x` after sending the messages of `y`, and
+		setup `y` to be processed. This saves the round trip that would be
+		spent waiting for `x` before sending `y`.
+		"""
+		S = xact.Sending
+		self.push(x)
+		if self.xact is x:
+			while y.state[0] is S and x.fatal is None:
+				try:
+					if self.write_messages(y.messages):
+						y.state[1]()
+				except self.socket_factory.try_again_exception as e:
+					if not self.socket_factory.try_again(e):
+						raise
+			self.complete()
+		if self.xact is None:
+			if y.state[0] is S:
+				self.push(y)
+			else:
+				self.xact = y
+
 	def step(self):
 		"""
 		Make a single transition on the transaction.
@@ -503,6 +543,8 @@ class Connection(object):
 
 		self.message_buffer = pq_message_stream()
 		self.recvsize = 2048
+		# the limit on the size of reads made while receiving large messages
+		self.max_recvsize = 0x100000
 
 		self.read = ()
 		# bytes received.
@@ -10,13 +10,26 @@ from struct import unpack, Struct
 from .message_types import message_types
 from .typstruct import ushort_pack, ushort_unpack, ulong_pack, ulong_unpack
 
+##
+# Before Python 3.4, bytes.join only takes bytes, so other buffers of bytes
+# are copied into bytes before they are joined.
+try:
+	b''.join((memoryview(b''),))
+	join_buffers = True
+except TypeError:
+	join_buffers = False
+
 def pack_tuple_data(atts):
-	return b''.join([
-		b'\xff\xff\xff\xff'
-		if x is None
-		else (ulong_pack(len(x)) + x)
-		for x in atts
-	])
+	# Join the length words and the data at once; the data may be any
+	# buffer of bytes, and it's only copied into the result.
+	l = []
+	for x in atts:
+		if x is None:
+			l.append(b'\xff\xff\xff\xff')
+		else:
+			l.append(ulong_pack(len(x)))
+			l.append(x if join_buffers or x.__class__ is bytes else bytes(x))
+	return b''.join(l)
 
 try:
 	from .optimized import parse_tuple_message, pack_tuple_data
@@ -729,6 +742,64 @@ class Bind(Message):
 
 		return typ(name, statement, aformats, args, rformats)
 
+class BindTemplate(object):
+	"""
+	The constant parts of a `Bind` message serialized ahead of time.
+
+	BindTemplate(
+		name,      # Portal/Cursor identifier
+		statement, # Prepared Statement name/identifier
+		aformats,  # Argument formats; Sequence of BinaryFormat or StringFormat.
+		rformats,  # Result formats; Sequence of BinaryFormat or StringFormat.
+	)
+
+	Calling the template with the argument data gives a `TemplateBind`
+	message whose serialization only packs the arguments.
+	"""
+	__slots__ = ('name', 'statement', 'aformats', 'rformats', 'head', 'tail')
+
+	def __init__(self, name, statement, aformats, rformats):
+		self.name = name
+		self.statement = statement
+		self.aformats = tuple(aformats)
+		self.rformats = tuple(rformats)
+		self.head = name + b'\x00' + statement + b'\x00' + \
+			ushort_pack(len(self.aformats)) + b''.join(self.aformats)
+		self.tail = ushort_pack(len(self.rformats)) + b''.join(self.rformats)
+
+	def __repr__(self):
+		return '%s.%s(%r, %r, %r, %r)' %(
+			type(self).__module__,
+			type(self).__name__,
+			self.name, self.statement, self.aformats, self.rformats,
+		)
+
+	def __call__(self, arguments):
+		return TemplateBind(self, arguments)
+
+class TemplateBind(Message):
+	"""
+	A `Bind` message produced by a `BindTemplate`.
+	"""
+	type = Bind.type
+	__slots__ = ('template', 'arguments')
+
+	def __init__(self, template, arguments):
+		self.template = template
+		self.arguments = arguments
+
+	def serialize(self):
+		t = self.template
+		args = self.arguments
+		return b''.join((
+			t.head, ushort_pack(len(args)),
+			pack_tuple_data(tuple(args)), t.tail
+		))
+
+	@classmethod
+	def parse(typ, message_data):
+		return Bind.parse(message_data)
+
 class Execute(Message):
 	"""Fetch results from the specified Portal"""
 	type = message_types[b'E'[0]]
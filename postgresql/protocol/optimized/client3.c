@@ -8,6 +8,28 @@
 #define include_client3_functions \
 	mFUNC(cat_messages, METH_O, "cat the serialized form of the messages in the given list") \
 
+/*
+ * Copy data is given as bytes, or as memoryviews of the mapped data of a file.
+ */
+#define copy_data_check(ob) (PyBytes_CheckExact(ob) || PyMemoryView_Check(ob))
+
+/*
+ * Get the data of the copy line, `ob`. Returns -1 with an error set on failure.
+ * The view must be released when view->obj is not NULL.
+ */
+static int
+get_copy_data(PyObject *ob, Py_buffer *view)
+{
+	if (PyBytes_CheckExact(ob))
+	{
+		view->buf = PyBytes_AS_STRING(ob);
+		view->len = PyBytes_GET_SIZE(ob);
+		view->obj = NULL;
+		return(0);
+	}
+	return(PyObject_GetBuffer(ob, view, PyBUF_SIMPLE));
+}
+
 static PyObject *
 cat_messages(PyObject *self, PyObject *messages_in)
 {
@@ -39,22 +61,27 @@ cat_messages(PyObject *self, PyObject *messages_in)
 		/*
 		 * Choose the path, lots of copy data or more singles to serialize?
 		 */
-		if (PyBytes_CheckExact(ob))
+		if (copy_data_check(ob))
 		{
 			Py_ssize_t eofc = cmsg;
 			Py_ssize_t xsize = 0;
 			/* find the last of the copy data (eofc) */
 			do
 			{
+				Py_buffer view;
 				++eofc;
+				if (get_copy_data(ob, &view) < 0)
+					goto fail;
 				/* increase in size to allocate for the adjacent copy messages */
-				xsize += PyBytes_GET_SIZE(ob);
+				xsize += view.len;
+				if (view.obj != NULL)
+					PyBuffer_Release(&view);
 				if (eofc >= nmsgs)
 					break; /* end of messages in the list? */
 
 				/* Grab the next message. */
 				ob = PyList_GET_ITEM(msgs, eofc);
-			} while(PyBytes_CheckExact(ob));
+			} while(copy_data_check(ob));
 
 			/*
 			 * Either the end of the list or `ob` is not a data object meaning
@@ -81,21 +108,26 @@ cat_messages(PyObject *self, PyObject *messages_in)
 
 			/*
 			 * Make the final pass through the copy lines memcpy'ing the data from
-			 * the bytes() objects.
+			 * the bytes() and memoryview objects.
 			 */
 			while (cmsg < eofc)
 			{
+				Py_buffer view;
 				uint32_t msg_length;
 				char *localbuf = buf + bufpos + 1;
 				buf[bufpos] = 'd'; /* COPY data message type */
 
 				ob = PyList_GET_ITEM(msgs, cmsg);
-				msg_length = PyBytes_GET_SIZE(ob) + 4;
+				if (get_copy_data(ob, &view) < 0)
+					goto fail;
+				msg_length = view.len + 4;
 
 				bufpos = bufpos + 1 + msg_length;
 				msg_length = local_ntohl(msg_length);
 				memcpy(localbuf, &msg_length, 4);
-				memcpy(localbuf + 4, PyBytes_AS_STRING(ob), PyBytes_GET_SIZE(ob));
+				memcpy(localbuf + 4, view.buf, view.len);
+				if (view.obj != NULL)
+					PyBuffer_Release(&view);
 				++cmsg;
 			}
 		}
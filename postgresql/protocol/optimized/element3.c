@@ -51,6 +51,15 @@ _pack_tuple_data(PyObject *tup)
 		{
 			bufsize = bufsize + PyBytes_GET_SIZE(ob) + 4;
 		}
+		else if (PyObject_CheckBuffer(ob))
+		{
+			/* bytearray, memoryview, and other buffers of bytes */
+			Py_buffer view;
+			if (PyObject_GetBuffer(ob, &view, PyBUF_SIMPLE) < 0)
+				return(NULL);
+			bufsize = bufsize + view.len + 4;
+			PyBuffer_Release(&view);
+		}
 		else
 		{
 			PyErr_Format(
@@ -86,8 +95,21 @@ _pack_tuple_data(PyObject *tup)
 		}
 		else
 		{
-			Py_ssize_t size = PyBytes_GET_SIZE(ob);
+			Py_buffer view;
+			Py_ssize_t size;
 			uint32_t msg_size;
+			if (PyBytes_CheckExact(ob))
+			{
+				view.buf = PyBytes_AS_STRING(ob);
+				view.len = PyBytes_GET_SIZE(ob);
+				view.obj = NULL;
+			}
+			else if (PyObject_GetBuffer(ob, &view, PyBUF_SIMPLE) < 0)
+			{
+				free(buf);
+				return(NULL);
+			}
+			size = view.len;
 			if (size > 0xFFFFFFFE)
 			{
 				PyErr_Format(PyExc_OverflowError,
@@ -98,8 +120,10 @@ _pack_tuple_data(PyObject *tup)
 			msg_size = local_ntohl((uint32_t) size);
 			memcpy(bufpos, &msg_size, 4);
 			bufpos = bufpos + 4;
-			memcpy(bufpos, PyBytes_AS_STRING(ob), PyBytes_GET_SIZE(ob));
-			bufpos = bufpos + PyBytes_GET_SIZE(ob);
+			memcpy(bufpos, view.buf, size);
+			bufpos = bufpos + size;
+			if (view.obj != NULL)
+				PyBuffer_Release(&view);
 		}
 	}
 
@@ -0,0 +1,338 @@
+##
+# copyright 2009, James William Pye
+# http://python.projects.postgresql.org
+##
+"""
+Record and replay PQ version 3.0 sessions.
+
+A capture is a sequence of frames written to a file. Each frame consists of a
+direction byte, the length of the frame's data, and the data itself:
+
+ ``<``
+  Data received from the server.
+
+ ``>``
+  Data sent to the server.
+
+ ``=``
+  A connection parameter, serialized as a ShowOption message body. These are
+  written when the recording starts so that the replay can configure type I/O
+  and the client encoding.
+
+`record` attaches a `RecordingSocket` to an established
+`postgresql.protocol.client3.Connection`. `replay` feeds the received data back
+through a new `postgresql.protocol.client3.Connection` using a `ReplaySocket`,
+so the protocol paths can be exercised at memory speed and without a server.
+The sent data is used to reconstruct the `postgresql.protocol.xact3.Instruction`
+objects that drove the original session.
+"""
+import struct
+from .. import versionstring as pg_version
+from . import element3 as element
+from . import xact3 as xact
+from . import client3 as client
+from . import typio
+from .buffer import pq_message_stream
+from ..python.socket import SocketFactory
+
+__all__ = [
+	'RecordingSocket',
+	'ReplaySocket',
+	'ReplaySocketFactory',
+	'TypeIO',
+	'record',
+	'read_capture',
+	'write_capture',
+	'frontend_messages',
+	'instructions',
+	'connection',
+	'replay',
+]
+
+Received = b'<'
+Sent = b'>'
+Parameter = b'='
+
+frame_header = struct.Struct("!cL")
+
+def write_capture(capture, frames):
+	"""
+	Write the (direction, data) pairs in `frames` to the `capture` file object.
+	"""
+	pack = frame_header.pack
+	for direction, data in frames:
+		capture.write(pack(direction, len(data)) + data)
+
+def read_capture(capture) -> [(bytes, bytes)]:
+	"""
+	Read the (direction, data) pairs from the `capture` file object.
+	"""
+	frames = []
+	unpack = frame_header.unpack
+	size = frame_header.size
+	while True:
+		header = capture.read(size)
+		if not header:
+			break
+		if len(header) < size:
+			raise ValueError("truncated frame header in capture")
+		direction, length = unpack(header)
+		if direction not in (Received, Sent, Parameter):
+			raise ValueError("invalid frame direction %r in capture" %(direction,))
+		data = capture.read(length)
+		if len(data) < length:
+			raise ValueError("truncated frame data in capture")
+		frames.append((direction, data))
+	return frames
+
+def received_data(frames):
+	'the data received from the server'
+	return [x[1] for x in frames if x[0] == Received]
+
+def sent_data(frames):
+	'the data sent to the server'
+	return b''.join([x[1] for x in frames if x[0] == Sent])
+
+def parameters(frames):
+	'the connection parameters written at the start of the recording'
+	return dict([
+		(msg.name.decode('ascii'), msg.value.decode('ascii'))
+		for msg in (
+			element.ShowOption.parse(x[1]) for x in frames if x[0] == Parameter
+		)
+	])
+
+class RecordingSocket(object):
+	"""
+	Socket wrapper writing the data sent and received to a capture.
+	"""
+	def __init__(self, socket, capture):
+		self.socket = socket
+		self.capture = capture
+
+	def recv(self, size):
+		data = self.socket.recv(size)
+		if data:
+			write_capture(self.capture, ((Received, data),))
+		return data
+
+	def send(self, data):
+		sent = self.socket.send(data)
+		write_capture(self.capture, ((Sent, data[:sent]),))
+		return sent
+
+	def __getattr__(self, name):
+		return getattr(self.socket, name)
+
+def record(pq, capture, parameters = {}):
+	"""
+	Start recording the data sent and received by the given
+	`postgresql.protocol.client3.Connection` to the `capture` file object.
+
+	`parameters` is a mapping of setting names to values describing the
+	connection's configuration; normally, the connection's settings cache.
+	"""
+	write_capture(capture, [
+		(Parameter, element.ShowOption(
+			k.encode('ascii'), str(v).encode('ascii')
+		).serialize())
+		for k, v in parameters.items() if v is not None
+	])
+	pq.socket = RecordingSocket(pq.socket, capture)
+
+class ReplaySocket(object):
+	"""
+	Socket serving the received data of a capture from memory.
+
+	Data given to `send` is discarded.
+	"""
+	def __init__(self, received):
+		self.received = list(received)
+		self.received.reverse()
+
+	def recv(self, size):
+		if not self.received:
+			return b''
+		data = self.received.pop()
+		if len(data) > size:
+			self.received.append(data[size:])
+			data = data[:size]
+		return data
+
+	def send(self, data):
+		return len(data)
+
+	def sendall(self, data):
+		pass
+
+	def close(self):
+		pass
+
+class ReplaySocketFactory(SocketFactory):
+	'`postgresql.python.socket.SocketFactory` producing `ReplaySocket`s'
+	def __init__(self, frames):
+		self.received = received_data(frames)
+
+	def secure(self, socket):
+		raise TypeError("replayed sessions cannot be secured")
+
+	def __call__(self, timeout = None):
+		return ReplaySocket(self.received)
+
+	def __str__(self):
+		return 'replay'
+
+# Frontend messages that have no subtype.
+frontend_message_types = {
+	x.type : x for x in (
+		element.Query,
+		element.Function,
+		element.Parse,
+		element.Bind,
+		element.Execute,
+		element.Synchronize,
+		element.Flush,
+		element.CopyData,
+		element.CopyDone,
+		element.CopyFail,
+		element.Disconnect,
+		element.Password,
+	)
+}
+
+# Frontend messages identified by their subtype.
+frontend_message_subtypes = {
+	element.Describe.type : {
+		x.subtype : x for x in (element.DescribeStatement, element.DescribePortal)
+	},
+	element.Close.type : {
+		x.subtype : x for x in (element.CloseStatement, element.ClosePortal)
+	},
+}
+
+def frontend_messages(data):
+	"""
+	Parse the messages sent to the server after the connection was established.
+	"""
+	buf = pq_message_stream()
+	buf.write(data)
+	msgs = []
+	for typ, body in buf.read():
+		subtypes = frontend_message_subtypes.get(typ)
+		if subtypes is not None:
+			msgs.append(subtypes[body[0:1]].parse(body))
+		else:
+			msgs.append(frontend_message_types[typ].parse(body))
+	return msgs
+
+# Commands that imply the end of an instruction.
+instruction_terminators = (
+	element.Synchronize.type,
+	element.Query.type,
+	element.Function.type,
+)
+copy_message_types = (
+	element.CopyData.type,
+	element.CopyDone.type,
+	element.CopyFail.type,
+)
+
+def instructions(messages):
+	"""
+	Group the frontend messages into the commands of the instructions that
+	sent them. Yields pairs of (commands, copy_data) where `copy_data` is
+	the sequence of CopyData messages sent during a COPY FROM STDIN.
+	"""
+	# The COPY data follows the terminator of its instruction,
+	# so a terminated instruction is held until the next command.
+	terminated = None
+	commands = []
+	copy = []
+	for msg in messages:
+		typ = msg.type
+		if typ in copy_message_types:
+			if typ is element.CopyData.type:
+				copy.append(msg)
+			continue
+		elif typ is element.Disconnect.type:
+			break
+		if terminated is not None:
+			yield (terminated, copy)
+			terminated = None
+			copy = []
+		commands.append(msg)
+		if typ in instruction_terminators:
+			terminated = commands
+			commands = []
+	if terminated is not None:
+		yield (terminated, copy)
+		copy = []
+	if commands:
+		yield (commands, copy)
+
+class TypeIO(typio.TypeIO):
+	"""
+	`postgresql.protocol.typio.TypeIO` configured from the parameters of a
+	capture. Types without local I/O routines are treated as text.
+	"""
+	def lookup_type_info(self, typid):
+		return None
+
+	def lookup_composite_type_info(self, typid):
+		return ()
+
+	def __init__(self, parameters):
+		super().__init__()
+		self.set_encoding(parameters.get('client_encoding', 'utf-8'))
+		self.select_time_io(
+			pg_version.normalize(
+				pg_version.split(parameters.get('server_version', '8.4'))
+			),
+			parameters.get('integer_datetimes', 'on').lower() in (
+				't', 'true', 'on', 'yes',
+			),
+		)
+
+def connection(frames):
+	"""
+	Create a `postgresql.protocol.client3.Connection` that is established
+	against a `ReplaySocket` serving the received data in `frames`.
+	"""
+	sf = ReplaySocketFactory(frames)
+	pq = client.Connection(sf, {})
+	pq.socket = sf()
+	# The recording starts after negotiation.
+	pq.xact = None
+	pq.state = b'I'
+	return pq
+
+def replay(frames, asynchook = xact.return_arg) -> [xact.Instruction]:
+	"""
+	Replay the session recorded in `frames` through a
+	`postgresql.protocol.client3.Connection` and return the completed
+	instructions.
+	"""
+	pq = connection(frames)
+	xacts = []
+	for commands, copy in instructions(frontend_messages(sent_data(frames))):
+		x = xact.Instruction(commands, asynchook = asynchook)
+		xacts.append(x)
+		pq.push(x)
+		if copy:
+			# Get the COPY started, then feed it the recorded data.
+			while x.state is not xact.Complete:
+				if getattr(x, 'CopyFailSequence', None) is not None \
+				and x.messages is x.CopyFailSequence:
+					break
+				pq.step()
+			else:
+				break
+			x.messages = copy
+			while x.messages is not x.CopyFailSequence:
+				pq.step()
+			x.messages = x.CopyDoneSequence
+		if pq.xact is not None:
+			pq.complete()
+		if x.fatal is True:
+			break
+	return xacts
@@ -0,0 +1,799 @@
+##
+# copyright 2009, James William Pye
+# http://python.projects.postgresql.org
+##
+"""
+Scriptable PQ version 3.0 backend.
+
+This is *not* PostgreSQL. It speaks enough of the protocol to exercise a
+client--connection establishment, the simple and extended query protocols,
+COPY, and cancellation--while answering queries with the synthetic responses
+given to its `Server`. It is intended for load testing the client side in
+isolation; no SQL is interpreted.
+
+A script is a sequence of ``(pattern, response)`` pairs. The first pattern
+found in the query string selects the response. Queries that match nothing
+complete as a command named after the first word of the query::
+
+	>>> from postgresql.protocol import server3
+	>>> srv = server3.Server([
+	...  (r'FROM numbers', server3.synthetic(1000, width = 64)),
+	...  (r'FROM nowhere', server3.Failure('42P01', 'relation does not exist')),
+	... ], latency = 0.001)
+	>>> srv.start()
+	>>> sf = srv.socket_factory()
+	>>> srv.stop()
+
+Each connection is served by its own thread. When serving many connections,
+consider reducing the thread stack size with `threading.stack_size`.
+"""
+import re
+import os
+import socket
+import socketserver
+from threading import Thread, Event, Lock
+from itertools import count
+from .. import types as pg_types
+from . import element3 as element
+from . import typstruct as ts
+from . import typio
+from .buffer import pq_message_stream
+from ..python.socket import SocketFactory
+
+__all__ = [
+	'Response',
+	'Command',
+	'Rows',
+	'CopyOut',
+	'CopyIn',
+	'Failure',
+	'synthetic',
+	'driver_script',
+	'Backend',
+	'Server',
+]
+
+# Oids of the binary time I/O selected by integer_datetimes = on.
+time_io = ts.time64_io
+
+def pack(typid, value, binary):
+	'serialize the `value` of the type identified by `typid`'
+	if value is None:
+		return None
+	if binary:
+		io = time_io.get(typid) or typio.oid_to_io.get(typid) \
+			or ts.oid_to_io.get(typid)
+		if io is not None and io[0] is not None:
+			return io[0](value)
+	if type(value) is bool:
+		return b't' if value else b'f'
+	if type(value) is bytes:
+		return value
+	return str(value).encode('utf-8')
+
+class Response(object):
+	"""
+	A synthetic response to a query.
+
+	`parameters` is the sequence of parameter type Oids reported when the
+	statement is described. When it is None, a ``text`` parameter is reported
+	for each distinct ``$n`` in the query. `latency` is the number of seconds
+	to wait before the response is executed.
+	"""
+	parameters = None
+	latency = 0
+
+	def __init__(self, parameters = None, latency = 0):
+		self.parameters = parameters
+		self.latency = latency
+
+	def describe(self, formats = ()):
+		return element.NoDataMessage
+
+class Command(Response):
+	'A command that produces no rows, such as an INSERT or a SET'
+
+	def __init__(self, tag, **kw):
+		super().__init__(**kw)
+		self.tag = tag.encode('ascii') if isinstance(tag, str) else tag
+
+class Rows(Response):
+	"""
+	A row producing statement.
+
+	`columns` is a sequence of ``(name, type_oid)`` pairs and `rows` is a
+	sequence of tuples of Python objects. The serialized rows are cached
+	for each combination of result formats.
+	"""
+	def __init__(self, columns, rows, tag = None, **kw):
+		super().__init__(**kw)
+		self.columns = tuple(columns)
+		self.rows = rows
+		tag = tag or 'SELECT %d' %(len(rows),)
+		self.tag = tag.encode('ascii') if isinstance(tag, str) else tag
+		self._cache = {}
+		self._lock = Lock()
+
+	def describe(self, formats = ()):
+		return element.TupleDescriptor([
+			(name.encode('utf-8'), 0, 0, typid, -1, -1, fmt)
+			for (name, typid), fmt in zip(self.columns, self.formats(formats))
+		])
+
+	def formats(self, formats):
+		'the format code of each column for the given Bind result formats'
+		if not formats:
+			return (0,) * len(self.columns)
+		elif len(formats) == 1:
+			return (formats[0] == element.BinaryFormat and 1 or 0,) * len(self.columns)
+		return tuple([
+			x == element.BinaryFormat and 1 or 0 for x in formats
+		])
+
+	def serialized(self, formats = ()):
+		'the list of serialized Tuple messages for the given result formats'
+		formats = self.formats(formats)
+		data = self._cache.get(formats)
+		if data is None:
+			typids = [x[1] for x in self.columns]
+			with self._lock:
+				data = self._cache[formats] = [
+					element.Tuple([
+						pack(typid, v, fmt)
+						for typid, v, fmt in zip(typids, row, formats)
+					]).bytes() for row in self.rows
+				]
+		return data
+
+class CopyOut(Response):
+	"""
+	A ``COPY ... TO STDOUT`` statement sending the given `lines`.
+	"""
+	def __init__(self, lines, **kw):
+		super().__init__(**kw)
+		self.lines = lines
+		self.tag = ('COPY %d' %(len(lines),)).encode('ascii')
+		self.data = b''.join([element.CopyData(x).bytes() for x in lines])
+
+class CopyIn(Response):
+	"""
+	A ``COPY ... FROM STDIN`` statement. The received data is discarded,
+	but the lines are counted for the command's tag.
+	"""
+	def __init__(self, columns = 1, **kw):
+		super().__init__(**kw)
+		self.columns = columns
+
+class Failure(Response):
+	'A statement that fails with the given error'
+
+	def __init__(self, code, message, **kw):
+		super().__init__(**kw)
+		self.code = code
+		self.message = message
+
+	def error(self):
+		return element.Error(
+			severity = b'ERROR',
+			code = self.code.encode('ascii'),
+			message = self.message.encode('utf-8'),
+		)
+
+class Declare(Command):
+	'DECLARE of a cursor selecting the rows of the `response`'
+
+	def __init__(self, name, response):
+		super().__init__(b'DECLARE CURSOR')
+		self.name = name
+		self.response = response
+
+class Fetch(Response):
+	'FETCH or MOVE on a declared cursor'
+
+	def __init__(self, command, whence, quantity, name):
+		super().__init__()
+		self.command = command
+		self.whence = whence
+		self.quantity = quantity
+		self.name = name
+
+class CloseCursor(Command):
+	'CLOSE of a declared cursor'
+
+	def __init__(self, name):
+		super().__init__(b'CLOSE CURSOR')
+		self.name = name
+
+class Savepoint(Command):
+	"""
+	SAVEPOINT, RELEASE, or ROLLBACK TO of a savepoint. The transaction block
+	stays open, and ROLLBACK TO recovers a failed block.
+	"""
+
+	def __init__(self, command):
+		super().__init__(command.split(None, 1)[0])
+		self.command = command
+
+def synthetic(count, width = 32, **kw):
+	"""
+	Create a `Rows` response with `count` rows of an ``int4`` and
+	a ``text`` of `width` characters.
+	"""
+	text = 'x' * width
+	return Rows(
+		(('i', pg_types.INT4OID), ('t', pg_types.TEXTOID)),
+		[(x, text) for x in range(count)], **kw
+	)
+
+# Responses allowing `postgresql.driver` connections to be established.
+driver_script = (
+	(r'pg_catalog\.version\(\)', Rows(
+		(('version', pg_types.TEXTOID),),
+		(('PostgreSQL 8.4.0 on server3, compiled by Python',),),
+	)),
+	(r'procpid = \$1', Rows(
+		(('procpid', pg_types.INT4OID),), (),
+		parameters = (pg_types.INT4OID,),
+	)),
+)
+
+default_parameters = {
+	'server_version' : '8.4.0',
+	'server_encoding' : 'UTF8',
+	'client_encoding' : 'UTF8',
+	'integer_datetimes' : 'on',
+	'standard_conforming_strings' : 'on',
+	'DateStyle' : 'ISO, MDY',
+	'TimeZone' : 'UTC',
+}
+
+# Transaction status by the first word of a command tag. Savepoint commands
+# are matched by `savepoint_pattern` first as the tag of ROLLBACK TO is
+# ROLLBACK.
+xact_commands = {
+	b'BEGIN' : b'T',
+	b'START' : b'T',
+	b'COMMIT' : b'I',
+	b'END' : b'I',
+	b'ROLLBACK' : b'I',
+	b'ABORT' : b'I',
+}
+placeholder = re.compile(br'\$([0-9]+)')
+
+cursor_name = br'("(?:[^"]|"")+"|[^\s;]+)'
+declare_pattern = re.compile(
+	br'^\s*DECLARE\s+' + cursor_name + br'\s.*?\bCURSOR\b.*?\bFOR\s+(.*)$',
+	re.I | re.S
+)
+fetch_pattern = re.compile(
+	br'^\s*(FETCH|MOVE)\s+' \
+	br'(?:(FORWARD|BACKWARD|ABSOLUTE|RELATIVE|NEXT|PRIOR|FIRST|LAST)\s*)?' \
+	br'(ALL|[-+]?[0-9]+)?\s*(?:IN|FROM)\s+' + cursor_name + br'\s*;?\s*$',
+	re.I
+)
+close_pattern = re.compile(br'^\s*CLOSE\s+' + cursor_name, re.I)
+savepoint_pattern = re.compile(
+	br'^\s*(SAVEPOINT|RELEASE|ROLLBACK(?:\s+(?:WORK|TRANSACTION))?\s+TO)\b',
+	re.I
+)
+
+def unquote(name):
+	if name.startswith(b'"'):
+		return name[1:-1].replace(b'""', b'"')
+	return name
+
+class Backend(socketserver.BaseRequestHandler):
+	"""
+	Serve a single connection of a `Server`.
+	"""
+	recvsize = 1024 * 32
+	flushsize = 1024 * 64
+
+	def setup(self):
+		self.socket = self.request
+		self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.buffer = pq_message_stream()
+		self.output = []
+		self.output_size = 0
+		self.statements = {}
+		self.portals = {}
+		self.xact_state = b'I'
+		# Set when an error occurs in the extended protocol;
+		# messages are ignored until the next Sync.
+		self.failed = False
+		# (copy_in_response, simple_query, line_count) during COPY FROM STDIN.
+		self.copy = None
+		self.cancelled = Event()
+
+	def recv(self, size):
+		data = b''
+		while len(data) < size:
+			d = self.socket.recv(size - len(data))
+			if not d:
+				raise EOFError("connection closed by client")
+			data += d
+		return data
+
+	def write(self, messages):
+		for x in messages:
+			x = x.bytes()
+			self.output.append(x)
+			self.output_size += len(x)
+		if self.output_size > self.flushsize:
+			self.flush()
+
+	def write_data(self, data):
+		self.output.append(data)
+		self.output_size += len(data)
+		if self.output_size > self.flushsize:
+			self.flush()
+
+	def flush(self):
+		if self.output:
+			self.socket.sendall(b''.join(self.output))
+			self.output = []
+			self.output_size = 0
+
+	def startup(self):
+		"""
+		Read the startup packet and establish the session.
+		Returns `False` if the connection should be closed.
+		"""
+		while True:
+			size = ts.ulong_unpack(self.recv(4))
+			data = self.recv(size - 4)
+			if data == element.NegotiateSSL.packed_version:
+				self.socket.sendall(b'N')
+				continue
+			elif data[0:4] == element.CancelRequest.packed_version:
+				self.server.cancel(element.CancelRequest.parse(data))
+				return False
+			break
+		self.startup_message = element.Startup.parse(data)
+		self.pid, self.key = self.server.register(self)
+		self.write([element.Authentication(element.AuthRequest_OK, b'')])
+		self.write([
+			element.ShowOption(k.encode('ascii'), v.encode('ascii'))
+			for k, v in self.server.parameters.items()
+		])
+		self.write([
+			element.KillInformation(self.pid, self.key),
+			element.Ready(self.xact_state),
+		])
+		self.flush()
+		return True
+
+	def handle(self):
+		try:
+			if not self.startup():
+				return
+			while True:
+				data = self.socket.recv(self.recvsize)
+				if not data:
+					break
+				self.buffer.write(data)
+				for typ, body in self.buffer.read():
+					if self.dispatch(typ, body) is False:
+						self.flush()
+						return
+		except (EOFError, socket.error):
+			pass
+		finally:
+			self.server.unregister(self)
+
+	def finish(self):
+		self.socket.close()
+
+	def dispatch(self, typ, body):
+		if self.copy is not None:
+			return self.copy_message(typ, body)
+		if self.failed and typ is not element.Synchronize.type:
+			return
+		method = self.dispatch_table.get(typ)
+		if method is None:
+			self.error(b'08P01', "unsupported message type %r" %(typ,), fatal = True)
+			return False
+		return method(self, body)
+
+	def lookup(self, query):
+		'select the response for the given query'
+		m = declare_pattern.match(query)
+		if m is not None:
+			return Declare(unquote(m.group(1)), self.lookup(m.group(2)))
+		m = fetch_pattern.match(query)
+		if m is not None:
+			command, whence, quantity, name = m.groups()
+			return Fetch(
+				command.upper(),
+				whence.upper() if whence else b'FORWARD',
+				quantity.upper() if quantity else None,
+				unquote(name),
+			)
+		m = close_pattern.match(query)
+		if m is not None:
+			return CloseCursor(unquote(m.group(1)))
+		m = savepoint_pattern.match(query)
+		if m is not None:
+			words = m.group(1).upper().split()
+			return Savepoint(b'ROLLBACK TO' if len(words) > 1 else words[0])
+		for pattern, response in self.server.script:
+			if pattern.search(query) is not None:
+				return response
+		words = query.split()
+		return Command(words[0].rstrip(b';').upper() if words else b'')
+
+	def error(self, code, message, fatal = False):
+		self.write([element.Error(
+			severity = b'FATAL' if fatal else b'ERROR',
+			code = code,
+			message = message.encode('utf-8'),
+		)])
+		# Like the backend, errors are flushed immediately.
+		self.flush()
+		if self.xact_state == b'T':
+			self.xact_state = b'E'
+
+	def wait(self, response):
+		"""
+		Wait for the latency of the server and the `response`.
+		Returns `False` if the statement was cancelled.
+		"""
+		latency = self.server.latency + response.latency
+		if latency:
+			self.flush()
+			if self.cancelled.wait(latency):
+				self.cancelled.clear()
+				self.error(b'57014', "canceling statement due to user request")
+				return False
+		elif self.cancelled.is_set():
+			self.cancelled.clear()
+		return True
+
+	def recovers(self, response):
+		'Whether the `response` is allowed in a failed transaction block'
+		if isinstance(response, Savepoint):
+			return response.tag == b'ROLLBACK'
+		return isinstance(response, Command) and \
+			xact_commands.get(response.tag.split(b' ', 1)[0].upper()) == b'I'
+
+	def command_state(self, tag):
+		state = xact_commands.get(tag.split(b' ', 1)[0].upper())
+		if state is not None:
+			self.xact_state = state
+
+	def execute(self, response, formats, max = 0, portal = None, simple = False):
+		"""
+		Execute the `response`. Returns `False` if the execution failed.
+		"""
+		if portal is None or portal[2] == 0:
+			if not self.wait(response):
+				return False
+		if isinstance(response, Failure):
+			self.write([response.error()])
+			if self.xact_state == b'T':
+				self.xact_state = b'E'
+			return False
+		elif self.xact_state == b'E' and not self.recovers(response):
+			self.error(b'25P02',
+				"current transaction is aborted, "
+				"commands ignored until end of transaction block"
+			)
+			return False
+		elif isinstance(response, Fetch):
+			return self.fetch(response, formats, simple)
+		elif isinstance(response, Declare):
+			if isinstance(response.response, Failure):
+				return self.execute(response.response, formats)
+			self.portals[response.name] = [response.response, (), 0]
+			self.write([element.Complete(response.tag)])
+		elif isinstance(response, CloseCursor):
+			if self.portals.pop(response.name, None) is None:
+				self.error(b'34000', "cursor %r does not exist" %(response.name,))
+				return False
+			self.write([element.Complete(response.tag)])
+		elif isinstance(response, Savepoint):
+			if self.xact_state == b'I':
+				self.error(b'25P01', "%s can only be used in transaction blocks" %(
+					response.command.decode('ascii'),
+				))
+				return False
+			self.write([element.Complete(response.tag)])
+			self.xact_state = b'T'
+		elif isinstance(response, Rows):
+			if simple:
+				self.write([self.describe(response, formats)])
+			data = response.serialized(formats)
+			start = portal[2] if portal is not None else 0
+			if max and start + max < len(data):
+				self.write_data(b''.join(data[start:start+max]))
+				portal[2] = start + max
+				self.write([element.SuspensionMessage])
+				return True
+			self.write_data(b''.join(data[start:] if start else data))
+			if portal is not None:
+				portal[2] = len(data)
+			self.write([element.Complete(response.tag)])
+		elif isinstance(response, CopyOut):
+			self.write([element.CopyToBegin(0, [0])])
+			self.write_data(response.data)
+			self.write([element.CopyDoneMessage, element.Complete(response.tag)])
+		elif isinstance(response, CopyIn):
+			self.write([element.CopyFromBegin(0, [0] * response.columns)])
+			self.flush()
+			self.copy = [response, simple, 0]
+		else:
+			self.write([element.Complete(response.tag)])
+			self.command_state(response.tag)
+		return True
+
+	def fetch(self, response, formats, simple):
+		'FETCH or MOVE the declared cursor'
+		portal = self.portals.get(response.name)
+		if portal is None:
+			self.error(b'34000', "cursor %r does not exist" %(response.name,))
+			return False
+		rows = portal[0]
+		data = rows.serialized(formats) if isinstance(rows, Rows) else ()
+		n = len(data)
+		# The cursor's position: 0 is before the first row, n + 1 after the last.
+		k = portal[2]
+		whence = response.whence
+		quantity = response.quantity
+		if quantity == b'ALL':
+			quantity = n + 1
+		elif quantity is not None:
+			quantity = int(quantity)
+		if whence in (b'FORWARD', b'BACKWARD') and quantity is not None \
+		and quantity < 0:
+			whence = b'BACKWARD' if whence == b'FORWARD' else b'FORWARD'
+			quantity = -quantity
+		if whence in (b'FORWARD', b'NEXT'):
+			if quantity is None or whence == b'NEXT':
+				quantity = 1
+			selected = data[k:k+quantity]
+			k = min(k + quantity, n + 1)
+		elif whence in (b'BACKWARD', b'PRIOR'):
+			if quantity is None or whence == b'PRIOR':
+				quantity = 1
+			selected = list(data[max(k - quantity - 1, 0):max(k - 1, 0)])
+			selected.reverse()
+			k = max(k - quantity, 0)
+		else:
+			if whence == b'ABSOLUTE':
+				k = quantity if quantity >= 0 else n + 1 + quantity
+			elif whence == b'RELATIVE':
+				k = k + (quantity or 0)
+			elif whence == b'FIRST':
+				k = 1
+			else:
+				k = n
+			k = min(max(k, 0), n + 1)
+			selected = data[k-1:k] if 0 < k <= n else ()
+		portal[2] = k
+		if response.command == b'FETCH':
+			if simple:
+				self.write([self.describe(response, formats)])
+			self.write_data(b''.join(selected))
+		self.write([element.Complete(
+			response.command + (' %d' %(len(selected),)).encode('ascii')
+		)])
+		return True
+
+	def describe(self, response, formats = ()):
+		'the description of the rows produced by the `response`'
+		if isinstance(response, Fetch) and response.command == b'FETCH':
+			portal = self.portals.get(response.name)
+			if portal is not None:
+				return portal[0].describe(formats)
+		return response.describe(formats)
+
+	def copy_message(self, typ, body):
+		if typ is element.CopyData.type:
+			self.copy[2] += body.count(b'\n')
+		elif typ is element.CopyDone.type:
+			self.write([element.Complete(('COPY %d' %(self.copy[2],)).encode('ascii'))])
+			if self.copy[1]:
+				self.write([element.Ready(self.xact_state)])
+				self.flush()
+			self.copy = None
+		elif typ is element.CopyFail.type:
+			simple = self.copy[1]
+			self.copy = None
+			self.error(b'57014', "COPY from stdin failed: " + body.rstrip(b'\x00').decode('utf-8'))
+			if simple:
+				self.write([element.Ready(self.xact_state)])
+				self.flush()
+			else:
+				self.failed = True
+		elif typ is element.Flush.type or typ is element.Synchronize.type:
+			# Ignored during COPY FROM STDIN.
+			pass
+		else:
+			self.copy = None
+			self.error(b'08P01', "unexpected message type %r during COPY" %(typ,))
+			self.failed = True
+
+	def parameter_types(self, query, response):
+		if response.parameters is not None:
+			return tuple(response.parameters)
+		return (pg_types.TEXTOID,) * len(set(placeholder.findall(query)))
+
+	def do_query(self, body):
+		query = element.Query.parse(body).data
+		if query.strip():
+			response = self.lookup(query)
+			self.execute(response, (), simple = True)
+		else:
+			self.write([element.NullMessage])
+		if self.copy is None:
+			self.write([element.Ready(self.xact_state)])
+			self.flush()
+
+	def do_parse(self, body):
+		msg = element.Parse.parse(body)
+		response = self.lookup(msg.statement)
+		argtypes = tuple(msg.argtypes)
+		params = self.parameter_types(msg.statement, response)
+		if len(argtypes) < len(params):
+			argtypes = argtypes + params[len(argtypes):]
+		self.statements[msg.name] = (response, argtypes)
+		self.write([element.ParseCompleteMessage])
+
+	def do_bind(self, body):
+		msg = element.Bind.parse(body)
+		st = self.statements.get(msg.statement)
+		if st is None:
+			self.error(b'26000',
+				"prepared statement %r does not exist" %(msg.statement,)
+			)
+			self.failed = True
+			return
+		if len(msg.arguments) != len(st[1]):
+			self.error(b'08P01',
+				"bind message supplies %d parameters, but prepared statement " \
+				"requires %d" %(len(msg.arguments), len(st[1]))
+			)
+			self.failed = True
+			return
+		self.portals[msg.name] = [st[0], msg.rformats, 0]
+		self.write([element.BindCompleteMessage])
+
+	def do_describe(self, body):
+		if body[0:1] == element.DescribeStatement.subtype:
+			name = element.DescribeStatement.parse(body).data
+			st = self.statements.get(name)
+			if st is None:
+				self.error(b'26000', "prepared statement %r does not exist" %(name,))
+				self.failed = True
+				return
+			self.write([element.AttributeTypes(st[1]), self.describe(st[0])])
+		else:
+			name = element.DescribePortal.parse(body).data
+			portal = self.portals.get(name)
+			if portal is None:
+				self.error(b'34000', "portal %r does not exist" %(name,))
+				self.failed = True
+				return
+			self.write([self.describe(portal[0], portal[1])])
+
+	def do_execute(self, body):
+		msg = element.Execute.parse(body)
+		portal = self.portals.get(msg.name)
+		if portal is None:
+			self.error(b'34000', "portal %r does not exist" %(msg.name,))
+			self.failed = True
+			return
+		if self.execute(portal[0], portal[1], max = msg.max, portal = portal) is False:
+			self.failed = True
+
+	def do_close(self, body):
+		if body[0:1] == element.CloseStatement.subtype:
+			self.statements.pop(element.CloseStatement.parse(body).data, None)
+		else:
+			self.portals.pop(element.ClosePortal.parse(body).data, None)
+		self.write([element.CloseCompleteMessage])
+
+	def do_sync(self, body):
+		self.failed = False
+		self.portals.pop(b'', None)
+		self.write([element.Ready(self.xact_state)])
+		self.flush()
+
+	def do_flush(self, body):
+		self.flush()
+
+	def do_function(self, body):
+		self.error(b'0A000', "function calls are not supported by server3")
+		self.failed = True
+
+	def do_disconnect(self, body):
+		return False
+
+	dispatch_table = {
+		element.Query.type : do_query,
+		element.Parse.type : do_parse,
+		element.Bind.type : do_bind,
+		element.Describe.type : do_describe,
+		element.Execute.type : do_execute,
+		element.Close.type : do_close,
+		element.Synchronize.type : do_sync,
+		element.Flush.type : do_flush,
+		element.Function.type : do_function,
+		element.Disconnect.type : do_disconnect,
+	}
+
+class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+	"""
+	Serve the `script` on the given `address`; by default, an available port
+	on localhost.
+
+	`latency` is the number of seconds to wait before executing each
+	statement. `parameters` is a mapping of the settings reported to
+	clients on connect. It is merged with `default_parameters`.
+	"""
+	daemon_threads = True
+	allow_reuse_address = True
+	request_queue_size = 1024
+
+	def __init__(self,
+		script = (),
+		latency = 0,
+		parameters = None,
+		address = ('127.0.0.1', 0),
+		backend = Backend,
+	):
+		self.script = [
+			(re.compile(x.encode('utf-8') if isinstance(x, str) else x), r)
+			for x, r in list(script) + list(driver_script)
+		]
+		self.latency = latency
+		self.parameters = dict(default_parameters)
+		if parameters:
+			self.parameters.update(parameters)
+		self.backends = {}
+		self._ids = count(os.getpid() % 0x8000)
+		self._lock = Lock()
+		self.thread = None
+		super().__init__(address, backend)
+
+	@property
+	def address(self):
+		return self.server_address
+
+	def register(self, backend):
+		'assign a backend id and cancellation key to the `backend`'
+		with self._lock:
+			pid = next(self._ids)
+			key = id(backend) & 0xFFFFFFFF
+			self.backends[pid] = backend
+		return pid, key
+
+	def unregister(self, backend):
+		with self._lock:
+			if self.backends.get(getattr(backend, 'pid', None)) is backend:
+				del self.backends[backend.pid]
+
+	def cancel(self, request):
+		b = self.backends.get(request.pid)
+		if b is not None and b.key == request.key:
+			b.cancelled.set()
+
+	def socket_factory(self):
+		'`postgresql.python.socket.SocketFactory` connecting to the server'
+		return SocketFactory(
+			(socket.AF_INET, socket.SOCK_STREAM), self.server_address
+		)
+
+	def start(self):
+		'serve connections in a background thread'
+		self.thread = Thread(target = self.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def stop(self):
+		'stop serving connections and close the listening socket'
+		if self.thread is not None:
+			self.shutdown()
+			self.thread.join()
+			self.thread = None
+		self.server_close()
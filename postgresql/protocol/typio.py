@@ -36,8 +36,16 @@ Map PostgreSQL type Oids to routines that pack and unpack raw data.
  time64_noday_io
   long-long based time I/O with noday-intervals.
 """
+import sys
 import warnings
 import codecs
+import array
+import uuid
+import json
+try:
+	import ipaddress
+except ImportError:
+	ipaddress = None
 from ..encodings import aliases as pg_enc_aliases
 from .. import exceptions as pg_exc
 
@@ -50,11 +58,11 @@ from functools import partial
 
 from abc import ABCMeta, abstractmethod
 
-from decimal import Decimal, DecimalTuple
+from decimal import Decimal
 import datetime
 
 from ..exceptions import TypeConversionWarning
-from ..python.datetime import UTC, FixedOffset
+from ..python.datetime import UTC, FixedOffset, fixed_offset
 
 from ..python.functools import Composition as compose
 
@@ -172,7 +180,7 @@ def timetz_unpack(tstz):
 	tuple.
 	"""
 	t = time_unpack(tstz[0])
-	return t.replace(tzinfo = FixedOffset(tstz[1]))
+	return t.replace(tzinfo = fixed_offset(tstz[1]))
 
 time_io = {
 	pg_types.TIMEOID : (
@@ -202,26 +210,68 @@ time_io_noday[pg_types.INTERVALOID] = (
 	compose((ts.interval_noday_unpack, interval_unpack)),
 )
 
+##
+# Integer datetimes are a count of microseconds, so they can be converted
+# directly instead of going through (seconds, microseconds) pairs.
+pg_epoch_datetime_utc = pg_epoch_datetime.replace(tzinfo = UTC)
+timedelta = datetime.timedelta
+microseconds_in_day = seconds_in_day * 1000000
+microseconds_in_hour = seconds_in_hour * 1000000
+
+def timestamp64_pack(x):
+	d = x - pg_epoch_datetime
+	return ts.longlong_pack(
+		(d.days * microseconds_in_day) + (d.seconds * 1000000) + d.microseconds
+	)
+
+def timestamp64_unpack(x):
+	return pg_epoch_datetime + timedelta(0, 0, ts.longlong_unpack(x))
+
+def timestamptz64_pack(x):
+	return timestamp64_pack(x.astimezone(UTC).replace(tzinfo = None))
+
+def timestamptz64_unpack(x):
+	return pg_epoch_datetime_utc + timedelta(0, 0, ts.longlong_unpack(x))
+
+def time64_pack(x):
+	return ts.longlong_pack(
+		(x.hour * microseconds_in_hour) + (x.minute * 60000000) + \
+		(x.second * 1000000) + x.microsecond
+	)
+
+def time64_unpack(x):
+	seconds, us = divmod(ts.longlong_unpack(x), 1000000)
+	minutes, sec = divmod(seconds, 60)
+	hours, min = divmod(minutes, 60)
+	return datetime.time(hours, min, sec, us)
+
+def timetz64_pack(x):
+	td = x.tzinfo.utcoffset(x)
+	return ts.ql_pack((
+		ts.longlong_unpack(time64_pack(x)), td.days * seconds_in_day + td.seconds
+	))
+
+def timetz64_unpack(x):
+	us, tz = ts.ql_unpack(x)
+	seconds, us = divmod(us, 1000000)
+	minutes, sec = divmod(seconds, 60)
+	hours, min = divmod(minutes, 60)
+	return datetime.time(hours, min, sec, us, fixed_offset(tz))
+
+def interval64_unpack(x):
+	us, days, months = ts.qll_unpack(x)
+	if months != 0:
+		return interval_unpack((months, days, (0, 0))) + timedelta(0, 0, us)
+	return timedelta(days, 0, us)
+
 time64_io = {
-	pg_types.TIMEOID : (
-		compose((time_pack, ts.time64_pack)),
-		compose((ts.time64_unpack, time_unpack)),
-	),
-	pg_types.TIMETZOID : (
-		compose((timetz_pack, ts.timetz64_pack)),
-		compose((ts.timetz64_unpack, timetz_unpack)),
-	),
-	pg_types.TIMESTAMPOID : (
-		compose((timestamp_pack, ts.time64_pack)),
-		compose((ts.time64_unpack, timestamp_unpack)),
-	),
-	pg_types.TIMESTAMPTZOID : (
-		compose((convert_to_utc, remove_tzinfo, timestamp_pack, ts.time64_pack)),
-		compose((ts.time64_unpack, timestamp_unpack, set_as_utc)),
-	),
+	pg_types.TIMEOID : (time64_pack, time64_unpack),
+	pg_types.TIMETZOID : (timetz64_pack, timetz64_unpack),
+	pg_types.TIMESTAMPOID : (timestamp64_pack, timestamp64_unpack),
+	pg_types.TIMESTAMPTZOID : (timestamptz64_pack, timestamptz64_unpack),
 	pg_types.INTERVALOID : (
 		compose((interval_pack, ts.interval64_pack)),
-		compose((ts.interval64_unpack, interval_unpack)),
+		interval64_unpack,
 	),
 }
 time64_io_noday = time64_io.copy()
@@ -230,6 +280,55 @@ time64_io_noday[pg_types.INTERVALOID] = (
 	compose((ts.interval64_noday_unpack, interval_unpack)),
 )
 
+##
+# Timestamps as microseconds since the Unix epoch.
+pg_epoch_microseconds = (pg_time_days * microseconds_in_day)
+
+def timestamp64_microseconds_pack(x):
+	if type(x) is int:
+		return ts.longlong_pack(x - pg_epoch_microseconds)
+	return timestamp64_pack(x)
+
+def timestamptz64_microseconds_pack(x):
+	if type(x) is int:
+		return ts.longlong_pack(x - pg_epoch_microseconds)
+	return timestamptz64_pack(x)
+
+def timestamp64_microseconds_unpack(x):
+	return ts.longlong_unpack(x) + pg_epoch_microseconds
+
+def timestamp_microseconds_pack(x):
+	if type(x) is int:
+		x = x - pg_epoch_microseconds
+		return ts.time_pack((x // 1000000, x % 1000000))
+	return time_io[pg_types.TIMESTAMPOID][0](x)
+
+def timestamptz_microseconds_pack(x):
+	if type(x) is int:
+		return timestamp_microseconds_pack(x)
+	return time_io[pg_types.TIMESTAMPTZOID][0](x)
+
+def timestamp_microseconds_unpack(x):
+	return int(round(ts.double_unpack(x) * 1000000)) + pg_epoch_microseconds
+
+# Used by `TypeIO.select_time_io` when ``timestamp_output`` is 'microseconds'.
+timestamp_microseconds_io = {
+	pg_types.TIMESTAMPOID : (
+		timestamp_microseconds_pack, timestamp_microseconds_unpack
+	),
+	pg_types.TIMESTAMPTZOID : (
+		timestamptz_microseconds_pack, timestamp_microseconds_unpack
+	),
+}
+timestamp64_microseconds_io = {
+	pg_types.TIMESTAMPOID : (
+		timestamp64_microseconds_pack, timestamp64_microseconds_unpack
+	),
+	pg_types.TIMESTAMPTZOID : (
+		timestamptz64_microseconds_pack, timestamp64_microseconds_unpack
+	),
+}
+
 def two_pair(x):
 	'Make a pair of pairs out of a sequence of four objects'
 	return ((x[0], x[1]), (x[2], x[3]))
@@ -280,131 +379,147 @@ def circle_unpack(x):
 #  digits, sequence of int()'s
 #  exponent, digits that fall to the right of the decimal point
 numeric_negative = 16384
+# 0xC000 as the signed short in the header.
+numeric_nan = -16384
+
+# Packed numeric headers, (ndigits, weight, sign, dscale).
+numeric_header = ts.hhhh_pack
+numeric_nan_data = numeric_header((0, 0, numeric_nan, 0))
 
 def numeric_pack(x,
 	numeric_digit_length : "number of decimal digits in a numeric digit" = 4
 ):
-	if not isinstance(x, Decimal):
-		x = Decimal(x)
-	x = x.as_tuple()
-	if x.exponent == 'F':
-		raise ValueError("numeric does not support infinite values")
-
-	# normalize trailing zeros (truncate em')
-	# this is important in order to get the weight and padding correct
-	# and to avoid packing superfluous data which will make pg angry.
-	trailing_zeros = 0
-	weight = 0
-	if x.exponent < 0:
-		# only attempt to truncate if there are digits after the point,
-		##
-		for i in range(-1, max(-len(x.digits), x.exponent)-1, -1):
-			if x.digits[i] != 0:
-				break
-			trailing_zeros += 1
-		# truncate trailing zeros right of the decimal point
-		# this *is* the case as exponent < 0.
-		if trailing_zeros:
-			digits = x.digits[:-trailing_zeros]
-		else:
-			digits = x.digits
-			# the entire exponent is just trailing zeros(zero-weight).
-		rdigits = -(x.exponent + trailing_zeros)
-		ldigits = len(digits) - rdigits
-		rpad = rdigits % numeric_digit_length
-		if rpad:
-			rpad = numeric_digit_length - rpad
+	if type(x) is int:
+		sign = 1 if x < 0 else 0
+		coefficient = str(-x if sign else x)
+		exponent = 0
 	else:
-		# Need the weight to be divisible by four,
-		# so append zeros onto digits until it is.
-		r = (x.exponent % numeric_digit_length)
-		if x.exponent and r:
-			digits = x.digits + ((0,) * r)
-			weight = (x.exponent - r)
-		else:
-			digits = x.digits
-			weight = x.exponent
-		# The exponent is not evenly divisible by four, so
-		# the weight can't simple be x.exponent as it doesn't
-		# match the size of the numeric digit.
-		ldigits = len(digits)
-		# no fractional quantity.
-		rdigits = 0
-		rpad = 0
-
-	lpad = ldigits % numeric_digit_length
+		if not isinstance(x, Decimal):
+			x = Decimal(x)
+		if x.is_nan():
+			return numeric_nan_data
+		sign, digits, exponent = x.as_tuple()
+		if exponent == 'F':
+			raise ValueError("numeric does not support infinite values")
+		coefficient = ''.join(map(str, digits))
+
+	# The display scale is the number of digits right of the decimal point.
+	dscale = -exponent if exponent < 0 else 0
+	# Align the exponent to the numeric digit so that the decimal point
+	# falls on a numeric digit boundary.
+	r = exponent % numeric_digit_length
+	if r:
+		coefficient += '0' * r
+		exponent -= r
+	# Superfluous zeros would make pg angry, so trim them.
+	coefficient = coefficient.lstrip('0')
+	stripped = coefficient.rstrip('0')
+	trailing_digits = (len(coefficient) - len(stripped)) // numeric_digit_length
+	if trailing_digits:
+		coefficient = coefficient[:-(trailing_digits * numeric_digit_length)]
+		exponent += trailing_digits * numeric_digit_length
+	if not coefficient:
+		return numeric_header((0, 0, 0, dscale))
+	lpad = -len(coefficient) % numeric_digit_length
 	if lpad:
-		lpad = numeric_digit_length - lpad
-	weight += (ldigits + lpad)
-
-	digit_groups = map(
-		get1,
-		groupby(
-			zip(
-				# group by numeric digit size
-				# every four digits make up a numeric digit
-				cycle((0,) * numeric_digit_length + (1,) * numeric_digit_length),
-
-				# multiply each digit appropriately
-				# for the eventual sum() into a numeric digit
-				starmap(
-					mul,
-					zip(
-						# pad with leading zeros to make
-						# the cardinality of the digit sequence
-						# to be evenly divisible by four,
-						# the numeric digit size.
-						chain(
-							repeat(0, lpad),
-							digits,
-							repeat(0, rpad),
-						),
-						cycle([10**x for x in range(numeric_digit_length-1, -1, -1)]),
-					)
-				),
-			),
-			get0,
-		),
-	)
+		coefficient = '0' * lpad + coefficient
+	numbers = [
+		int(coefficient[i:i+numeric_digit_length])
+		for i in range(0, len(coefficient), numeric_digit_length)
+	]
 	return ts.numeric_pack((
 		(
-			(ldigits + rdigits + lpad + rpad) // numeric_digit_length, # ndigits
-			(weight // numeric_digit_length) - 1, # numeric weight
-			numeric_negative if x.sign == 1 else x.sign, # sign
-			- x.exponent if x.exponent < 0 else 0, # dscale
+			len(numbers), # ndigits
+			len(numbers) - 1 + (exponent // numeric_digit_length), # weight
+			numeric_negative if sign == 1 else 0, # sign
+			dscale,
 		),
-		list(map(sum, ([get1(y) for y in x] for x in digit_groups))),
+		numbers,
 	))
 
-def numeric_convert_digits(d):
-	i = iter(d)
-	for x in str(next(i)):
-		# no leading zeros
-		yield int(x)
-	# leading digit should not include zeros
-	for y in i:
-		for x in str(y).rjust(4, '0'):
-			yield int(x)
-
-numeric_signs = {
-	numeric_negative : 1,
-}
+def numeric_coefficient(header, digits):
+	"""
+	Given the unpacked header and digits of a numeric, return the coefficient
+	scaled by the display scale as an int.
+
+	The value of the numeric is `coefficient * (10 ** -dscale)`.
+	"""
+	ndigits, weight, sign, dscale = header
+	if not ndigits:
+		return 0
+	coefficient = int(('%04d' * ndigits) % digits)
+	# The exponent of the last numeric digit relative to the display scale.
+	shift = 4 * (weight + 1 - ndigits) + dscale
+	if shift > 0:
+		return coefficient * (10 ** shift)
+	elif shift < 0:
+		return coefficient // (10 ** -shift)
+	return coefficient
+
+numeric_unpack_cache = {}
+numeric_unpack_cache_size = 1024
+numeric_unpack_cache_data_size = 12
 
 def numeric_unpack(x):
+	# Small values (at most two numeric digits) are cached.
+	if len(x) <= numeric_unpack_cache_data_size:
+		d = numeric_unpack_cache.get(x)
+		if d is not None:
+			return d
 	header, digits = ts.numeric_unpack(x)
-	npad = (header[3] - ((header[0] - (header[1] + 1)) * 4))
-	return Decimal(
-		DecimalTuple(
-			sign = numeric_signs.get(header[2], header[2]),
-			digits = chain(
-				numeric_convert_digits(digits),
-				(0,) * npad
-			) if npad >= 0 else list(
-				numeric_convert_digits(digits)
-			)[:npad],
-			exponent = -header[3]
-		)
-	)
+	if header[2] == numeric_nan:
+		d = Decimal('NaN')
+	else:
+		d = Decimal('%s%dE-%d' %(
+			'-' if header[2] == numeric_negative else '',
+			numeric_coefficient(header, digits),
+			header[3],
+		))
+	if len(x) <= numeric_unpack_cache_data_size \
+	and len(numeric_unpack_cache) < numeric_unpack_cache_size:
+		numeric_unpack_cache[x] = d
+	return d
+
+def numeric_unpack_float(x):
+	'unpack a numeric as a float'
+	header, digits = ts.numeric_unpack(x)
+	ndigits, weight, sign, dscale = header
+	if sign == numeric_nan:
+		return float('nan')
+	if not ndigits:
+		return 0.0
+	# float() of the decimal string is correctly rounded.
+	return float('%s%sE%d' %(
+		'-' if sign == numeric_negative else '',
+		('%04d' * ndigits) % digits,
+		4 * (weight + 1 - ndigits),
+	))
+
+def numeric_unpack_int(x):
+	"""
+	Unpack a numeric as an int when it has no display scale; otherwise,
+	as a `decimal.Decimal`.
+	"""
+	header, digits = ts.numeric_unpack(x)
+	if header[3] or header[2] == numeric_nan:
+		return numeric_unpack(x)
+	i = numeric_coefficient(header, digits)
+	return -i if header[2] == numeric_negative else i
+
+def numeric_pack_float(x):
+	'pack a float as a numeric using its shortest representation'
+	if type(x) is float:
+		if x != x:
+			return numeric_nan_data
+		x = Decimal(repr(x))
+	return numeric_pack(x)
+
+# Numeric I/O for `TypeIO.select_numeric_io`.
+numeric_io = {
+	'decimal' : (numeric_pack, numeric_unpack),
+	'float' : (numeric_pack_float, numeric_unpack_float),
+	'int' : (numeric_pack, numeric_unpack_int),
+}
 
 # Map type oids to a (pack, unpack) pair.
 oid_to_io = {
@@ -421,8 +536,122 @@ oid_to_io = {
 	pg_types.CIRCLEOID : (circle_pack, circle_unpack),
 }
 
-oid_to_io[pg_types.CIDROID] = (None, None)
-oid_to_io[pg_types.INETOID] = (None, None)
+def uuid_pack(x):
+	'pack a `uuid.UUID` or a string representing one'
+	if type(x) is not uuid.UUID:
+		x = uuid.UUID(x)
+	return x.bytes
+
+def uuid_unpack(x):
+	return uuid.UUID(bytes = x)
+
+oid_to_io[pg_types.UUIDOID] = (uuid_pack, uuid_unpack)
+
+##
+# inet and cidr; the address family is identified by PGSQL_AF_INET and
+# PGSQL_AF_INET6.
+pg_af_inet = 2
+pg_af_inet6 = 3
+
+def net_family(version):
+	return pg_af_inet if version == 4 else pg_af_inet6
+
+def inet_pack(x):
+	"""
+	Pack an `ipaddress` address, interface, or network, or a string
+	representing one.
+	"""
+	if isinstance(x, str):
+		x = ipaddress.ip_interface(x)
+	if isinstance(x, (ipaddress.IPv4Interface, ipaddress.IPv6Interface)):
+		mask = x.network.prefixlen
+		data = x.packed
+	elif isinstance(x, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+		mask = x.prefixlen
+		data = x.network_address.packed
+	else:
+		mask = x.max_prefixlen
+		data = x.packed
+	return ts.BBBB_pack((net_family(x.version), mask, 0, len(data))) + data
+
+def inet_unpack(x):
+	"""
+	Unpack inet data into an `ipaddress` address, or an interface when the
+	mask does not cover the entire address.
+	"""
+	family, mask, is_cidr, size = ts.BBBB_unpack(x[:4])
+	data = x[4:]
+	if len(data) != size:
+		raise ValueError("invalid size parameter")
+	if mask == size * 8:
+		return ipaddress.ip_address(data)
+	return ipaddress.ip_interface((data, mask))
+
+def cidr_pack(x):
+	'pack an `ipaddress` network or a string representing one'
+	x = ipaddress.ip_network(x)
+	data = x.network_address.packed
+	return ts.BBBB_pack((net_family(x.version), x.prefixlen, 1, len(data))) + data
+
+def cidr_unpack(x):
+	'unpack cidr data into an `ipaddress` network'
+	family, mask, is_cidr, size = ts.BBBB_unpack(x[:4])
+	data = x[4:]
+	if len(data) != size:
+		raise ValueError("invalid size parameter")
+	return ipaddress.ip_network((data, mask))
+
+if ipaddress is not None:
+	oid_to_io[pg_types.INETOID] = (inet_pack, inet_unpack)
+	oid_to_io[pg_types.CIDROID] = (cidr_pack, cidr_unpack)
+else:
+	oid_to_io[pg_types.CIDROID] = (None, None)
+	oid_to_io[pg_types.INETOID] = (None, None)
+
+##
+# Types whose binary form is the encoded text; ok to decode without I/O routines.
+text_binary_types = frozenset((
+	pg_types.TEXTOID,
+	pg_types.VARCHAROID,
+	pg_types.BPCHAROID,
+	pg_types.NAMEOID,
+	pg_types.CSTRINGOID,
+	pg_types.UNKNOWNOID,
+	pg_types.REFCURSOROID,
+))
+
+# Used to select the type of a parameter given without one.
+python_type_to_oid = {
+	bool : pg_types.BOOLOID,
+	float : pg_types.FLOAT8OID,
+	Decimal : pg_types.NUMERICOID,
+	bytes : pg_types.BYTEAOID,
+	bytearray : pg_types.BYTEAOID,
+	memoryview : pg_types.BYTEAOID,
+	datetime.date : pg_types.DATEOID,
+	datetime.timedelta : pg_types.INTERVALOID,
+	uuid.UUID : pg_types.UUIDOID,
+}
+
+def infer_type(ob) -> int:
+	"""
+	Identify the type Oid of the given parameter. `pg_types.InvalidOid` is
+	returned for objects that should be given to the server as text.
+	"""
+	typ = ob.__class__
+	if typ is int:
+		if -0x80000000 <= ob <= 0x7FFFFFFF:
+			return pg_types.INT4OID
+		return pg_types.INT8OID
+	elif typ is datetime.datetime:
+		if ob.tzinfo is None:
+			return pg_types.TIMESTAMPOID
+		return pg_types.TIMESTAMPTZOID
+	elif typ is datetime.time:
+		if ob.tzinfo is None:
+			return pg_types.TIMEOID
+		return pg_types.TIMETZOID
+	return python_type_to_oid.get(typ, pg_types.InvalidOid)
 
 def process_tuple(procs, tup, exception_handler):
 	"""
@@ -459,12 +688,116 @@ def process_chunk(procs, tupc, fail):
 		process_tuple(procs, x, fail) for x in tupc
 	]
 
+py_process_tuple = process_tuple
+py_process_chunk = process_chunk
+
 try:
 	# C implementation of the tuple processors.
 	from .optimized import process_tuple, process_chunk
 except ImportError:
 	pass
 
+##
+# Without the C implementation, the per-item loop in process_tuple is the bulk
+# of the cost of processing rows. So, for a given sequence of procs, functions
+# that unpack the tuple into locals and call each proc directly are generated.
+# The procs are unpacked from a single tuple as versions of Python before 3.7
+# limit functions to 255 arguments.
+# On failure, the generic processors are used to identify the failing item.
+processor_source = """
+def make_processors(procs, process_tuple, process_chunk):
+	{procs}, = procs
+	def process_generated_tuple(tup, exception_handler):
+		try:
+			{items}, = tup
+			return [{results}]
+		except Exception:
+			pass
+		return process_tuple(procs, tup, exception_handler)
+
+	def process_generated_chunk(tupc, exception_handler):
+		try:
+			return [[{results}] for {items}, in tupc]
+		except Exception:
+			pass
+		return process_chunk(procs, tupc, exception_handler)
+	return (process_generated_tuple, process_generated_chunk)
+"""
+
+def generate_processors(procs):
+	"""
+	Generate a pair of functions, (process_tuple, process_chunk), specialized for
+	`procs`. The functions take the tuple or chunk and the exception handler.
+	"""
+	if not procs:
+		return (partial(process_tuple, procs), partial(process_chunk, procs))
+	names = ['p%d' %(x,) for x in range(len(procs))]
+	items = ['t%d' %(x,) for x in range(len(procs))]
+	src = processor_source.format(
+		procs = ', '.join(names),
+		items = ', '.join(items),
+		results = ', '.join([
+			'None if %s is None else %s(%s)' %(t, p, t)
+			for p, t in zip(names, items)
+		]),
+	)
+	ns = {}
+	exec(compile(src, '<generated processors>', 'exec'), ns)
+	return ns['make_processors'](procs, process_tuple, process_chunk)
+
+def processors(procs):
+	"""
+	Create the (process_tuple, process_chunk) pair for the tuple of `procs`.
+	Use `TypeIO.processors` to get a cached pair.
+
+	When the C implementation is available, it is used instead of generated
+	functions.
+	"""
+	if process_chunk is py_process_chunk:
+		return generate_processors(procs)
+	return (partial(process_tuple, procs), partial(process_chunk, procs))
+
+def memoize(
+	unpack : "the unpack function to memoize",
+	size : "the maximum number of memoized objects" = 1024,
+	sample : "the number of calls used to measure the hit rate" = 4096,
+	hit_rate : "the hit rate below which the memo is dropped" = 0.5,
+):
+	"""
+	Create a function that memoizes the objects produced by `unpack` keyed by
+	the given data. Identical data produces the same object, and memoized `str`
+	objects are interned.
+
+	After `sample` calls, the memo is dropped if less than `hit_rate` of the
+	calls were hits; the function then calls `unpack` directly.
+
+	Only useful for low cardinality columns unpacked into immutable objects.
+	"""
+	memo = {}
+	calls = 0
+	hits = 0
+	intern = sys.intern
+	def memoized_unpack(data):
+		nonlocal calls, hits, size
+		if calls is not None:
+			calls += 1
+			if calls >= sample:
+				calls = None
+				if hits < sample * hit_rate:
+					memo.clear()
+					size = 0
+		ob = memo.get(data)
+		if ob is not None:
+			hits += 1
+			return ob
+		ob = unpack(data)
+		if len(memo) < size:
+			if ob.__class__ is str:
+				ob = intern(ob)
+			memo[data] = ob
+		return ob
+	return memoized_unpack
+
 def anyarray_unpack_elements(elements, unpack):
 	'generator for yielding None if x is None or unpack(x)'
 	for x in elements:
@@ -493,6 +826,7 @@ def array_typio(
 	create an array's typio pair
 	"""
 	if hasbin_input:
+		typecode = fixed_array_elements.get(int(typoid))
 		def pack_array_elements(a):
 			for x in a:
 				if x is None:
@@ -501,6 +835,8 @@ def array_typio(
 					yield pack_element(x)
 
 		def pack_an_array(data):
+			if typecode is not None and type(data) is array.array:
+				return fixed_array_pack(typecode, int(typoid), data)
 			if not type(data) is pg_types.Array:
 				data = pg_types.Array(data)
 			dlb = []
@@ -536,6 +872,105 @@ def array_typio(
 
 	return (pack_an_array, unpack_an_array)
 
+##
+# Arrays of fixed-width elements can be unpacked in bulk into an `array.array`.
+# Maps element type Oids to the `array.array` typecode of the element.
+def _typecode(codes, size):
+	for x in codes:
+		if array.array(x).itemsize == size:
+			return x
+
+fixed_array_elements = {
+	pg_types.BOOLOID : 'B',
+	pg_types.INT2OID : _typecode('hi', 2),
+	pg_types.INT4OID : _typecode('ilh', 4),
+	pg_types.INT8OID : _typecode('qlL', 8),
+	pg_types.OIDOID : _typecode('ILH', 4),
+	pg_types.FLOAT4OID : 'f',
+	pg_types.FLOAT8OID : 'd',
+}
+del _typecode
+fixed_array_byteswap = sys.byteorder == 'little'
+
+def fixed_array_unpack(typecode, unpack_array, data):
+	"""
+	Unpack an array of fixed-width elements into a pair:
+
+		(`array.array` of the elements, dimensions)
+
+	Arrays containing NULLs can't be represented, so they are given to
+	`unpack_array`.
+	"""
+	flags, typoid, dlb, elements = ts.array_unpack(data)
+	size = array.array(typecode).itemsize
+	stride = size + 4
+	# Strided memoryview slices need Python 3.3, so bytes are sliced.
+	body = bytes(data[12 + (4 * len(dlb)):])
+	count = len(body) // stride
+	dim = []
+	total = 1 if dlb else 0
+	for x in range(0, len(dlb), 2):
+		d = dlb[x] - (dlb[x+1] or 1) + 1
+		dim.append(d)
+		total *= d
+	if flags & 1 or total != count or len(body) != count * stride:
+		# NULLs present.
+		return unpack_array(data)
+	# Gather the element data leaving the length words behind.
+	buf = bytearray(count * size)
+	for i in range(size):
+		buf[i::size] = body[4+i::stride]
+	a = array.array(typecode, buf)
+	if fixed_array_byteswap and size > 1:
+		a.byteswap()
+	return (a, tuple(dim))
+
+def fixed_elements_pack(prefix, a):
+	"""
+	Serialize the elements of the `array.array`, `a`, each preceded by the
+	`prefix` and its length word. The inverse of the gathering done by
+	`fixed_array_unpack`.
+	"""
+	size = a.itemsize
+	head = prefix + ts.long_pack(size)
+	stride = len(head) + size
+	count = len(a)
+	buf = bytearray(count * stride)
+	for i in range(len(head)):
+		buf[i::stride] = head[i:i+1] * count
+	if fixed_array_byteswap and size > 1:
+		a = array.array(a.typecode, a)
+		a.byteswap()
+	# array.tobytes is new in Python 3.2.
+	data = a.tobytes() if hasattr(a, 'tobytes') else a.tostring()
+	for i in range(size):
+		buf[len(head)+i::stride] = data[i::size]
+	return buf
+
+def fixed_array_pack(typecode, typoid, data):
+	"""
+	Pack the `array.array`, `data`, as a one dimensional array of the
+	fixed-width element type identified by `typoid`.
+	"""
+	if data.typecode != typecode:
+		data = array.array(typecode, data)
+	if not data:
+		return ts.llL_pack((0, 0, typoid))
+	return ts.llL_pack((1, 0, typoid)) + \
+		ts.long_pack(len(data)) + ts.long_pack(1) + \
+		fixed_elements_pack(b'', data)
+
+def fixed_ndarray_unpack(frombuffer, typecode, unpack_array, data):
+	"""
+	Unpack an array of fixed-width elements into a pair:
+
+		(`numpy.ndarray` of the elements, dimensions)
+	"""
+	r = fixed_array_unpack(typecode, unpack_array, data)
+	if type(r) is tuple:
+		return (frombuffer(r[0], dtype = '?' if typecode == 'B' else typecode), r[1])
+	return r
+
 def composite_typio(
 	cio : "sequence (pack,unpack) tuples corresponding to the",
 	typids : "sequence of type Oids; index must correspond to the composite's",
@@ -626,7 +1061,20 @@ class TypeIO(object, metaclass = ABCMeta):
 		version_info : "postgresql.version.split(settings['server_version'])",
 		integer_datetimes : "bool(settings['integer_datetimes'])",
 		noday_intervals : "bool(): if none, determine from `version_info`" = None,
+		timestamp_output : "the type to unpack timestamps as: 'datetime' or 'microseconds'" = 'datetime',
 	):
+		"""
+		Select the time I/O routines for the server's configuration.
+
+		When `timestamp_output` is ``'microseconds'``, timestamp and timestamptz
+		data are unpacked as `int` microseconds since the Unix epoch. Parameters
+		may then be given as `int` or `datetime.datetime`.
+		"""
+		if timestamp_output not in ('datetime', 'microseconds'):
+			raise ValueError(
+				"unknown timestamp_output, %r, must be " \
+				"'datetime' or 'microseconds'" %(timestamp_output,)
+			)
 		self.integer_datetimes = integer_datetimes
 		self.version_info = version_info
 		if noday_intervals is None:
@@ -640,11 +1088,68 @@ class TypeIO(object, metaclass = ABCMeta):
 				self._time_io = time64_io_noday
 			else:
 				self._time_io = time64_io
+			if timestamp_output == 'microseconds':
+				self._time_io = self._time_io.copy()
+				self._time_io.update(timestamp64_microseconds_io)
 		else:
 			if self.noday_intervals:
 				self._time_io = time_io_noday
 			else:
 				self._time_io = time_io
+			if timestamp_output == 'microseconds':
+				self._time_io = self._time_io.copy()
+				self._time_io.update(timestamp_microseconds_io)
+
+	def select_array_io(self,
+		output : "the type to unpack fixed-width arrays as: 'elements', 'array', or 'numpy'",
+	):
+		"""
+		Select the type that arrays of fixed-width elements--bool, int2, int4,
+		int8, oid, float4, and float8--are unpacked as. ``'elements'`` unpacks
+		them as `postgresql.types.Array`. ``'array'`` and ``'numpy'`` unpack
+		them as an (`array.array`, dimensions) or (`numpy.ndarray`, dimensions)
+		pair; arrays containing NULLs are still unpacked as
+		`postgresql.types.Array`.
+		"""
+		if output == 'elements':
+			array_output = None
+		elif output == 'array':
+			array_output = fixed_array_unpack
+		elif output == 'numpy':
+			try:
+				from numpy import frombuffer
+			except ImportError:
+				raise ValueError("numpy is not available for array_output 'numpy'")
+			array_output = partial(fixed_ndarray_unpack, frombuffer)
+		else:
+			raise ValueError(
+				"unknown array_output, %r, must be " \
+				"'elements', 'array', or 'numpy'" %(output,)
+			)
+		self._array_output = array_output
+		# Forget the array types already resolved.
+		for typid, tm in self.typmeta.items():
+			if tm[3] is not None:
+				self._cache.pop(typid, None)
+
+	def select_numeric_io(self,
+		output : "the type to unpack numerics as: 'decimal', 'float', or 'int'",
+	):
+		"""
+		Select the type that numeric data is unpacked as. ``'int'`` unpacks
+		numerics without a display scale as `int`, and any others as
+		`decimal.Decimal`.
+
+		Arrays and composites already resolved are not affected, so this
+		should be called before the type I/O is used.
+		"""
+		if output not in numeric_io:
+			raise ValueError("unknown numeric output type: " + repr(output))
+		self.numeric_output = output
+		if output == 'decimal':
+			self._numeric_io = ()
+		else:
+			self._numeric_io = {pg_types.NUMERICOID : numeric_io[output]}
 
 	def encode(self, string_data):
 		return self._encode(string_data)[0]
@@ -700,12 +1205,85 @@ class TypeIO(object, metaclass = ABCMeta):
 			# try it again, but return the sequence of children.
 			return tuple(pg_types.etree.XML('<x>' + xml_or_frag + '</x>'))
 
+	def json_pack(self, x):
+		# Strings are taken as serialized JSON.
+		if isinstance(x, str):
+			return self._encode(x)[0]
+		return self._encode(self.json_dumps(x))[0]
+
+	def json_unpack(self, data):
+		return self.json_loads(self._decode(data)[0])
+
+	def jsonb_pack(self, x):
+		return b'\x01' + self.json_pack(x)
+
+	def jsonb_unpack(self, data):
+		if data[:1] != b'\x01':
+			raise ValueError("unsupported jsonb format version %r" %(data[:1],))
+		return self.json_loads(self._decode(data[1:])[0])
+
+	def hstore_pack(self, x):
+		encode = self._encode
+		items = list(x.items() if hasattr(x, 'items') else x)
+		l = [ts.long_pack(len(items))]
+		for k, v in items:
+			k = encode(k)[0]
+			l.append(ts.long_pack(len(k)))
+			l.append(k)
+			if v is None:
+				l.append(ts.null_sequence)
+			else:
+				v = encode(v)[0]
+				l.append(ts.long_pack(len(v)))
+				l.append(v)
+		return b''.join(l)
+
+	def hstore_unpack(self, data):
+		decode = self._decode
+		long_unpack = ts.long_unpack
+		r = {}
+		offset = 4
+		for x in range(long_unpack(data[0:4])):
+			size = long_unpack(data[offset:offset+4])
+			offset += 4
+			k = decode(data[offset:offset+size])[0]
+			offset += size
+			size = long_unpack(data[offset:offset+4])
+			offset += 4
+			if size == -1:
+				r[k] = None
+			else:
+				r[k] = decode(data[offset:offset+size])[0]
+				offset += size
+		return r
+
+	def enum_unpack(self, labels, data):
+		try:
+			return labels[data]
+		except KeyError:
+			return labels.setdefault(data, sys.intern(self._decode(data)[0]))
+
+	def select_json_io(self,
+		loads : "callable used to load JSON; `json.loads` if None" = None,
+		dumps : "callable used to dump JSON; `json.dumps` if None" = None,
+	):
+		"""
+		Select the functions used to load and dump json and jsonb data.
+		"""
+		self.json_loads = loads or json.loads
+		self.json_dumps = dumps or json.dumps
+
 	def attribute_map(self, pq_descriptor):
 		return zip(self.decodes(pq_descriptor.keys()), count())
 
 	def __init__(self):
 		self.encoding = None
 		self._time_io = ()
+		self._numeric_io = ()
+		self._array_output = None
+		self._enum_labels = {}
+		self.json_loads = json.loads
+		self.json_dumps = json.dumps
 		self._cache = {
 			pg_types.RECORDOID : (
 				ts.record_pack,
@@ -730,8 +1308,32 @@ class TypeIO(object, metaclass = ABCMeta):
 			pg_types.XMLOID : (
 				self.xml_pack, self.xml_unpack
 			),
+			pg_types.JSONOID : (
+				self.json_pack, self.json_unpack
+			),
+			pg_types.JSONBOID : (
+				self.jsonb_pack, self.jsonb_unpack
+			),
 		}
 		self.typmeta = {}
+		self._processors = {}
+
+	processors_cache_size = 256
+
+	def processors(self, procs):
+		"""
+		Get the cached (process_tuple, process_chunk) pair for the tuple of
+		`procs`. The cache is kept by the instance, so the procs, often its own
+		methods, are released with it.
+		"""
+		try:
+			return self._processors[procs]
+		except KeyError:
+			pass
+		if len(self._processors) >= self.processors_cache_size:
+			self._processors.clear()
+		p = self._processors[procs] = processors(procs)
+		return p
 
 	def sql_type_from_oid(self, oid):
 		if oid in self.typmeta:
@@ -758,6 +1360,8 @@ class TypeIO(object, metaclass = ABCMeta):
 		ci = codecs.lookup(enc)
 		self._encode = ci[0]
 		self._decode = ci[1]
+		for x in self._enum_labels.values():
+			x.clear()
 
 	def resolve_descriptor(self, desc, index):
 		'create a sequence of I/O routines from a pq descriptor'
@@ -781,7 +1385,10 @@ class TypeIO(object, metaclass = ABCMeta):
 		typid = int(typid)
 
 		typio = None
-		for x in (self._cache, self._time_io, oid_to_io, ts.oid_to_io):
+		for x in (
+			self._cache, self._time_io, self._numeric_io,
+			oid_to_io, ts.oid_to_io
+		):
 			if typid in x:
 				typio = x[typid]
 				break
@@ -791,7 +1398,8 @@ class TypeIO(object, metaclass = ABCMeta):
 			ti = self.lookup_type_info(typid)
 			if ti is not None:
 				typnamespace, typname, typtype, typlen, typelem, typrelid, \
-					ae_typid, ae_hasbin_input, ae_hasbin_output = ti
+					ae_typid, ae_hasbin_input, ae_hasbin_output, *hasbin = ti
+				hasbin_input, hasbin_output = hasbin or (True, True)
 				self.typmeta[typid] = (
 					typnamespace, typname, typrelid, int(typelem) if ae_typid else None
 				)
@@ -834,7 +1442,26 @@ class TypeIO(object, metaclass = ABCMeta):
 						ae_hasbin_input,
 						ae_hasbin_output
 					)
+					if self._array_output is not None and ae_hasbin_output \
+					and int(typelem) in fixed_array_elements:
+						typio = (typio[0], partial(
+							self._array_output,
+							fixed_array_elements[int(typelem)],
+							typio[1]
+						))
 					self._cache[typid] = typio
+				elif typtype in (b'e', 'e'):
+					# Enum; the labels are interned per type.
+					labels = self._enum_labels.setdefault(typid, {})
+					self._cache[typid] = typio = (
+						self.encode if hasbin_input else None,
+						partial(self.enum_unpack, labels) if hasbin_output else None,
+					)
+				elif typname == 'hstore':
+					self._cache[typid] = typio = (
+						self.hstore_pack if hasbin_input else None,
+						self.hstore_unpack if hasbin_output else None,
+					)
 				else:
 					self._cache[typid] = typio = (None, None)
 			else:
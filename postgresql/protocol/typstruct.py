@@ -473,6 +473,19 @@ def array_unpack(data):
 	return (flags, typid, dlb, elements_unpack(data, end))
 
 
+def bytea_pack(data):
+	"""
+	Give `bytes` as-is, and any other buffer of bytes as a memoryview;
+	`bytearray`, `memoryview`, and `mmap` data is not copied. Buffers of
+	larger items, like `array.array`, are given as their `bytes`.
+	"""
+	if data.__class__ is bytes:
+		return data
+	view = memoryview(data)
+	if view.itemsize == 1 and view.ndim == 1:
+		return view
+	return bytes(view)
+
 def return_arg(arg):
 	return arg
 literal = (return_arg, return_arg)
@@ -486,7 +499,7 @@ oid_to_io = {
 	pg_types.BITOID : (bit_pack, bit_unpack),
 	pg_types.VARBITOID : (varbit_pack, varbit_unpack),
 
-	pg_types.BYTEAOID : (bytes, bytes),
+	pg_types.BYTEAOID : (bytea_pack, bytes),
 	pg_types.CHAROID : literal,
 
 #	pg_types.MACADDROID : literal,
@@ -338,6 +338,8 @@ class Instruction(Transaction):
 				element.TupleDescriptor.type : (
 					element.TupleDescriptor.parse, None
 				),
+				# Portals that produce no rows.
+				element.NoData.type : (element.NoData.parse, None),
 			},
 			# NoData or TupleDescriptor
 			{
@@ -522,7 +524,7 @@ class Instruction(Transaction):
 					##
 					# Procotol violation.
 					self.error_message = element.ClientError(
-						"expected message of types %r, " \
+						message = "expected message of types %r, " \
 						"but received %r instead" % (
 							tuple(paths[current_step].keys()), x[0]
 						),
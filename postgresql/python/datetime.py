@@ -36,3 +36,13 @@ class FixedOffset(datetime.tzinfo):
 		)
 
 UTC = FixedOffset(0, tzname = 'UTC')
+
+fixed_offsets = {}
+def fixed_offset(offset_in_seconds):
+	'Get the shared `FixedOffset` instance for the given offset'
+	try:
+		return fixed_offsets[offset_in_seconds]
+	except KeyError:
+		return fixed_offsets.setdefault(
+			offset_in_seconds, FixedOffset(offset_in_seconds)
+		)
@@ -11,6 +11,10 @@ Data
  ``libpath``
   The local file system paths that contain query libraries.
 
+ ``libcache``
+  The directory that compiled query libraries are written to. When `None`,
+  they are written to a ``__pycache__`` directory next to the library.
+
 Overridable Functions
 ---------------------
 
@@ -28,6 +32,7 @@ from .python.element import format_element
 from .python.string import indent
 
 libpath = []
+libcache = None
 
 def default_errformat(val):
 	"""
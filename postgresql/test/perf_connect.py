@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+##
+# copyright 2009, James William Pye
+# http://python.projects.postgresql.org
+##
+# Driver connection latency against the scriptable backend
+##
+# Usage: perf_connect [connections [latency]]
+##
+import sys
+import time
+
+from .. import driver
+from ..protocol import server3
+
+def summarize(title, count, duration):
+	sys.stderr.write(
+		"{title} Summary,\n " \
+		"connections: {count}\n " \
+		"duration: {duration}\n " \
+		"average per connection: {latency}\n\n".format(
+			title = title,
+			count = count,
+			duration = duration,
+			latency = duration / count if count else 0,
+		)
+	)
+
+def main(connections, latency):
+	srv = server3.Server(server3.driver_script, latency = latency)
+	srv.start()
+	try:
+		host, port = srv.address[:2]
+		connect = lambda: driver.connect(
+			host = host, port = port, user = 'perf', sslmode = 'disable'
+		)
+
+		start = time.time()
+		for x in range(connections):
+			connect().close()
+		summarize('Connect', connections, time.time() - start)
+
+		start = time.time()
+		for x in range(connections):
+			db = connect()
+			db.version
+			db.client_address
+			db.close()
+		summarize('Connect and load metadata', connections, time.time() - start)
+	finally:
+		srv.stop()
+
+def command(args):
+	args = args + [None] * 2
+	main(
+		int(args[1] or 100),
+		float(args[2] or 0.005),
+	)
+
+if __name__ == '__main__':
+	command(sys.argv)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+##
+# copyright 2009, James William Pye
+# http://python.projects.postgresql.org
+##
+# Statement I/O: Key-value style lookups using PreparedStatement.first()
+##
+# Usage: pg_python -m postgresql.test.perf_first [count]
+##
+import sys
+import time
+
+from ..protocol import element3 as element
+from ..protocol import client3 as client
+
+def summarize(title, count, duration):
+	sys.stderr.write(
+		"{title} Summary,\n " \
+		"calls: {count}\n " \
+		"duration: {duration}\n " \
+		"average per second: {rate}\n\n".format(
+			title = title,
+			count = count,
+			duration = duration,
+			rate = count / duration if duration else float('inf'),
+		)
+	)
+
+def timeSerialize(count):
+	"""
+	Serialize the Bind, Execute, Sync sequence of first() with and
+	without a `BindTemplate`.
+	"""
+	formats = (element.BinaryFormat,)
+	params = (b'\x00\x00\x00\x01',)
+	execute = element.Execute(b'', 0xFFFFFFFF)
+	start = time.time()
+	for x in range(count):
+		client.cat_messages((
+			element.Bind(b'', b'kv_lookup', formats, params, formats),
+			element.Execute(b'', 0xFFFFFFFF),
+			element.SynchronizeMessage,
+		))
+	summarize('Bind', count, time.time() - start)
+
+	template = element.BindTemplate(b'', b'kv_lookup', formats, formats)
+	start = time.time()
+	for x in range(count):
+		client.cat_messages((
+			template(params), execute, element.SynchronizeMessage,
+		))
+	summarize('BindTemplate', count, time.time() - start)
+
+def timeFirst(ps, count, keys):
+	start = time.time()
+	for x in range(count):
+		ps.first(x % keys + 1)
+	summarize('first()', count, time.time() - start)
+
+def main(count, keys = 1000):
+	timeSerialize(count)
+	execute("CREATE TEMP TABLE kv (k int4 PRIMARY KEY, v text)")
+	try:
+		prepare(
+			"INSERT INTO kv SELECT i, 'value ' || i::text "
+			"FROM generate_series(1, $1) AS g(i)"
+		)(keys)
+		timeFirst(prepare("SELECT v FROM kv WHERE k = $1"), count, keys)
+	finally:
+		execute("DROP TABLE kv")
+
+def command(args):
+	main(int((args + [20000])[1]))
+
+if __name__ == '__main__':
+	command(sys.argv)
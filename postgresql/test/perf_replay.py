@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+##
+# copyright 2009, James William Pye
+# http://python.projects.postgresql.org
+##
+# Protocol I/O: Decode performance using recorded sessions
+##
+# Replays a capture made with `pg_python --pq-capture` through each stage of the
+# receive path and reports the time spent in each stage. When no capture is
+# given, a synthetic one is generated so that no server is necessary.
+##
+import sys
+import time
+
+from ..protocol import element3 as element
+from ..protocol import xact3 as xact
+from ..protocol import client3 as client
+from ..protocol import typio as pg_typio
+from ..protocol import replay as pg_replay
+from ..protocol.buffer import pq_message_stream
+from .. import types as pg_types
+
+def synthesize(count, recvsize = 2048):
+	"""
+	Create the frames of a capture that selects `count` rows of
+	(int4, text, int8) from the server.
+	"""
+	typio = pg_replay.TypeIO({})
+	int4_pack = typio.resolve_pack(pg_types.INT4OID)
+	int8_pack = typio.resolve_pack(pg_types.INT8OID)
+	sent = client.cat_messages((
+		element.Parse(b'py:perf', b'SELECT i, t, n FROM samples', ()),
+		element.DescribeStatement(b'py:perf'),
+		element.SynchronizeMessage,
+		element.Bind(b'', b'py:perf', (), (), (
+			element.BinaryFormat, element.StringFormat, element.BinaryFormat,
+		)),
+		element.Execute(b'', 0xFFFFFFFF),
+		element.SynchronizeMessage,
+	))
+	received = client.cat_messages([
+		element.ParseCompleteMessage,
+		element.AttributeTypes(()),
+		element.TupleDescriptor((
+			(b'i', 0, 0, pg_types.INT4OID, 4, -1, 0),
+			(b't', 0, 0, pg_types.TEXTOID, -1, -1, 0),
+			(b'n', 0, 0, pg_types.INT8OID, 8, -1, 0),
+		)),
+		element.Ready(b'I'),
+		element.BindCompleteMessage,
+	] + [
+		element.Tuple((int4_pack(x), b'some_text', int8_pack(x * 0xFFFF)))
+		for x in range(count)
+	] + [
+		element.Complete(b'SELECT'),
+		element.Ready(b'I'),
+	])
+	return [(pg_replay.Parameter, element.ShowOption(
+		b'client_encoding', b'UTF8'
+	).serialize())] + [(pg_replay.Sent, sent)] + [
+		(pg_replay.Received, received[x:x+recvsize])
+		for x in range(0, len(received), recvsize)
+	]
+
+def timeStages(frames):
+	"""
+	Time each stage of the receive path using the data in `frames`.
+	Returns a sequence of (stage, duration, count) tuples.
+	"""
+	stages = []
+	typio = pg_replay.TypeIO(pg_replay.parameters(frames))
+	received = pg_replay.received_data(frames)
+
+	# pq_message_stream: frame the received data into messages.
+	buf = pq_message_stream()
+	reads = []
+	start = time.time()
+	for data in received:
+		buf.write(data)
+		reads.append(buf.read())
+	stages.append(('pq_message_stream', time.time() - start, sum(map(len, reads))))
+
+	# element3.Tuple.parse: the tuple messages of each read.
+	tt = element.Tuple.type
+	tuple_reads = [[x for x in r if x[0] is tt] for r in reads]
+	tuple_reads = [x for x in tuple_reads if x]
+	parse = element.Tuple.parse
+	start = time.time()
+	for r in tuple_reads:
+		for x in r:
+			parse(x[1])
+	stages.append(('Tuple.parse', time.time() - start, sum(map(len, tuple_reads))))
+
+	# xact3.Instruction.put_tupledata: the fast path for row data.
+	x = xact.Instruction((element.Execute(b'', 0xFFFFFFFF), element.SynchronizeMessage))
+	start = time.time()
+	for r in tuple_reads:
+		x.put_tupledata(r)
+	stages.append(('put_tupledata', time.time() - start, len(tuple_reads)))
+
+	# typio.process_chunk: the column I/O for the rows of each descriptor.
+	chunks = []
+	io = None
+	td = element.TupleDescriptor.type
+	for r in reads:
+		rows = []
+		for m in r:
+			if m[0] is td:
+				if rows:
+					chunks.append((io, rows))
+					rows = []
+				io = tuple([
+					x or typio.decode for x in typio.resolve_descriptor(
+						element.TupleDescriptor.parse(m[1]), 1
+					)
+				])
+			elif m[0] is tt and io is not None:
+				rows.append(parse(m[1]))
+		if rows:
+			chunks.append((io, rows))
+	def fail(procs, tup, itemnum):
+		raise
+	start = time.time()
+	for io, rows in chunks:
+		pg_typio.process_chunk(io, rows, fail)
+	stages.append(('process_chunk', time.time() - start, sum([len(x[1]) for x in chunks])))
+
+	# TypeIO.processors: the generated column I/O for the rows of each descriptor.
+	start = time.time()
+	for io, rows in chunks:
+		typio.processors(io)[1](rows, fail)
+	stages.append(('processors', time.time() - start, sum([len(x[1]) for x in chunks])))
+
+	# client3.Connection: the entire session.
+	start = time.time()
+	pg_replay.replay(frames)
+	stages.append(('client3.Connection', time.time() - start, len(received)))
+	return stages
+
+def main(frames):
+	for stage, duration, count in timeStages(frames):
+		sys.stderr.write(
+			"{stage} Summary,\n " \
+			"processed: {count}\n " \
+			"duration: {duration}\n " \
+			"average per second: {rate}\n\n".format(
+				stage = stage,
+				count = count,
+				duration = duration,
+				rate = count / duration if duration else float('inf'),
+			)
+		)
+
+def command(args):
+	if len(args) > 1 and not args[1].isdigit():
+		with open(args[1], 'rb') as capture:
+			frames = pg_replay.read_capture(capture)
+	else:
+		frames = synthesize(int((args + [100000])[1]))
+	main(frames)
+
+if __name__ == '__main__':
+	command(sys.argv)
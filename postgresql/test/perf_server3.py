@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+##
+# copyright 2009, James William Pye
+# http://python.projects.postgresql.org
+##
+# Client throughput against the scriptable backend, `postgresql.protocol.server3`
+##
+# Usage: perf_server3 [connections [rows [width [latency]]]]
+##
+import sys
+import time
+from threading import Thread
+
+from ..protocol import element3 as element
+from ..protocol import xact3 as xact
+from ..protocol import client3 as client
+from ..protocol import server3
+
+def summarize(title, count, duration):
+	sys.stderr.write(
+		"{title} Summary,\n " \
+		"processed: {count}\n " \
+		"duration: {duration}\n " \
+		"average per second: {rate}\n\n".format(
+			title = title,
+			count = count,
+			duration = duration,
+			rate = count / duration if duration else float('inf'),
+		)
+	)
+
+def main(connections, rows, width, latency, loops = 10):
+	srv = server3.Server(
+		[(r'FROM samples', server3.synthetic(rows, width = width))],
+		latency = latency,
+	)
+	srv.start()
+	try:
+		sf = srv.socket_factory()
+		pqs = [client.Connection(sf, {}) for x in range(connections)]
+
+		start = time.time()
+		for pq in pqs:
+			pq.connect()
+		summarize('Connect', connections, time.time() - start)
+
+		query = (
+			element.Bind(b'', b'samples', (), (), (element.BinaryFormat,)),
+			element.Execute(b'', 0xFFFFFFFF),
+			element.SynchronizeMessage,
+		)
+		for pq in pqs:
+			x = xact.Instruction((
+				element.Parse(b'samples', b'SELECT i, t FROM samples', ()),
+				element.SynchronizeMessage,
+			))
+			pq.push(x)
+			pq.complete()
+
+		received = [0] * connections
+		def run(i):
+			pq = pqs[i]
+			for l in range(loops):
+				x = xact.Instruction(query)
+				pq.push(x)
+				pq.complete()
+				received[i] += len([
+					y for y in x.messages_received()
+					if y.type is element.Tuple.type
+				])
+		threads = [Thread(target = run, args = (x,)) for x in range(connections)]
+		start = time.time()
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+		summarize('Tuples', sum(received), time.time() - start)
+		summarize('Queries', connections * loops, time.time() - start)
+
+		for pq in pqs:
+			pq.socket.close()
+	finally:
+		srv.stop()
+
+def command(args):
+	args = args + [None] * 4
+	main(
+		int(args[1] or 16),
+		int(args[2] or 10000),
+		int(args[3] or 32),
+		float(args[4] or 0),
+	)
+
+if __name__ == '__main__':
+	command(sys.argv)
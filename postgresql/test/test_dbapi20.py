@@ -485,6 +485,91 @@ class test_dbapi20(TestCaseWithCluster):
 		finally:
 			self.driver.paramstyle = 'pyformat'
 
+	def test_executemany_rewrite(self):
+		con = self._connect()
+		try:
+			cur = con.cursor()
+			cur.execute('create table %sbulk (i int, t text)' % self.table_prefix)
+			q = 'insert into %sbulk (i, t) values (%%s, %%s)' % self.table_prefix
+			rows = [(i, str(i)) for i in range(1000)]
+			for rewrite in (None, 'values', 'copy'):
+				con.executemany_rewrite = rewrite
+				cur.executemany(q, rows)
+				self.assertEqual(cur.rowcount, 1000)
+			cur.execute(
+				'select count(*), sum(i), count(distinct t) from %sbulk' %(
+					self.table_prefix
+				)
+			)
+			self.assertEqual(cur.fetchall(), [(3000, 3 * 499500, 1000)])
+			con.executemany_rewrite = 'bad'
+			self.failUnlessRaises(ValueError, cur.executemany, q, rows)
+		finally:
+			con.close()
+
+	def test_named_cursor(self):
+		con = self._connect()
+		try:
+			cur = con.cursor(name = 'dbapi20_named')
+			cur.itersize = 7
+			cur.execute('select i from generate_series(1, %s) AS g(i)', (100,))
+			self.assertEqual(cur.description[0][0], 'i')
+			self.assertEqual(cur.fetchone(), (1,))
+			self.assertEqual(cur.fetchmany(3), [(2,), (3,), (4,)])
+			self.assertEqual(next(cur), (5,))
+			self.assertEqual(len(cur.fetchall()), 95)
+			self.assertEqual(cur.fetchall(), [])
+			self.assertEqual(cur.fetchone(), None)
+			# the name may be declared again
+			cur.execute('select 1')
+			self.assertEqual(list(cur), [(1,)])
+			self.failUnlessRaises(self.driver.ProgrammingError,
+				cur.execute, 'set search_path to public'
+			)
+			cur.close()
+		finally:
+			con.close()
+
+	def test_named_cursor_options(self):
+		con = self._connect()
+		try:
+			q = 'select i from generate_series(1, 10) AS g(i)'
+			cur = con.cursor(name = 'dbapi20_noscroll')
+			cur.execute(q)
+			self.assertEqual(cur.fetchmany(3), [(1,), (2,), (3,)])
+			cur.scroll(2)
+			self.assertEqual(cur.fetchone(), (6,))
+			# NO SCROLL
+			self.failUnlessRaises(self.driver.Error, cur.scroll, -2)
+			con.rollback()
+			cur.execute(q)
+			self.assertEqual(cur.fetchmany(1), [(1,)])
+			con.commit()
+			# WITHOUT HOLD
+			self.failUnlessRaises(self.driver.Error, cur.fetchall)
+			con.rollback()
+			cur.close()
+
+			cur = con.cursor(name = 'dbapi20_scroll',
+				scrollable = True, withhold = True
+			)
+			cur.execute(q)
+			self.assertEqual(cur.fetchmany(4), [(1,), (2,), (3,), (4,)])
+			cur.scroll(-2)
+			self.assertEqual(cur.fetchone(), (3,))
+			cur.scroll(0, mode = 'absolute')
+			self.assertEqual(cur.fetchmany(1), [(1,)])
+			con.commit()
+			self.assertEqual(len(cur.fetchall()), 9)
+			self.failUnlessRaises(ValueError, cur.scroll, 0, 'backward')
+			cur.close()
+
+			cur = con.cursor()
+			cur.execute(q)
+			self.failUnlessRaises(self.driver.NotSupportedError, cur.scroll, 1)
+		finally:
+			con.close()
+
 	def test_fetchone(self):
 		con = self._connect()
 		try:
@@ -822,6 +907,31 @@ class test_dbapi20(TestCaseWithCluster):
 		finally:
 			con.close()
 
+	def test_query_cache(self):
+		con = self._connect()
+		try:
+			cur = con.cursor()
+			self.executeDDL1(cur)
+			q = 'select name from %sbooze where name = %%s' % self.table_prefix
+			cur.execute(q, ('Cooper\'s',))
+			ps = con._query_cache[q][0]
+			cur.execute(q, ('Cooper\'s',))
+			self.failUnless(con._query_cache[q][0] is ps)
+			self.assertEqual(cur.fetchall(), [])
+			# errors discard the cached statement
+			cur.execute('drop table %sbooze' % self.table_prefix)
+			self.failUnlessRaises(self.driver.ProgrammingError,
+				cur.execute, q, ('Cooper\'s',)
+			)
+			self.failIf(q in con._query_cache)
+			con.rollback()
+			con.query_cache_size = 1
+			cur.execute('select 1')
+			cur.execute('select 2')
+			self.assertEqual(list(con._query_cache), ['select 2'])
+		finally:
+			con.close()
+
 	def test_Date(self):
 		d1 = self.driver.Date(2002,12,25)
 		d2 = self.driver.DateFromTicks(time.mktime((2002,12,25,0,0,0,0,0,0)))
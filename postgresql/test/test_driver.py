@@ -18,6 +18,8 @@ from .. import types as pg_types
 from .. import exceptions as pg_exc
 from .. import unittest as pg_unittest
 from .. import lib as pg_lib
+from .. import string as pg_str
+from ..coalesce import Coalescer
 
 type_samples = [
 	('smallint', (
@@ -354,6 +356,62 @@ class test_driver(pg_unittest.TestCaseWithCluster):
 		c2 = c.clone()
 		self.failUnlessEqual(c.read(), c2.read())
 
+	def testPrepareMany(self):
+		ps = self.db.prepare_many((
+			"SELECT $1::int", "SELECT 'foo'::text, $1::text", "SET TIME ZONE UTC",
+		))
+		self.failUnlessEqual(ps[0].first(1), 1)
+		self.failUnlessEqual(ps[1].first('bar'), 'foo')
+		self.failUnlessEqual(ps[1].column_names, ['text', 'text'])
+		self.failUnlessEqual(ps[2].column_names, None)
+		self.failUnlessEqual(ps[2](), ('SET', None))
+		self.failUnlessEqual(self.db.prepare_many(()), [])
+		try:
+			self.db.prepare_many((
+				"SELECT 1", "SELECT * FROM nosuchtable", "SELECT 2",
+			))
+		except pg_exc.UndefinedTableError as err:
+			self.failUnlessEqual(err.creator.string, "SELECT * FROM nosuchtable")
+			# the statements already parsed are closed
+			self.failUnless(err.creator.closed)
+			garbage = self.db.pq.garbage_statements
+			self.failUnless(err.creator._pq_statement_id in garbage)
+			self.failUnless(len(garbage) >= 2)
+		else:
+			self.fail("prepare_many did not raise UndefinedTableError")
+		self.failUnlessEqual(self.db.prepare("SELECT 1").first(), 1)
+
+	def testLazyMetadata(self):
+		db = self.db.clone()
+		try:
+			self.failUnlessEqual(db._version, None)
+			self.failUnlessEqual(db._activity_row, None)
+			self.failUnlessEqual(
+				db.version, db.prepare("SELECT pg_catalog.version()").first()
+			)
+			self.failUnlessEqual(db.type, db.version.split()[0])
+			r = db.sys.activity_for(db.backend_id)
+			self.failUnlessEqual(db.client_port, r.get('client_port'))
+			self.failUnlessEqual(db.backend_start, r.get('backend_start'))
+		finally:
+			db.close()
+		# Loaded values remain available after closing.
+		self.failUnless(db.version)
+
+	def testXactAfterConnect(self):
+		# No statements run before the first block, so it must BEGIN.
+		db = self.db.clone()
+		try:
+			with db.xact():
+				db.execute("CREATE TEMP TABLE after_connect (i int)")
+				self.failUnlessEqual(db.state, 'idle in block')
+			self.failUnlessEqual(db.state, 'idle')
+			self.failUnlessEqual(db.prepare(
+				"SELECT count(*) FROM after_connect"
+			).first(), 0)
+		finally:
+			db.close()
+
 	def testItsClosed(self):
 		ps = self.db.prepare("SELECT 1")
 		# If scroll is False it will pre-fetch, and no error will be thrown.
@@ -618,6 +676,33 @@ class test_driver(pg_unittest.TestCaseWithCluster):
 			self.failUnlessEqual(foo_content, list(range(200)))
 			self.db.execute("DROP TABLE foo")
 
+	def testCopyFromFile(self):
+		import io
+		import tempfile
+		data = b''.join([
+			str(i).encode('ascii') + b'\t' + str(i % 7).encode('ascii') + b'\n'
+			for i in range(1000)
+		])
+		with tempfile.NamedTemporaryFile() as f:
+			f.write(data)
+			f.flush()
+			with self.db.xact():
+				self.db.execute("CREATE TEMP TABLE foo (i int, j int)")
+				self.failUnlessEqual(self.db.copy_from_file(f.name, 'foo'), 1000)
+				# lines are not split by the chunks
+				f.seek(0)
+				self.failUnlessEqual(
+					self.db.copy_from_file(f, 'foo', ('i', 'j'), chunksize = 100),
+					1000
+				)
+				self.failUnlessEqual(self.db.copy_from_file(
+					io.BytesIO(b'i,j\n1,2\n'), 'foo', options = 'CSV HEADER'
+				), 1)
+				self.failUnlessEqual(self.db.prepare(
+					"SELECT count(*), sum(i), sum(j) FROM foo"
+				).first(), (2001, 999001, 5996))
+				self.db.execute("DROP TABLE foo")
+
 	def testLookupProcByName(self):
 		self.db.execute(
 			"CREATE OR REPLACE FUNCTION public.foo() RETURNS INT LANGUAGE SQL AS 'SELECT 1'"
@@ -705,6 +790,117 @@ class test_driver(pg_unittest.TestCaseWithCluster):
 		with self.db.xact():
 			self.testSelect()
 
+	def testMemoizedRows(self):
+		ps = self.db.prepare(
+			"SELECT i, 'state_' || (i % 3)::text AS s " \
+			"FROM generate_series(1, 3000) AS g(i)"
+		)
+		expected = [(x[0], x[1]) for x in ps()]
+		for memo in (True, ['s'], [1]):
+			rows = list(ps.rows(memo = memo))
+			self.failUnlessEqual([(x[0], x[1]) for x in rows], expected)
+			self.failUnless(rows[0]['s'] is rows[3]['s'])
+		self.failUnlessRaises(KeyError, ps.chunks, memo = ['nosuchcolumn'])
+
+	def testRowFactory(self):
+		sql = "SELECT i, i::text AS t, 'x' FROM generate_series(1, 3) AS g(i)"
+		ps = self.db.prepare(sql, row_factory = pg_types.dict_factory)
+		self.failUnlessEqual(ps.first(), {'i' : 1, 't' : '1', '?column?' : 'x'})
+		self.failUnlessEqual([x['i'] for x in ps()], [1, 2, 3])
+		self.failUnlessEqual(ps.declare().read(1), [{'i' : 1, 't' : '1', '?column?' : 'x'}])
+		self.failUnlessEqual(ps.clone().first(), ps.first())
+
+		ps = self.db.prepare(sql, row_factory = pg_types.namedtuple_factory)
+		r = ps.first()
+		self.failUnlessEqual((r.i, r.t, r._2), (1, '1', 'x'))
+		r = list(ps.rows(row_factory = pg_types.dataclass_factory))[-1]
+		self.failUnlessEqual((r.i, r.t, r._2), (3, '3', 'x'))
+		r = list(ps.chunks(row_factory = pg_types.tuple_factory))[0]
+		self.failUnlessEqual(type(r[0]), tuple)
+
+		self.db.row_factory = pg_types.tuple_factory
+		try:
+			self.failUnlessEqual(type(self.db.prepare(sql).first()), tuple)
+		finally:
+			self.db.row_factory = None
+		self.failUnlessEqual(type(self.db.prepare(sql).first()), pg_types.Row)
+
+	def testQuery(self):
+		self.failUnlessEqual(self.db.query("SELECT $1::int + 1 AS n", 1), [(2,)])
+		self.failUnlessEqual(self.db.query("SELECT $1 + 1", 1)[0]['?column?'], 2)
+		self.failUnlessEqual(
+			self.db.query("SELECT $1, $2", 'text', None, types = (25, 23)),
+			[('text', None)]
+		)
+		self.failUnlessEqual(
+			self.db.query("SELECT i FROM generate_series(1, $1) AS g(i)", 3),
+			[(1,), (2,), (3,)]
+		)
+		self.failUnlessEqual(self.db.query_first("SELECT $1::text", 'x'), 'x')
+		self.failUnlessEqual(self.db.query_first("SELECT 1 WHERE false"), None)
+		self.failUnlessEqual(
+			self.db.query_first("SELECT 1 AS a, 2 AS b")['b'], 2
+		)
+		self.db.execute("CREATE TEMP TABLE query_table (i int)")
+		self.failUnlessEqual(
+			self.db.query("INSERT INTO query_table SELECT generate_series(1, $1)", 4),
+			('INSERT', 4)
+		)
+		self.failUnlessEqual(
+			self.db.query_first("DELETE FROM query_table WHERE i > $1", 2), 2
+		)
+		# columns without binary I/O are given as bytes with a warning the
+		# first time, and are requested as text after that.
+		msgs = []
+		self.db.msghook = lambda x: msgs.append(x) or True
+		try:
+			self.failUnlessEqual(
+				self.db.query_first("SELECT 'int4'::regtype"), b'\x00\x00\x00\x17'
+			)
+		finally:
+			del self.db.msghook
+		self.failUnlessEqual(
+			[type(x) for x in msgs], [pg_exc.TypeConversionWarning]
+		)
+		self.failUnlessEqual(
+			self.db.query_first("SELECT 'int4'::regtype"), 'integer'
+		)
+		# and the statement is only executed once.
+		self.db.execute("CREATE TEMP SEQUENCE query_seq")
+		self.db.msghook = lambda x: True
+		try:
+			self.failUnlessEqual(self.db.query_first(
+				"SELECT nextval('query_seq'), 'int4'::regtype"
+			)[0], 1)
+		finally:
+			del self.db.msghook
+		self.failUnlessEqual(self.db.query_first(
+			"SELECT nextval('query_seq'), 'int4'::regtype"
+		), (2, 'integer'))
+		self.failUnlessRaises(TypeError, self.db.query, "SELECT $1", 1, types = ())
+		self.failUnlessRaises(pg_exc.UndefinedTableError,
+			self.db.query, "SELECT * FROM no_such_table"
+		)
+
+	def testQueryRoundTrips(self):
+		db = self.db.clone()
+		try:
+			pushed = []
+			push = db._pq_push
+			def count(*args):
+				pushed.append(args[0])
+				return push(*args)
+			db._pq_push = count
+			# a statement the connection has not run before
+			self.failUnlessEqual(
+				db.query("SELECT $1::int8 * 2, 'x'::text AS t", 21), [(42, 'x')]
+			)
+			self.failUnlessEqual(len(pushed), 1)
+			self.failUnlessEqual(db.query_first("SELECT 'y'::text || $1", 'z'), 'yz')
+			self.failUnlessEqual(len(pushed), 2)
+		finally:
+			db.close()
+
 	def testCursorRead(self):
 		ps = self.db.prepare("SELECT i FROM generate_series(0, (2^8)::int - 1) AS g(i)")
 		c = ps.declare()
@@ -780,6 +976,43 @@ class test_driver(pg_unittest.TestCaseWithCluster):
 		c.seek(10, 2)
 		self.failUnlessEqual(r1, c.read(10))
 
+	def testCursorPosition(self):
+		# Without read-ahead, the server's position is the cursor's.
+		with self.db.xact():
+			self.db.execute("CREATE TEMP TABLE positioned AS " \
+				"SELECT i FROM generate_series(1, 10) AS g(i)")
+			c = self.db.prepare("SELECT i FROM positioned").declare()
+			self.failUnlessEqual(c.read(3), [(1,), (2,), (3,)])
+			c.seek(-1, 'RELATIVE')
+			self.failUnlessEqual(next(c), (3,))
+			self.db.execute(
+				"UPDATE positioned SET i = -i WHERE CURRENT OF " + \
+				pg_str.quote_ident(c.cursor_id)
+			)
+			self.failUnlessEqual(self.db.prepare(
+				"SELECT i FROM positioned WHERE i < 0"
+			).first(), -3)
+
+	def testCursorWindow(self):
+		ps = self.db.prepare("SELECT i FROM generate_series(0, 999) AS g(i)")
+		c = ps.declare()
+		c.readahead = 16
+		self.failUnlessEqual([x for x, in c.read(5)], list(range(5)))
+		self.failUnlessEqual(next(c), (5,))
+		self.failUnlessEqual([next(c)[0] for x in range(100)], list(range(6, 106)))
+		c.seek(-50, 'RELATIVE')
+		self.failUnlessEqual([x for x, in c.read(3)], [56, 57, 58])
+		self.failUnlessEqual([x for x, in c.read(3, 'BACKWARD')], [57, 56, 55])
+		c.seek(10, 'RELATIVE')
+		self.failUnlessEqual([x for x, in c.read(3)], [65, 66, 67])
+		self.failUnlessEqual(len(c.read()), 932)
+		self.failUnlessEqual(c.read(), [])
+		self.failUnlessRaises(StopIteration, next, c)
+		self.failUnlessEqual([x for x, in c.read(2, 'BACKWARD')], [999, 998])
+		c.seek(0)
+		c.readahead = 0
+		self.failUnlessEqual([x for x, in c], list(range(1000)))
+
 	def testScrollBackwards(self):
 		self.testScroll(direction = False)
 
@@ -937,6 +1170,136 @@ class test_driver(pg_unittest.TestCaseWithCluster):
 		with self.db.xact():
 			self.testBatchDML()
 
+	def testCoalescer(self):
+		self.db.execute("CREATE TEMP TABLE coalesced (i int)")
+		insert = self.db.prepare("INSERT INTO coalesced VALUES ($1)")
+		futures = []
+		with Coalescer(insert, batch_size = 50, delay = 0.01) as c:
+			def submit(rows):
+				futures.extend([c.submit(x) for x in rows])
+			threads = [
+				threading.Thread(target = submit, args = ([(x,)] * 100,))
+				for x in range(4)
+			]
+			for x in threads:
+				x.start()
+			for x in threads:
+				x.join()
+			c.flush()
+			self.failUnlessEqual(len(c), 0)
+			for f in futures:
+				self.failUnlessEqual(f.result(), None)
+			# Failures are isolated to the rows that caused them.
+			good = c.submit((10,))
+			bad = c.submit(('ten',))
+		self.failUnlessEqual(good.result(), None)
+		self.failUnless(isinstance(bad.exception(), pg_exc.Error))
+		self.failUnlessRaises(RuntimeError, c.submit, (1,))
+		self.failUnlessEqual(
+			self.db.prepare("SELECT count(*), sum(i) FROM coalesced").first(),
+			(401, 610)
+		)
+
+	def testBulkUpsert(self):
+		self.db.execute("CREATE TEMP TABLE bulk (k int PRIMARY KEY, v text)")
+		self.db.prepare("INSERT INTO bulk VALUES ($1, $2)").load_rows([
+			(x, 'old') for x in range(10)
+		])
+		rows = [(x, 'new' + str(x)) for x in range(5, 15)]
+		self.failUnlessEqual(
+			self.db.bulk_upsert('bulk', ('k', 'v'), rows, key = 'k'), (5, 5)
+		)
+		content = self.db.prepare("SELECT k, v FROM bulk ORDER BY k")
+		self.failUnlessEqual(
+			[tuple(x) for x in content()],
+			[(x, 'old') for x in range(5)] + rows
+		)
+		self.failUnlessEqual(
+			self.db.bulk_update('bulk', ('v', 'k'), [('x', 0), ('y', 99)], ('k',)),
+			1
+		)
+		self.failUnlessEqual(content.first(), (0, 'x'))
+		self.failUnlessEqual(
+			self.db.prepare("SELECT count(*) FROM bulk").first(), 15
+		)
+		# key-only rows are inserted when missing
+		self.failUnlessEqual(
+			self.db.bulk_upsert('bulk', ('k',), [(0,), (99,)], 'k'), (0, 1)
+		)
+		self.failUnlessEqual(content.first(), (0, 'x'))
+		# the staging tables are dropped
+		self.failUnlessEqual(self.db.prepare(
+			"SELECT count(*) FROM pg_catalog.pg_class WHERE relname ~ '^py:stage:'"
+		).first(), 0)
+		self.failUnlessRaises(ValueError,
+			self.db.bulk_update, 'bulk', ('v',), [('x',)], 'k'
+		)
+
+	def testBulkUpsertInXact(self):
+		with self.db.xact():
+			self.testBulkUpsert()
+
+	def testKeySet(self):
+		self.db.execute("CREATE TEMP TABLE keyed (k int8, v text)")
+		self.db.prepare("INSERT INTO keyed VALUES ($1, $2)").load_rows([
+			(x, str(x)) for x in range(100)
+		])
+		for threshold in (1000, 10):
+			with self.db.with_keyset(
+				range(0, 200, 3), threshold = threshold, parameter = 2
+			) as ks:
+				self.failUnlessEqual(ks.table is None, threshold == 1000)
+				ps = self.db.prepare(
+					"SELECT count(*) FROM keyed JOIN " + ks.relation + \
+					" AS ks ON (ks.key = keyed.k) WHERE v != $1"
+				)
+				self.failUnlessEqual(ps.first('3', *ks.parameters), 33)
+			if threshold == 10:
+				self.failUnlessEqual(self.db.prepare(
+					"SELECT count(*) FROM pg_catalog.pg_class " \
+					"WHERE relname ~ '^py:keyset'"
+				).first(), 0)
+		with self.db.with_keyset(['1', '2'], typname = 'text') as ks:
+			self.failUnlessEqual(self.db.prepare(
+				"SELECT count(*) FROM keyed WHERE v IN " \
+				"(SELECT key FROM " + ks.relation + " AS ks)"
+			).first(*ks.parameters), 2)
+
+	def testKeySetInXact(self):
+		with self.db.xact():
+			self.testKeySet()
+
+	def testByteaBuffers(self):
+		import array
+		data = bytes(range(256)) * 64
+		ps = self.db.prepare("SELECT $1::bytea")
+		for x in (
+			bytearray(data), memoryview(data), memoryview(data)[1:],
+			array.array('B', data),
+		):
+			self.failUnlessEqual(ps.first(x), bytes(x))
+
+		buf = bytearray(len(data) + 10)
+		sql = "SELECT $1::bytea"
+		self.failUnlessEqual(self.db.bytea_into(buf, sql, data, chunksize = 1000), len(data))
+		self.failUnlessEqual(buf[:len(data)], data)
+		self.failUnlessEqual(self.db.bytea_into(buf, "SELECT NULL::bytea"), None)
+		self.failUnlessRaises(ValueError, self.db.bytea_into, bytearray(10), sql, data)
+		self.failUnlessEqual(self.db.bytea_into(buf, "SELECT ''::bytea"), 0)
+		self.failUnlessEqual(self.db.bytea_into(buf, "SELECT 'x'::bytea WHERE false"), None)
+		self.failUnlessRaises(ValueError, self.db.bytea_into, buf, sql, data, chunksize = 0)
+		# the statement is run once
+		self.db.execute("CREATE TEMP SEQUENCE bytea_seq")
+		self.failUnlessEqual(self.db.bytea_into(buf,
+			"SELECT pg_catalog.repeat('x', 10 * nextval('bytea_seq')::int)::bytea",
+			chunksize = 3
+		), 10)
+		self.failUnlessEqual(buf[:10], b'x' * 10)
+		self.failUnlessEqual(self.db.prepare("SELECT nextval('bytea_seq')").first(), 2)
+		with self.db.xact():
+			self.failUnlessEqual(self.db.bytea_into(buf, sql, b'x'), 1)
+			self.failUnlessEqual(buf[:1], b'x')
+
 	def testTypes(self):
 		'test basic object I/O--input must equal output'
 		for (typname, sample_data) in type_samples:
@@ -1300,6 +1663,37 @@ class test_driver(pg_unittest.TestCaseWithCluster):
 				# driver should have released/aborted instead
 				self.failUnlessEqual(err.source, 'CLIENT')
 
+	def testDeferredTransaction(self):
+		# empty blocks never reach the server
+		with self.db.xact(deferred = True):
+			self.failUnlessEqual(len(self.db._xact_queue), 1)
+			self.failUnlessEqual(self.db.pq.state, b'I')
+		self.failUnlessEqual(self.db._xact_queue, [])
+		self.db.execute("CREATE TEMP TABLE deferred_xact (i int)")
+		with self.db.xact(deferred = True):
+			with self.db.xact(deferred = True):
+				self.failUnlessEqual(len(self.db._xact_queue), 2)
+				self.db.execute("INSERT INTO deferred_xact VALUES (1)")
+				self.failUnlessEqual(self.db._xact_queue, [])
+				self.failUnlessEqual(self.db.pq.state, b'T')
+			try:
+				with self.db.xact(deferred = True):
+					self.db.prepare("INSERT INTO deferred_xact VALUES (2)")()
+					raise ValueError
+			except ValueError:
+				pass
+		self.failUnlessEqual(
+			self.db.prepare("SELECT i FROM deferred_xact").first(), 1
+		)
+		# errors in the first statement fail the block
+		try:
+			with self.db.xact(deferred = True):
+				self.db.execute("selekt 1;")
+			self.fail("deferred block did not raise the statement's error")
+		except pg_exc.SyntaxError:
+			pass
+		self.failUnlessEqual(self.db.pq.state, b'I')
+
 	def testCloseInSubTransactionBlock(self):
 		try:
 			with self.db.xact():
@@ -1349,6 +1743,52 @@ class test_driver(pg_unittest.TestCaseWithCluster):
 		self.failUnlessEqual(self.db.settings['search_path'], sub['search_path'])
 		self.failUnlessEqual(self.db.settings['default_statistics_target'], sub['default_statistics_target'])
 
+	def testSettingsMirror(self):
+		st = self.db.settings
+		wm = st['work_mem']
+		# loaded the rest with the first non-reported setting
+		self.failUnless(st._complete)
+		self.failUnless('TimeZone' in st._reported)
+		self.db.execute("SET work_mem = '1234kB'")
+		self.failUnlessEqual(st['work_mem'], '1234')
+		with self.db.xact():
+			self.db.execute("SET LOCAL work_mem = '2345kB'")
+			self.failUnlessEqual(st['work_mem'], '2345')
+		self.failUnlessEqual(st['work_mem'], '1234')
+		try:
+			with self.db.xact():
+				self.db.prepare("SET work_mem = '3456kB'")()
+				self.failUnlessEqual(st['work_mem'], '3456')
+				raise ValueError
+		except ValueError:
+			pass
+		self.failUnlessEqual(st['work_mem'], '1234')
+		st['work_mem'] = wm
+		self.failUnlessEqual(st['work_mem'], wm)
+		# reported settings are updated by the server
+		tz = st['TimeZone']
+		self.db.execute("SET TIME ZONE 'America/Phoenix'")
+		self.failUnlessEqual(st['TimeZone'], 'America/Phoenix')
+		del st['TimeZone']
+		self.failUnlessEqual(st['TimeZone'], tz)
+
+	def testSettingsNames(self):
+		db = self.db.clone()
+		try:
+			st = db.settings
+			# the reported settings are merged with the prefetched ones
+			names = list(st.keys())
+			self.failUnlessEqual(len(names), len(set([x.lower() for x in names])))
+			self.failUnlessEqual(len(st), db.prepare(
+				"SELECT count(*) FROM pg_catalog.pg_settings"
+			).first())
+			db.execute("SET TIME ZONE 'America/Phoenix'")
+			for x in ('TimeZone', 'timezone', 'TIMEZONE'):
+				self.failUnlessEqual(st[x], 'America/Phoenix')
+			self.failUnlessEqual(st.get('datestyle'), st['DateStyle'])
+		finally:
+			db.close()
+
 	def testSettings(self):
 		'general access tests'
 		d = dict(self.db.settings)
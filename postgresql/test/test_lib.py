@@ -55,6 +55,72 @@ test_ilf_proc(int)
 test_ilf_srf_proc(int)
 """
 
+class test_ilf_compiled(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.dir.name, 'libcompiled.sql')
+		with open(self.path, 'w', encoding = 'utf-8') as f:
+			f.write(ilf)
+
+	def tearDown(self):
+		pg_sys.libcache = None
+		self.dir.cleanup()
+
+	def symbols(self, lib):
+		return [
+			(x.name, x.type, x.method, x.source)
+			for x in map(lib.get_symbol, sorted(lib.symbols()))
+		]
+
+	def testCompile(self):
+		parsed = pg_lib.ILF.open(self.path, encoding = 'utf-8')
+		lib = pg_lib.ILF.open_compiled(self.path, encoding = 'utf-8')
+		cpath = pg_lib.ILF.compiled_path(self.path)
+		self.failUnless(os.path.exists(cpath))
+		self.failUnlessEqual(lib.name, 'compiled')
+		self.failUnlessEqual(lib.address, self.path)
+		self.failUnlessEqual(lib.preload, {'sym_preload'})
+		self.failUnlessEqual(self.symbols(lib), self.symbols(parsed))
+		# loaded from the compiled form
+		lib = pg_lib.ILF.open_compiled(self.path, encoding = 'utf-8')
+		self.failUnlessEqual(self.symbols(lib), self.symbols(parsed))
+		self.failUnlessEqual(lib.preface, parsed.preface)
+
+	def testInvalidate(self):
+		pg_lib.ILF.open_compiled(self.path)
+		with open(self.path, 'a', encoding = 'utf-8') as f:
+			f.write("\n[sym_new]\nselect 2\n")
+		lib = pg_lib.ILF.open_compiled(self.path)
+		self.failUnlessEqual(str(lib.get_symbol('sym_new')).strip(), 'select 2')
+		# same contents with a new mtime
+		st = os.stat(self.path)
+		os.utime(self.path, (st.st_atime, st.st_mtime + 1))
+		lib = pg_lib.ILF.open_compiled(self.path)
+		self.failUnlessEqual(str(lib.get_symbol('sym_new')).strip(), 'select 2')
+		# corrupt compiled form
+		with open(pg_lib.ILF.compiled_path(self.path), 'wb') as f:
+			f.write(b'garbage')
+		lib = pg_lib.ILF.open_compiled(self.path)
+		self.failUnlessEqual(str(lib.get_symbol('sym_new')).strip(), 'select 2')
+
+	def testLibCache(self):
+		pg_sys.libcache = os.path.join(self.dir.name, 'cache')
+		pg_lib.ILF.open_compiled(self.path)
+		cpath = pg_lib.ILF.compiled_path(self.path)
+		self.failUnless(cpath.startswith(pg_sys.libcache))
+		self.failUnless(os.path.exists(cpath))
+
+	def testShared(self):
+		lib = pg_lib.load(self.path)
+		self.failUnless(pg_lib.load(self.path) is lib)
+		c1 = pg_lib.Category(self.path)
+		c2 = pg_lib.Category(renamed = self.path)
+		self.failUnless(list(c1.libraries)[0] is lib)
+		self.failUnless(list(c2.libraries)[0] is lib)
+		with open(self.path, 'a', encoding = 'utf-8') as f:
+			f.write("\n[sym_new]\nselect 2\n")
+		self.failIf(pg_lib.load(self.path) is lib)
+
 class test_lib(pg_unittest.TestCaseWithCluster):
 	# NOTE: Module libraries are implicitly tested
 	# in postgresql.test.test_driver; much functionality
@@ -85,6 +151,26 @@ class test_lib(pg_unittest.TestCaseWithCluster):
 		self.failUnlessEqual(list(b.sym_srf_proc(2,)), [2])
 		self.failUnlessRaises(AttributeError, getattr, b, 'LIES')
 
+	def testPreload(self):
+		lib = pg_lib.ILF.from_lines([l + '\n' for l in ilf.splitlines()])
+		self.db.execute("CREATE OR REPLACE FUNCTION test_ilf_proc(int) RETURNS int language sql as 'select $1';")
+		self.db.execute("CREATE OR REPLACE FUNCTION test_ilf_srf_proc(int) RETURNS SETOF int language sql as 'select $1';")
+		b = pg_lib.Binding(self.db, lib)
+		self.failUnlessEqual(set(b.__symbol_cache__), {'sym_preload'})
+		b.__preload__(['sym', 'sym_first', 'sym_const'])
+		self.failUnlessEqual(
+			set(b.__symbol_cache__),
+			{'sym_preload', 'sym', 'sym_first', 'sym_const'}
+		)
+		self.failUnlessEqual(b.sym_const, 1)
+		self.failUnlessEqual(b.sym_first(), 1)
+		b.__preload__()
+		self.failUnlessEqual(set(b.__symbol_cache__), set(lib.symbols()))
+		self.failUnlessEqual(b.sym_ref(), [(1,)])
+		self.failUnlessEqual(b.sym_const_rows, [(1,)])
+		self.failUnlessEqual(b.sym_proc(2,), 2)
+		self.failUnlessRaises(AttributeError, b.__preload__, ['LIES'])
+
 	def testILF_from_lines(self):
 		lib = pg_lib.ILF.from_lines([l + '\n' for l in ilf.splitlines()])
 		self._testILF(lib)
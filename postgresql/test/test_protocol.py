@@ -3,8 +3,11 @@
 # http://python.projects.postgresql.org
 ##
 import sys
+import gc
+import weakref
 import unittest
 import struct
+import io
 import decimal
 import socket
 import time
@@ -16,6 +19,8 @@ from ..protocol import client3 as c3
 from ..protocol import buffer as pq_buf
 from ..protocol import typstruct as pg_typstruct
 from ..protocol import typio as pg_typio
+from ..protocol import replay as pg_replay
+from ..protocol import server3 as pg_server
 from .. import types as pg_types
 from ..python.socket import find_available_port, SocketFactory
 
@@ -188,6 +193,16 @@ class test_element3(unittest.TestCase):
 			smsg = msg.serialize()
 			self.failUnlessEqual(msg, msg.parse(smsg))
 
+	def testBindTemplate(self):
+		for msg in message_samples:
+			if type(msg) is not e3.Bind:
+				continue
+			t = e3.BindTemplate(msg.name, msg.statement, msg.aformats, msg.rformats)
+			tmsg = t(msg.arguments)
+			self.failUnlessEqual(tmsg.type, msg.type)
+			self.failUnlessEqual(tmsg.bytes(), msg.bytes())
+			self.failUnlessEqual(tmsg.parse(tmsg.serialize()), msg)
+
 	def testEmptyMessages(self):
 		for x in e3.__dict__.values():
 			if isinstance(x, e3.EmptyMessage):
@@ -494,6 +509,10 @@ class test_client3(unittest.TestCase):
 		# other, copy, copy*1000
 		self.failUnlessEqual(c3.cat_messages(1000*[e3.SynchronizeMessage, b'foo', b'foo']),
 			1000*(e3.SynchronizeMessage.bytes() + 2*b'd\x00\x00\x00\x07foo'))
+		# memoryviews of copy data, adjacent to bytes and other messages
+		mv = memoryview(b'xfoox')[1:4]
+		self.failUnlessEqual(c3.cat_messages([mv, b'foo', e3.SynchronizeMessage, mv]),
+			2*b'd\x00\x00\x00\x07foo' + e3.SynchronizeMessage.bytes() + b'd\x00\x00\x00\x07foo')
 		class ThisEx(Exception):
 			pass
 		class ThatEx(Exception):
@@ -968,6 +987,615 @@ class test_typio(unittest.TestCase):
 					)
 				)
 
+	def testNumeric(self):
+		samples = [
+			'0', '0.00', '1', '-1', '10000', '1E+5', '123.45', '-99999999.00001',
+			'0.0001', '1.10', '1E-20', str(2**100), '-' + str(2**100) + '.5',
+			'722445138.918092539', '1E+400', '-1E+400', '1E-400',
+		]
+		for x in samples:
+			d = decimal.Decimal(x)
+			packed = pg_typio.numeric_pack(d)
+			unpacked = pg_typio.numeric_unpack(packed)
+			self.failUnlessEqual(d, unpacked)
+			if d.as_tuple().exponent <= 0:
+				self.failUnlessEqual(str(d), str(unpacked))
+			self.failUnlessEqual(pg_typio.numeric_unpack_float(packed), float(d))
+		# ints pack exactly as their Decimal
+		for x in (0, 1, -20, 10000, 2**70):
+			self.failUnlessEqual(
+				pg_typio.numeric_pack(x),
+				pg_typio.numeric_pack(decimal.Decimal(x))
+			)
+			self.failUnlessEqual(
+				pg_typio.numeric_unpack_int(pg_typio.numeric_pack(x)), x
+			)
+		self.failUnlessEqual(
+			pg_typio.numeric_unpack_int(pg_typio.numeric_pack(decimal.Decimal('1.5'))),
+			decimal.Decimal('1.5')
+		)
+		self.failUnless(pg_typio.numeric_unpack(
+			pg_typio.numeric_pack(decimal.Decimal('NaN'))
+		).is_nan())
+		self.failUnlessRaises(ValueError,
+			pg_typio.numeric_pack, decimal.Decimal('Infinity')
+		)
+		self.failUnlessEqual(
+			pg_typio.numeric_pack_float(0.1),
+			pg_typio.numeric_pack(decimal.Decimal('0.1'))
+		)
+		typio = pg_replay.TypeIO({})
+		self.failUnlessEqual(typio.resolve(pg_types.NUMERICOID)[1], pg_typio.numeric_unpack)
+		typio.select_numeric_io('float')
+		self.failUnlessEqual(typio.resolve(pg_types.NUMERICOID)[1], pg_typio.numeric_unpack_float)
+		self.failUnlessRaises(ValueError, typio.select_numeric_io, 'complex')
+
+	def testTime64(self):
+		import datetime
+		from ..python.datetime import UTC, FixedOffset, fixed_offset
+		samples = [
+			(pg_types.TIMESTAMPOID, datetime.datetime(2009, 8, 12, 10, 30, 15, 123456)),
+			(pg_types.TIMESTAMPOID, datetime.datetime(1900, 1, 1, 0, 0, 0, 1)),
+			(pg_types.TIMESTAMPTZOID, datetime.datetime(2009, 8, 12, 10, 30, 0, 5, UTC)),
+			(pg_types.TIMESTAMPTZOID, datetime.datetime(1970, 1, 1, 1, 0, 0, 0, FixedOffset(3600))),
+			(pg_types.TIMEOID, datetime.time(23, 59, 59, 999999)),
+			(pg_types.TIMEOID, datetime.time(0, 0, 0, 0)),
+			(pg_types.TIMETZOID, datetime.time(12, 15, 0, 10, FixedOffset(-18000))),
+			(pg_types.INTERVALOID, datetime.timedelta(3, 7200, 1)),
+			(pg_types.INTERVALOID, datetime.timedelta(-1, 5)),
+		]
+		for oid, x in samples:
+			pack, unpack = pg_typio.time64_io[oid]
+			data = pack(x)
+			self.failUnlessEqual(unpack(data), x)
+			# Same data as the (seconds, microseconds) based routines.
+			if oid == pg_types.TIMESTAMPTZOID:
+				seconds = pg_typio.timestamp_pack(x.astimezone(UTC).replace(tzinfo = None))
+				self.failUnlessEqual(data, pg_typstruct.time64_pack(seconds))
+			elif oid == pg_types.TIMESTAMPOID:
+				self.failUnlessEqual(
+					data, pg_typstruct.time64_pack(pg_typio.timestamp_pack(x))
+				)
+			elif oid == pg_types.TIMEOID:
+				self.failUnlessEqual(
+					data, pg_typstruct.time64_pack(pg_typio.time_pack(x))
+				)
+		# timezones are shared
+		tz = pg_typio.time64_io[pg_types.TIMETZOID]
+		a = tz[1](tz[0](datetime.time(1, 0, 0, 0, FixedOffset(7200))))
+		b = tz[1](tz[0](datetime.time(2, 0, 0, 0, FixedOffset(7200))))
+		self.failUnless(a.tzinfo is b.tzinfo)
+		self.failUnless(fixed_offset(7200) is a.tzinfo)
+
+		# epoch microseconds
+		typio = pg_replay.TypeIO({})
+		self.failUnlessRaises(ValueError,
+			typio.select_time_io, (8, 4, 0), True, timestamp_output = 'seconds'
+		)
+		dt = datetime.datetime(2009, 8, 12, 10, 30, 15, 123456)
+		us = ((dt - datetime.datetime(1970, 1, 1)).days * 86400 + 37815) * 1000000 + 123456
+		for integer_datetimes in (True, False):
+			typio = pg_replay.TypeIO({})
+			typio.select_time_io((8, 4, 0), integer_datetimes,
+				timestamp_output = 'microseconds'
+			)
+			for oid in (pg_types.TIMESTAMPOID, pg_types.TIMESTAMPTZOID):
+				pack, unpack = typio.resolve(oid)
+				self.failUnlessEqual(unpack(pack(us)), us)
+				self.failUnlessEqual(unpack(pack(dt.replace(
+					tzinfo = oid == pg_types.TIMESTAMPTZOID and UTC or None
+				))), us)
+			self.failUnlessEqual(
+				typio.resolve(pg_types.TIMEOID)[1](
+					typio.resolve(pg_types.TIMEOID)[0](datetime.time(1, 2, 3))
+				), datetime.time(1, 2, 3)
+			)
+
+	def testFixedArrays(self):
+		import array
+		class TypeIO(pg_replay.TypeIO):
+			def lookup_type_info(self, typid):
+				elements = {
+					pg_types.INT4ARRAYOID : pg_types.INT4OID,
+					1022 : pg_types.FLOAT8OID,
+					1000 : pg_types.BOOLOID,
+				}
+				if typid in elements:
+					return (
+						'pg_catalog', 'array', 'b', -1, elements[typid], 0,
+						elements[typid], True, True
+					)
+		typio = TypeIO({})
+		samples = [
+			(pg_types.INT4ARRAYOID, list(range(-500, 500))),
+			(1022, [0.5, -1.25, 1e300]),
+			(1000, [True, False, True]),
+		]
+		data = [
+			(oid, typio.resolve(oid)[0](pg_types.Array(x)), x)
+			for oid, x in samples
+		]
+		nulls = typio.resolve(pg_types.INT4ARRAYOID)[0](pg_types.Array([1, None]))
+		matrix = typio.resolve(pg_types.INT4ARRAYOID)[0](
+			pg_types.Array([[1, 2, 3], [4, 5, 6]])
+		)
+		self.failUnlessRaises(ValueError, typio.select_array_io, 'list')
+		typio.select_array_io('array')
+		for oid, d, x in data:
+			a, dim = typio.resolve(oid)[1](d)
+			self.failUnless(isinstance(a, array.array))
+			self.failUnlessEqual(list(a), list(x))
+			self.failUnlessEqual(dim, (len(x),))
+		a, dim = typio.resolve(pg_types.INT4ARRAYOID)[1](matrix)
+		self.failUnlessEqual(list(a), [1, 2, 3, 4, 5, 6])
+		self.failUnlessEqual(dim, (2, 3))
+		# NULLs can't be represented
+		self.failUnlessEqual(
+			typio.resolve(pg_types.INT4ARRAYOID)[1](nulls), pg_types.Array([1, None])
+		)
+		typio.select_array_io('elements')
+		self.failUnlessEqual(
+			typio.resolve(pg_types.INT4ARRAYOID)[1](matrix),
+			pg_types.Array([[1, 2, 3], [4, 5, 6]])
+		)
+
+	def testFixedArrayPack(self):
+		import array
+		class TypeIO(pg_replay.TypeIO):
+			def lookup_type_info(self, typid):
+				elements = {
+					pg_types.INT4ARRAYOID : pg_types.INT4OID,
+					1016 : pg_types.INT8OID,
+					1022 : pg_types.FLOAT8OID,
+				}
+				if typid in elements:
+					return (
+						'pg_catalog', 'array', 'b', -1, elements[typid], 0,
+						elements[typid], True, True
+					)
+		typio = TypeIO({})
+		samples = [
+			(pg_types.INT4ARRAYOID, array.array('i', range(-500, 500))),
+			(1016, array.array('q', [1 << 40, -1, 0])),
+			# converted to the element's typecode
+			(1016, array.array('i', [1, 2, 3])),
+			(1022, array.array('d', [0.5, -1.25, 1e300])),
+		]
+		for oid, a in samples:
+			pack, unpack = typio.resolve(oid)
+			d = pack(a)
+			self.failUnlessEqual(d, pack(pg_types.Array(list(a))))
+			self.failUnlessEqual(unpack(d), pg_types.Array(list(a)))
+		pack, unpack = typio.resolve(1016)
+		self.failUnlessEqual(unpack(pack(array.array('q'))), pg_types.Array([]))
+
+	def testUUIDNet(self):
+		import uuid
+		import ipaddress
+		u = uuid.UUID('12345678-1234-5678-1234-567812345678')
+		self.failUnlessEqual(pg_typio.uuid_pack(u), u.bytes)
+		self.failUnlessEqual(pg_typio.uuid_unpack(pg_typio.uuid_pack(str(u))), u)
+		for x in (
+			ipaddress.ip_address('192.168.1.1'),
+			ipaddress.ip_address('::1'),
+			ipaddress.ip_interface('10.1.2.3/8'),
+			ipaddress.ip_interface('fe80::1/64'),
+		):
+			self.failUnlessEqual(pg_typio.inet_unpack(pg_typio.inet_pack(x)), x)
+			self.failUnlessEqual(pg_typio.inet_unpack(pg_typio.inet_pack(str(x))), x)
+		self.failUnlessEqual(
+			pg_typio.inet_pack(ipaddress.ip_address('127.0.0.1')),
+			b'\x02\x20\x00\x04\x7f\x00\x00\x01'
+		)
+		for x in ('10.0.0.0/8', '2001:db8::/32'):
+			n = ipaddress.ip_network(x)
+			data = pg_typio.cidr_pack(x)
+			self.failUnlessEqual(data[2:3], b'\x01')
+			self.failUnlessEqual(pg_typio.cidr_unpack(data), n)
+		self.failUnlessRaises(ValueError, pg_typio.cidr_pack, '10.0.0.1/8')
+
+	def testByteaBuffers(self):
+		import array
+		ba = bytearray(b'\x00data\xff')
+		d = b'data'
+		self.failUnless(pg_typstruct.bytea_pack(d) is d)
+		for x in (ba, memoryview(ba), array.array('B', ba), memoryview(ba)[1:5]):
+			d = pg_typstruct.bytea_pack(x)
+			self.failUnlessEqual(bytes(d), bytes(x))
+		# multi-byte items are given as their bytes
+		a = array.array('i', [1, 2])
+		self.failUnlessEqual(bytes(pg_typstruct.bytea_pack(a)), a.tobytes())
+		self.failUnlessEqual(
+			e3.pack_tuple_data((memoryview(ba), None, b'x')),
+			e3.pack_tuple_data((bytes(ba), None, b'x')),
+		)
+
+	def testTextCodecs(self):
+		class TypeIO(pg_replay.TypeIO):
+			def lookup_type_info(self, typid):
+				if typid == 90000:
+					return ('public', 'mood', b'e', 4, 0, 0, None, None, None, True, True)
+				elif typid == 90001:
+					return ('public', 'hstore', b'b', -1, 0, 0, None, None, None, True, True)
+				elif typid == 90002:
+					return ('public', 'hstore', b'b', -1, 0, 0, None, None, None, False, False)
+		typio = TypeIO({})
+		pack, unpack = typio.resolve(pg_types.JSONOID)
+		self.failUnlessEqual(unpack(pack({'a' : [1, None]})), {'a' : [1, None]})
+		self.failUnlessEqual(pack('{"a" : 1}'), b'{"a" : 1}')
+		pack, unpack = typio.resolve(pg_types.JSONBOID)
+		self.failUnlessEqual(pack([1]), b'\x01[1]')
+		self.failUnlessEqual(unpack(b'\x01[1]'), [1])
+		self.failUnlessRaises(ValueError, unpack, b'\x02[1]')
+		typio.select_json_io(loads = lambda x: ('loaded', x))
+		self.failUnlessEqual(unpack(b'\x01[1]'), ('loaded', '[1]'))
+
+		pack, unpack = typio.resolve(90000)
+		a = unpack(b'happy')
+		self.failUnlessEqual(a, 'happy')
+		self.failUnless(unpack(bytes(b'happy')) is a)
+		self.failUnlessEqual(pack('sad'), b'sad')
+
+		pack, unpack = typio.resolve(90001)
+		h = {'a' : '1', 'b' : None, '\u00fc' : ''}
+		self.failUnlessEqual(unpack(pack(h)), h)
+		self.failUnlessEqual(unpack(pack([('k', 'v')])), {'k' : 'v'})
+		self.failUnlessEqual(typio.resolve(90002), (None, None))
+
+	def testProcessors(self):
+		procs = (int, bytes.decode, float)
+		rows = [(b'1', b'x', b'1.5'), (None, b'y', None), (b'-2', None, b'0')]
+		class Failure(Exception):
+			pass
+		def fail(procs, tup, itemnum):
+			raise Failure(itemnum)
+		typio = pg_replay.TypeIO({})
+		pt, pc = typio.processors(procs)
+		self.failUnless(typio.processors(procs)[0] is pt)
+		self.failUnlessEqual(pc(rows, fail), pg_typio.process_chunk(procs, rows, fail))
+		for x in rows:
+			self.failUnlessEqual(pt(x, fail), pg_typio.process_tuple(procs, x, fail))
+		# the C implementation produces tuples
+		self.failUnlessEqual(
+			list(map(list, pg_typio.processors((int,))[1]([(b'1',), (None,)], fail))),
+			[[1], [None]]
+		)
+		self.failUnlessEqual(list(pg_typio.processors(())[0]((), fail)), [])
+		# more columns than a function can take arguments before Python 3.7
+		procs = (int,) * 300
+		row = tuple([str(x).encode('ascii') for x in range(300)])
+		for wpt, wpc in (
+			pg_typio.processors(procs), pg_typio.generate_processors(procs)
+		):
+			self.failUnlessEqual(list(wpt(row, fail)), list(range(300)))
+			self.failUnlessEqual(list(map(list, wpc([row], fail))), [list(range(300))])
+		# the cached processors are released with the TypeIO
+		typio.processors((typio.decode,))
+		ref = weakref.ref(typio)
+		del typio
+		gc.collect()
+		self.failUnless(ref() is None)
+		# failures identify the item
+		try:
+			pc(rows + [(b'1', b'z', b'bad')], fail)
+		except Failure as err:
+			self.failUnlessEqual(err.args[0], 2)
+		else:
+			self.fail("failed to raise")
+		self.failUnlessRaises(TypeError, pt, (b'1',), fail)
+		self.failUnlessRaises(TypeError, pc, [(b'1', b'2', b'3', b'4')], fail)
+
+	def testMemoize(self):
+		unpack = bytes.decode
+		m = pg_typio.memoize(unpack)
+		data = [b'xx', b'yy', b'xx', b'yy']
+		r = [m(bytes(x)) for x in data]
+		self.failUnlessEqual(r, ['xx', 'yy', 'xx', 'yy'])
+		self.failUnless(r[0] is r[2])
+		# low hit rate drops the memo
+		m = pg_typio.memoize(unpack, sample = 10)
+		r = [m(str(x).encode('ascii')) for x in range(20)] + [m(b'10')]
+		self.failUnlessEqual(r[-1], '10')
+		self.failIf(r[-1] is r[10])
+		# a bounded number of objects is memoized
+		m = pg_typio.memoize(unpack, size = 2)
+		r = [m(bytes(x)) for x in (b'aa', b'bb', b'cc', b'cc', b'aa')]
+		self.failUnless(r[0] is r[4])
+		self.failIf(r[2] is r[3])
+
+	def testInferType(self):
+		import datetime
+		import uuid
+		from ..python.datetime import UTC
+		samples = [
+			(True, pg_types.BOOLOID),
+			(1, pg_types.INT4OID),
+			(-0x80000000, pg_types.INT4OID),
+			(0x80000000, pg_types.INT8OID),
+			(1.5, pg_types.FLOAT8OID),
+			(decimal.Decimal('1.5'), pg_types.NUMERICOID),
+			(b'data', pg_types.BYTEAOID),
+			('text', pg_types.InvalidOid),
+			([1, 2], pg_types.InvalidOid),
+			(datetime.date(2000, 1, 1), pg_types.DATEOID),
+			(datetime.datetime(2000, 1, 1), pg_types.TIMESTAMPOID),
+			(datetime.datetime(2000, 1, 1, tzinfo = UTC), pg_types.TIMESTAMPTZOID),
+			(datetime.time(1), pg_types.TIMEOID),
+			(datetime.time(1, tzinfo = UTC), pg_types.TIMETZOID),
+			(datetime.timedelta(1), pg_types.INTERVALOID),
+			(uuid.UUID(int = 1), pg_types.UUIDOID),
+		]
+		for ob, typid in samples:
+			self.failUnlessEqual(pg_typio.infer_type(ob), typid)
+
+class test_replay(unittest.TestCase):
+	def capture(self):
+		sent = c3.cat_messages((
+			e3.Parse(b'statement', b'SELECT i FROM t', ()),
+			e3.DescribeStatement(b'statement'),
+			e3.SynchronizeMessage,
+			e3.Bind(b'', b'statement', (), (), (e3.StringFormat,)),
+			e3.Execute(b'', 0xFFFFFFFF),
+			e3.SynchronizeMessage,
+			e3.DisconnectMessage,
+		))
+		received = c3.cat_messages([
+			e3.ParseCompleteMessage,
+			e3.AttributeTypes(()),
+			e3.TupleDescriptor((
+				(b'i', 0, 0, pg_types.INT4OID, 4, -1, 0),
+			)),
+			e3.Ready(b'I'),
+			e3.BindCompleteMessage,
+		] + [
+			e3.Tuple((str(x).encode('ascii'),)) for x in range(100)
+		] + [
+			e3.Complete(b'SELECT'),
+			e3.Ready(b'I'),
+		])
+		return [
+			(pg_replay.Parameter, e3.ShowOption(b'client_encoding', b'UTF8').serialize()),
+			(pg_replay.Sent, sent),
+		] + [
+			(pg_replay.Received, received[x:x+64])
+			for x in range(0, len(received), 64)
+		]
+
+	def testCapture(self):
+		frames = self.capture()
+		f = io.BytesIO()
+		pg_replay.write_capture(f, frames)
+		data = f.getvalue()
+		self.failUnlessEqual(frames, pg_replay.read_capture(io.BytesIO(data)))
+		self.failUnlessEqual(
+			pg_replay.parameters(frames), {'client_encoding' : 'UTF8'}
+		)
+		self.failUnlessRaises(ValueError,
+			pg_replay.read_capture, io.BytesIO(data[:-1])
+		)
+		self.failUnlessRaises(ValueError,
+			pg_replay.read_capture, io.BytesIO(data[:3])
+		)
+		self.failUnlessRaises(ValueError,
+			pg_replay.read_capture, io.BytesIO(b'?' + data[1:])
+		)
+
+	def testRecordingSocket(self):
+		class sock(object):
+			closed = False
+			def recv(self, size):
+				return b'x' * size
+			def send(self, data):
+				return len(data) - 1
+			def close(self):
+				self.closed = True
+		class pq(object):
+			socket = sock()
+		f = io.BytesIO()
+		pg_replay.record(pq, f, {'client_encoding' : 'UTF8', 'other' : None})
+		self.failUnlessEqual(pq.socket.recv(3), b'xxx')
+		self.failUnlessEqual(pq.socket.send(b'abc'), 2)
+		pq.socket.close()
+		self.failUnless(pq.socket.socket.closed)
+		self.failUnlessEqual(pg_replay.read_capture(io.BytesIO(f.getvalue())), [
+			(pg_replay.Parameter, e3.ShowOption(b'client_encoding', b'UTF8').serialize()),
+			(pg_replay.Received, b'xxx'),
+			(pg_replay.Sent, b'ab'),
+		])
+
+	def testInstructions(self):
+		msgs = pg_replay.frontend_messages(pg_replay.sent_data(self.capture()))
+		self.failUnlessEqual(msgs[1], e3.DescribeStatement(b'statement'))
+		self.failUnlessEqual(msgs[-1], e3.DisconnectMessage)
+		groups = list(pg_replay.instructions(msgs))
+		self.failUnlessEqual(len(groups), 2)
+		self.failUnlessEqual([len(x[0]) for x in groups], [3, 3])
+		self.failUnlessEqual([x[1] for x in groups], [[], []])
+		copy = list(pg_replay.instructions([
+			e3.Query(b'COPY t FROM STDIN'),
+			e3.CopyData(b'1\n'),
+			e3.CopyData(b'2\n'),
+			e3.CopyDoneMessage,
+		]))
+		self.failUnlessEqual(copy, [
+			([e3.Query(b'COPY t FROM STDIN')], [e3.CopyData(b'1\n'), e3.CopyData(b'2\n')])
+		])
+
+	def testReplay(self):
+		xacts = pg_replay.replay(self.capture())
+		self.failUnlessEqual(len(xacts), 2)
+		for x in xacts:
+			self.failUnless(x.state is x3.Complete)
+			self.failIf(x.fatal)
+		rows = [
+			y for y in xacts[1].messages_received()
+			if type(y) is e3.Tuple
+		]
+		self.failUnlessEqual(len(rows), 100)
+
+class test_server3(unittest.TestCase):
+	def setUp(self):
+		self.server = pg_server.Server([
+			(r'FROM numbers', pg_server.synthetic(100, width = 4)),
+			(r'COPY t FROM', pg_server.CopyIn()),
+			(r'COPY t TO', pg_server.CopyOut([b'1\n', b'2\n'])),
+			(r'FROM nowhere', pg_server.Failure('42P01', 'no such relation')),
+			(r'slowly', pg_server.Command('SELECT', latency = 10)),
+		])
+		self.server.start()
+		self.pq = c3.Connection(self.server.socket_factory(), {})
+		self.pq.connect()
+
+	def tearDown(self):
+		self.pq.socket.close()
+		self.server.stop()
+
+	def run_xact(self, *commands):
+		x = x3.Instruction(commands)
+		self.pq.push(x)
+		self.pq.complete()
+		return x
+
+	def tuples(self, x):
+		return [y for y in x.messages_received() if y.type is e3.Tuple.type]
+
+	def testConnect(self):
+		self.failUnlessEqual(self.pq.xact, None)
+		self.failUnless(self.pq.backend_id in self.server.backends)
+		self.failUnlessEqual(self.pq.state, b'I')
+
+	def testQuery(self):
+		x = self.run_xact(e3.Query(b'SELECT i, t FROM numbers'))
+		self.failIf(x.fatal)
+		self.failUnlessEqual(len(self.tuples(x)), 100)
+		self.failUnlessEqual(self.tuples(x)[10], (b'10', b'xxxx'))
+		x = self.run_xact(e3.Query(b'SET foo TO bar'))
+		self.failUnlessEqual(
+			[y for y in x.messages_received() if y.type is e3.Complete.type],
+			[e3.Complete(b'SET')]
+		)
+
+	def testExtended(self):
+		x = self.run_xact(
+			e3.Parse(b's', b'SELECT i, t FROM numbers WHERE i > $1', ()),
+			e3.DescribeStatement(b's'),
+			e3.Bind(b'p', b's', (e3.StringFormat,), (b'0',), (e3.BinaryFormat,)),
+			e3.Execute(b'p', 30),
+			e3.SynchronizeMessage,
+		)
+		self.failIf(x.fatal)
+		msgs = list(x.messages_received())
+		self.failUnlessEqual(msgs[1], e3.AttributeTypes((pg_types.TEXTOID,)))
+		self.failUnlessEqual(msgs[2].keys(), [b'i', b't'])
+		tuples = self.tuples(x)
+		self.failUnlessEqual(len(tuples), 30)
+		self.failUnlessEqual(tuples[1], (b'\x00\x00\x00\x01', b'xxxx'))
+		self.failUnless(e3.SuspensionMessage in msgs)
+
+	def testDescribePortal(self):
+		# Unnamed statement and portal in a single round trip.
+		x = self.run_xact(
+			e3.Parse(b'', b'SELECT i, t FROM numbers', ()),
+			e3.Bind(b'', b'', (), (), (e3.BinaryFormat,)),
+			e3.DescribePortal(b''),
+			e3.Execute(b'', 0xFFFFFFFF),
+			e3.SynchronizeMessage,
+		)
+		self.failIf(x.fatal)
+		msgs = list(x.messages_received())
+		self.failUnlessEqual(msgs[2].keys(), [b'i', b't'])
+		self.failUnlessEqual(len(self.tuples(x)), 100)
+		# Portals without rows describe NoData.
+		x = self.run_xact(
+			e3.Parse(b'', b'SET foo TO bar', ()),
+			e3.Bind(b'', b'', (), (), (e3.BinaryFormat,)),
+			e3.DescribePortal(b''),
+			e3.Execute(b'', 0xFFFFFFFF),
+			e3.SynchronizeMessage,
+		)
+		self.failIf(x.fatal)
+		msgs = list(x.messages_received())
+		self.failUnless(e3.NoDataMessage in msgs)
+		self.failUnless(e3.Complete(b'SET') in msgs)
+
+	def testCursor(self):
+		self.run_xact(
+			e3.Query(b'DECLARE "c" CURSOR WITH HOLD FOR SELECT * FROM numbers'),
+		)
+		x = self.run_xact(e3.Query(b'MOVE ABSOLUTE 10 IN "c"'))
+		x = self.run_xact(e3.Query(b'FETCH FORWARD 5 IN "c"'))
+		self.failUnlessEqual([y[0] for y in self.tuples(x)], [
+			b'10', b'11', b'12', b'13', b'14',
+		])
+		x = self.run_xact(e3.Query(b'FETCH BACKWARD 2 IN "c"'))
+		self.failUnlessEqual([y[0] for y in self.tuples(x)], [b'13', b'12'])
+		x = self.run_xact(e3.Query(b'FETCH ALL IN "c"'))
+		self.failUnlessEqual(len(self.tuples(x)), 87)
+		self.run_xact(e3.Query(b'CLOSE "c"'))
+		x = self.run_xact(e3.Query(b'FETCH ALL IN "c"'))
+		self.failUnlessEqual(x.error_message['code'], b'34000')
+
+	def testCopy(self):
+		x = self.run_xact(e3.Query(b'COPY t TO STDOUT'))
+		self.failUnlessEqual(
+			[y for y in x.messages_received() if type(y) is bytes],
+			[b'1\n', b'2\n']
+		)
+		x = x3.Instruction((e3.Query(b'COPY t FROM STDIN'),))
+		self.pq.push(x)
+		while x.messages is not getattr(x, 'CopyFailSequence', None):
+			self.pq.step()
+		x.messages = [e3.CopyData(b'1\n2\n'), e3.CopyData(b'3\n')]
+		while x.messages is not x.CopyFailSequence:
+			self.pq.step()
+		x.messages = x.CopyDoneSequence
+		self.pq.complete()
+		self.failUnless(e3.Complete(b'COPY 3') in list(x.messages_received()))
+
+	def testFailure(self):
+		x = self.run_xact(
+			e3.Parse(b'', b'SELECT * FROM nowhere', ()),
+			e3.Bind(b'', b'', (), (), ()),
+			e3.Execute(b'', 0),
+			e3.SynchronizeMessage,
+		)
+		self.failUnlessEqual(x.error_message['code'], b'42P01')
+		self.run_xact(e3.Query(b'BEGIN'))
+		x = self.run_xact(e3.Query(b'SELECT * FROM nowhere'))
+		x = self.run_xact(e3.Query(b'SELECT * FROM numbers'))
+		self.failUnlessEqual(x.error_message['code'], b'25P02')
+		x = self.run_xact(e3.Query(b'ROLLBACK'))
+		self.failUnlessEqual(self.pq.state, b'I')
+
+	def testSavepoint(self):
+		x = self.run_xact(e3.Query(b'SAVEPOINT "s"'))
+		self.failUnlessEqual(x.error_message['code'], b'25P01')
+		self.run_xact(e3.Query(b'BEGIN'))
+		self.run_xact(e3.Query(b'SAVEPOINT "s"'))
+		self.run_xact(e3.Query(b'SELECT * FROM nowhere'))
+		self.failUnlessEqual(self.pq.state, b'E')
+		x = self.run_xact(e3.Query(b'RELEASE "s"'))
+		self.failUnlessEqual(x.error_message['code'], b'25P02')
+		x = self.run_xact(e3.Query(b'ROLLBACK TO "s"'))
+		self.failUnless(e3.Complete(b'ROLLBACK') in list(x.messages_received()))
+		self.failUnlessEqual(self.pq.state, b'T')
+		self.run_xact(e3.Query(b'RELEASE SAVEPOINT "s"'))
+		self.failUnlessEqual(self.pq.state, b'T')
+		self.run_xact(e3.Query(b'ROLLBACK'))
+		self.failUnlessEqual(self.pq.state, b'I')
+
+	def testCancel(self):
+		def interrupt():
+			time.sleep(0.2)
+			self.pq.interrupt()
+		t = Thread(target = interrupt)
+		t.start()
+		start = time.time()
+		x = self.run_xact(e3.Query(b'SELECT slowly'))
+		t.join()
+		self.failUnless(time.time() - start < 5)
+		self.failUnlessEqual(x.error_message['code'], b'57014')
+
 try:
 	from ..protocol import optimized as protocol_optimized
 
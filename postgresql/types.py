@@ -9,6 +9,8 @@ import math
 import decimal
 import datetime
 import operator
+import uuid
+import collections
 get0 = operator.itemgetter(0)
 get1 = operator.itemgetter(1)
 try:
@@ -42,6 +44,8 @@ REGCONFIGOID = 3734
 REGDICTIONARYOID = 3769
 
 XMLOID = 142
+JSONOID = 114
+JSONBOID = 3802
 
 MACADDROID = 829
 INETOID = 869
@@ -163,6 +167,8 @@ oid_to_name = {
 	REGDICTIONARYOID : 'regdictionary',
 
 	XMLOID : 'xml',
+	JSONOID : 'json',
+	JSONBOID : 'jsonb',
 
 	MACADDROID : 'macaddr',
 	INETOID : 'inet',
@@ -807,6 +813,42 @@ class Row(tuple):
 				r[i] = v(self[k])
 		return type(self).from_sequence(self.keymap, r)
 
+##
+# Row factories; given the column names, return a callable that creates a row
+# from a sequence of the column values. Used by the driver's ``row_factory``.
+def tuple_factory(attnames):
+	'rows as `tuple`'
+	return tuple
+
+def dict_factory(attnames):
+	'rows as `dict` keyed by the column names'
+	attnames = tuple(attnames)
+	def make_dict(seq, attnames = attnames):
+		return dict(zip(attnames, seq))
+	return make_dict
+
+def namedtuple_factory(attnames):
+	'rows as instances of a `collections.namedtuple` class made for the columns'
+	return collections.namedtuple('Row', attnames, rename = True)._make
+
+def dataclass_factory(attnames):
+	"""
+	rows as instances of a dataclass, using __slots__, made for the columns
+
+	Column names that are not valid identifiers are renamed as
+	`collections.namedtuple` renames them.
+	"""
+	import dataclasses
+	fields = collections.namedtuple('Row', attnames, rename = True)._fields
+	try:
+		typ = dataclasses.make_dataclass('Row', fields, slots = True)
+	except TypeError:
+		# slots are not supported by this version of dataclasses.
+		typ = dataclasses.make_dataclass('Row', fields)
+	def make_dataclass(seq, typ = typ):
+		return typ(*seq)
+	return make_dataclass
+
 # Python Representations of PostgreSQL Types
 oid_to_type = {
 	VARBITOID: varbit,
@@ -825,6 +867,7 @@ oid_to_type = {
 	NAMEOID: str,
 
 	XMLOID: etree.ElementTree,
+	UUIDOID: uuid.UUID,
 
 	# This is *not* bpchar, the SQL CHARACTER type.
 	CHAROID: bytes,